@@ -6,11 +6,37 @@ from io import BytesIO
 
 # Importazione dei moduli
 from modules.data_loader import load_data, load_multiple_files
+from modules.archive import render_archive_sidebar
+from modules.cfu_reload import apply_cfu_file_changes
+from modules.roster_reload import apply_roster_changes
+from modules.dataset_cache import bump_dataset_version, clear_dataset_version, compute_upload_fingerprint
+from modules.duplicates import DuplicateDetectionResult
+from modules.record_hashes import RECORD_HASH_COL, get_record_registry, record_lineage
+from modules.tombstones import reapply_registered_removals
 # Importazione diretta dai moduli tab invece che dal pacchetto ui
 from modules.ui.tab1 import render_tab1
 from modules.ui.tab2 import render_tab2  # Versione corretta che gestisce le colonne duplicate
 from modules.ui.tab3 import render_tab3
 from modules.ui.tab4 import render_tab4
+from modules.ui.tab5 import render_tab5
+
+# Sezioni dell'applicazione nell'ordine di visualizzazione
+VIEWS = {
+    "Analisi Dati": render_tab1,
+    "Gestione Duplicati": render_tab2,
+    "Calcolo Presenze ed Esportazione": render_tab3,
+    "Frequenza Lezioni": render_tab4,
+    "Query SQL": render_tab5,
+}
+
+# Filtri e selezioni da conservare quando la loro sezione non è visualizzata (navigazione per sezione)
+PERSISTENT_WIDGET_KEYS = [
+    "dup_groups_page_size", "dup_groups_page",
+    "filt_denom_concorso_tab3", "filt_denominazione_tab3", "search_student", "filt_stud_tab3_v8",
+    "export_source_tab3", "export_groupby_v215",
+    "activity_filter_tab4", "date_filter_tab4", "search_participant_tab4",
+    "sql_example_tab5", "sql_query_tab5",
+]
 
 # Configurazione Pagina
 st.set_page_config(
@@ -30,6 +56,8 @@ with st.sidebar:
     
     if upload_method == "File singolo":
         uploaded_file = st.file_uploader("Carica file Excel presenze", type=['xlsx'])
+        read_all_sheets = st.checkbox("Leggi tutti i fogli del file", value=False, key="read_all_sheets",
+                                      help="Combina tutti i fogli con un formato riconosciuto (es. un foglio per settimana o per corso)")
         if uploaded_file:
             st.success(f"File '{uploaded_file.name}' caricato!")
             if st.button("Mostra anteprima originale"):
@@ -63,14 +91,33 @@ with st.sidebar:
             uploaded_files = None
     
     st.divider()
+    lazy_navigation = st.checkbox("Calcola solo la sezione attiva", value=True, key="lazy_navigation",
+                                  help="Esegue solo la sezione selezionata invece di tutte le schede a ogni interazione")
     if 'processed_df' in st.session_state and st.session_state.processed_df is not None:
         st.markdown("[⬆️ Torna su](#top)", help="Clicca per tornare all'inizio della pagina principale")
+        upload_diff = st.session_state.get('upload_diff_report')
+        if upload_diff:
+            st.caption(f"Rispetto al caricamento precedente: {upload_diff['nuovi']} record nuovi, "
+                       f"{upload_diff['rimossi']} rimossi, {upload_diff['invariati']} invariati.")
+        if st.session_state.get('removal_suggestion'):
+            st.caption(f"{st.session_state.removal_suggestion} record erano stati rimossi in un caricamento precedente degli stessi file.")
+            if st.button("Rimuovi di nuovo questi record", key="reapply_removals"):
+                removed = reapply_registered_removals()
+                st.session_state.removal_suggestion = 0
+                if removed:
+                    st.session_state.duplicates_removed = True
+                    st.session_state.duplicate_detection_results = DuplicateDetectionResult()
+                    st.session_state.selected_indices_to_drop = []
+                    st.toast(f"{removed} record rimossi di nuovo (annullabile).")
+                st.rerun()
+        with st.expander("🗄️ Archivio storico (Parquet)"):
+            render_archive_sidebar(st.session_state.processed_df)
 
 # --- Gestione Stato Sessione ---
 if 'duplicates_removed' not in st.session_state: 
     st.session_state.duplicates_removed = False
 if 'duplicate_detection_results' not in st.session_state: 
-    st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+    st.session_state.duplicate_detection_results = DuplicateDetectionResult()
 if 'selected_indices_to_drop' not in st.session_state: 
     st.session_state.selected_indices_to_drop = []
 if 'report_data_to_download' not in st.session_state: 
@@ -83,29 +130,50 @@ if 'uploaded_files' in locals() and uploaded_files:
     # Ottieni una lista di nomi per il controllo di caricamento
     if upload_method == "File singolo":
         current_files_name = uploaded_file.name
-        need_reload = ('current_file_name' not in st.session_state or 
-                       st.session_state.current_file_name != current_files_name or 
-                       'processed_df' not in st.session_state)
     else:
         current_files_name = ",".join(sorted([f.name for f in uploaded_files]))
-        need_reload = ('current_file_name' not in st.session_state or 
-                       st.session_state.current_file_name != current_files_name or 
-                       'processed_df' not in st.session_state)
+    # Impronta del contenuto: calcolata una sola volta per upload e usata come chiave di cache
+    current_fingerprint = compute_upload_fingerprint(uploaded_files)
+    if upload_method == "File singolo" and read_all_sheets:
+        # La lettura di tutti i fogli produce un dataset diverso dallo stesso file
+        current_fingerprint += ':fogli'
+    need_reload = ('current_fingerprint' not in st.session_state or 
+                   st.session_state.current_fingerprint != current_fingerprint or 
+                   'processed_df' not in st.session_state)
     
     if need_reload:
         with st.spinner("Caricamento ed elaborazione dati..."): 
             if upload_method == "File singolo":
-                st.session_state.processed_df = load_data(uploaded_file)
+                st.session_state.processed_df = load_data(uploaded_file, fingerprint=current_fingerprint, all_sheets=read_all_sheets)
             else:
-                st.session_state.processed_df = load_multiple_files(uploaded_files)
+                st.session_state.processed_df = load_multiple_files(uploaded_files, fingerprint=current_fingerprint)
                 
         if st.session_state.processed_df is not None:
+            bump_dataset_version(current_fingerprint)
+            st.session_state.cfu_file_version = st.session_state.processed_df.attrs.get('cfu_file_version')
+            st.session_state.enrolled_roster_version = st.session_state.processed_df.attrs.get('enrolled_roster_version')
+            if 'processed_tombstones' in st.session_state:
+                del st.session_state.processed_tombstones
             st.session_state.current_file_name = current_files_name
+            st.session_state.current_fingerprint = current_fingerprint
             st.session_state.duplicates_removed = False
-            st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+            st.session_state.duplicate_detection_results = DuplicateDetectionResult()
             st.session_state.selected_indices_to_drop = []
             st.session_state.report_data_to_download = None
             st.session_state.report_filename_to_download = None
+            st.session_state.upload_diff_report = None
+            st.session_state.removal_suggestion = 0
+            st.session_state.record_lineage = record_lineage(
+                [f.name for f in uploaded_files], upload_method == "File singolo" and read_all_sheets
+            )
+            
+            # Confronto per impronta con il caricamento precedente degli stessi file; le rimozioni
+            # già fatte su quei record vengono solo proposte (vedi pulsante nella barra laterale)
+            if RECORD_HASH_COL in st.session_state.processed_df.columns:
+                record_hashes = st.session_state.processed_df[RECORD_HASH_COL].to_numpy()
+                registry = get_record_registry(st.session_state.record_lineage)
+                st.session_state.upload_diff_report = registry.register_upload(record_hashes)
+                st.session_state.removal_suggestion = int(registry.removed_mask(record_hashes).sum())
             
             num_files = len(uploaded_files) if upload_method == "Più file contemporaneamente" else 1
             if num_files > 1:
@@ -116,24 +184,39 @@ if 'uploaded_files' in locals() and uploaded_files:
         else:
             if 'current_file_name' in st.session_state: 
                 del st.session_state.current_file_name
+            if 'current_fingerprint' in st.session_state: 
+                del st.session_state.current_fingerprint
             if 'processed_df' in st.session_state: 
                 del st.session_state.processed_df
+            clear_dataset_version()
+            if 'processed_tombstones' in st.session_state:
+                del st.session_state.processed_tombstones
             st.session_state.duplicates_removed = False
-            st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+            st.session_state.duplicate_detection_results = DuplicateDetectionResult()
             st.session_state.selected_indices_to_drop = []
             st.session_state.report_data_to_download = None
             st.session_state.report_filename_to_download = None
 elif 'processed_df' in st.session_state:
     del st.session_state.processed_df
+    clear_dataset_version()
+    if 'processed_tombstones' in st.session_state:
+        del st.session_state.processed_tombstones
     if 'current_file_name' in st.session_state: 
         del st.session_state.current_file_name
+    if 'current_fingerprint' in st.session_state: 
+        del st.session_state.current_fingerprint
     st.session_state.duplicates_removed = False
-    st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+    st.session_state.duplicate_detection_results = DuplicateDetectionResult()
     st.session_state.selected_indices_to_drop = []
     st.session_state.report_data_to_download = None
     st.session_state.report_filename_to_download = None
     st.rerun()
 
+# Aggiornamento a caldo dei CFU e degli iscritti se crediti.csv o iscritti_*.csv sono cambiati dopo il caricamento
+if st.session_state.get('processed_df') is not None:
+    apply_cfu_file_changes()
+    apply_roster_changes()
+
 df_main = st.session_state.get('processed_df', None)
 
 # CORREZIONE ANTI-DUPLICATI - Ispezione e pulizia
@@ -148,19 +231,25 @@ if df_main is not None and isinstance(df_main, pd.DataFrame):
 
 # --- Tabs ---
 if df_main is not None and isinstance(df_main, pd.DataFrame):
-    tab1, tab2, tab3, tab4 = st.tabs(["Analisi Dati", "Gestione Duplicati", "Calcolo Presenze ed Esportazione", "Frequenza Lezioni"])
-    
-    with tab1:
-        render_tab1(df_main)
-    
-    with tab2:
-        render_tab2(df_main)
-    
-    with tab3:
-        render_tab3(df_main)
-        
-    with tab4:
-        render_tab4(df_main)
+    if lazy_navigation:
+        # Solo la sezione selezionata viene eseguita: i calcoli delle altre restano nella cache aggregati
+        for widget_key in PERSISTENT_WIDGET_KEYS:
+            if widget_key in st.session_state:
+                # Riassegnare il valore evita che Streamlit lo scarti mentre il widget non è visualizzato
+                st.session_state[widget_key] = st.session_state[widget_key]
+        view_names = list(VIEWS.keys())
+        active_view = st.segmented_control("Sezione:", view_names, default=view_names[0], key="active_view",
+                                          label_visibility="collapsed")
+        if active_view is None:
+            # Un secondo click deseleziona il controllo: si resta sull'ultima sezione visualizzata
+            active_view = st.session_state.get('last_active_view', view_names[0])
+        st.session_state.last_active_view = active_view
+        VIEWS[active_view](df_main)
+    else:
+        tabs = st.tabs(list(VIEWS.keys()))
+        for tab, render_view in zip(tabs, VIEWS.values()):
+            with tab:
+                render_view(df_main)
         
 else:
     # Messaggio iniziale se nessun file caricato
@@ -170,7 +259,8 @@ else:
     1.  **Carica file** dalla sidebar:
         * Scegli tra la modalità **File singolo** (.xlsx) o **Più file contemporaneamente** (.xlsx, .csv, .txt)
         * L'app supporta ora anche il formato con colonna "Ora di inizio" contenente data e ora
-    2.  **(Opzionale)** Vedi anteprima del file originale.
+        * Con **Leggi tutti i fogli del file** vengono combinati tutti i fogli riconosciuti (colonna `SourceSheet` con il foglio di provenienza)
+    2.  **(Opzionale)** Vedi anteprima del file originale. Con **Calcola solo la sezione attiva** (predefinito) le sezioni si scelgono dalla barra in alto e viene eseguita solo quella selezionata; disattivandolo tornano le schede classiche.
     3.  **Analisi Dati (Tab 1):** Controlla statistiche e dati elaborati.
     4.  **Gestione Duplicati (Tab 2):** Identifica e rimuovi timbrature ravvicinate.
     5.  **Calcolo Presenze ed Esportazione (Tab 3):**
@@ -189,6 +279,9 @@ else:
         *   Filtra per **Data** e/o **Attività** in modo indipendente.
         *   Consulta le **Statistiche** di frequenza (numero lezioni, media partecipanti, totale presenze).
         *   **Esporta in CSV** i dati visualizzati.
+    7.  **Query SQL (Tab 5):**
+        *   Interroga con query `SELECT` le tabelle `presenze`, `iscritti` e `crediti` (DuckDB se installato, altrimenti SQLite).
+        *   Esporta il risultato completo in **CSV** o **Excel**.
 
     ### Formati File Supportati
     #### Formato Standard
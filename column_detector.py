@@ -1,27 +1,36 @@
 # Programma per identificare i nomi delle colonne nel file Excel
-import pandas as pd
+# Legge solo la riga di intestazione e indica il formato riconosciuto (vedi modules.file_formats)
 import os
+import sys
+from modules.file_formats import detect_format, read_header
 
 def main():
     try:
-        file_path = 'Presenze - 2025_04_24.xlsx'
+        file_path = sys.argv[1] if len(sys.argv) > 1 else 'Presenze - 2025_04_24.xlsx'
         if not os.path.exists(file_path):
             print(f"File non trovato: {file_path}")
             print("Directory corrente:", os.getcwd())
             print("File nella directory corrente:", os.listdir())
             return
-            
-        # Legge il file Excel e stampa i nomi delle colonne
-        print(f"Lettura del file: {file_path}")
-        df = pd.read_excel(file_path)
+
+        # Legge solo l'intestazione del file e stampa i nomi delle colonne
+        print(f"Lettura dell'intestazione del file: {file_path}")
+        header, _ = read_header(file_path)
         print("Nomi delle colonne:")
-        print(df.columns.tolist())
-        
-        # Stampa informazioni aggiuntive
-        print(f"Numero totale di record: {len(df)}")
-        print("Prime 3 righe:")
-        print(df.head(3))
-        
+        print(header)
+
+        # Stampa il formato riconosciuto e la mappatura delle colonne
+        adapter, rename = detect_format(header)
+        if adapter is None:
+            print("Formato non riconosciuto")
+            return
+        print(f"Formato riconosciuto: {adapter.name}")
+        for source, canonical in rename.items():
+            print(f"  {source} -> {canonical}")
+        ignored = [col for col in header if col not in rename]
+        if ignored:
+            print(f"Colonne non lette: {ignored}")
+
     except Exception as e:
         print(f"Errore: {str(e)}")
 
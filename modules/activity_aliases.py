@@ -0,0 +1,146 @@
+# Tabella persistente degli alias delle attività: variante del nome -> denominazione di crediti.csv
+import difflib
+import os
+import threading
+import pandas as pd
+import streamlit as st
+from modules.utils import map_unique
+
+ALIAS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alias_attivita.csv')
+ALIAS_COLUMNS = ['Variante', 'DenominazioneAttività', 'Punteggio']
+# Similarità minima (0-1) per accettare un abbinamento approssimato attività/CFU
+ACTIVITY_SIMILARITY_THRESHOLD = 0.9
+
+def _activity_key(name):
+    """Chiave di confronto di un nome di attività (strip e minuscole)."""
+    return name.strip().lower()
+
+class ActivityAliasTable:
+    """
+    Alias delle denominazioni delle attività verso le voci di crediti.csv, salvati su file.
+    Le varianti già note si risolvono con una ricerca nel dizionario; la ricerca
+    approssimata (difflib) viene eseguita solo per i nomi mai visti, e i nuovi
+    abbinamenti vengono aggiunti al file con il relativo punteggio di similarità.
+    """
+
+    def __init__(self, path=ALIAS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._aliases = {}  # Chiave della variante -> (variante, denominazione canonica, punteggio)
+        self._misses = {}  # Chiave -> impronta dei CFU per cui la ricerca non ha trovato nulla
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            alias_df = pd.read_csv(self.path, encoding='utf-8-sig', dtype={'Variante': str, 'DenominazioneAttività': str})
+        except Exception as e:
+            st.warning(f"Impossibile leggere il file degli alias delle attività ({e}): verrà ricreato.")
+            return
+        if not all(col in alias_df.columns for col in ALIAS_COLUMNS):
+            st.warning("Il file degli alias delle attività non ha le colonne attese: verrà ricreato.")
+            return
+        for variant, canonical, score in alias_df[ALIAS_COLUMNS].itertuples(index=False):
+            if isinstance(variant, str) and isinstance(canonical, str):
+                self._aliases[_activity_key(variant)] = (variant, canonical, float(score))
+
+    def __len__(self):
+        return len(self._aliases)
+
+    def resolve(self, activity_names, cfu_data):
+        """
+        Restituisce i CFU di ogni nome di attività.
+        Un nome è risolto, in ordine, per corrispondenza esatta (senza distinzione
+        tra maiuscole e minuscole) con crediti.csv, tramite un alias già noto la cui
+        denominazione è ancora presente, oppure con la ricerca approssimata.
+
+        Args:
+            activity_names: Nomi distinti delle attività
+            cfu_data: DataFrame dei CFU (output di load_cfu_data)
+
+        Returns:
+            Tuple (dizionario {nome: CFU o None}, numero di nuovi alias registrati)
+        """
+        if cfu_data.empty:
+            return {name: None for name in activity_names}, 0
+
+        # Denominazioni canoniche in minuscolo -> (denominazione, CFU); vale la prima occorrenza
+        canonical = {}
+        for name, cfu in cfu_data[['DenominazioneAttivitaNormalizzata', 'CFU']].itertuples(index=False):
+            if isinstance(name, str):
+                canonical.setdefault(name.lower(), (name, cfu))
+        cfu_signature = hash(frozenset(canonical))
+
+        result = {}
+        added = 0
+        with self._lock:
+            for activity_name in activity_names:
+                if not isinstance(activity_name, str) or activity_name.strip() == '':
+                    result[activity_name] = None
+                    continue
+                key = _activity_key(activity_name)
+                if key in canonical:
+                    result[activity_name] = canonical[key][1]
+                    continue
+                alias = self._aliases.get(key)
+                if alias is not None and alias[1].lower() in canonical:
+                    result[activity_name] = canonical[alias[1].lower()][1]
+                    continue
+                if self._misses.get(key) == cfu_signature:
+                    result[activity_name] = None
+                    continue
+
+                # Nome mai visto (o alias verso una denominazione non più presente): ricerca approssimata
+                matches = difflib.get_close_matches(key, list(canonical), n=1, cutoff=ACTIVITY_SIMILARITY_THRESHOLD)
+                if not matches:
+                    self._misses[key] = cfu_signature
+                    result[activity_name] = None
+                    continue
+                score = difflib.SequenceMatcher(None, key, matches[0]).ratio()
+                canonical_name, cfu = canonical[matches[0]]
+                self._aliases[key] = (activity_name.strip(), canonical_name, round(score, 4))
+                self._dirty = True
+                added += 1
+                result[activity_name] = cfu
+        return result, added
+
+    def save(self):
+        """Scrive il file degli alias se sono stati registrati nuovi abbinamenti."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            alias_df = pd.DataFrame(sorted(self._aliases.values()), columns=ALIAS_COLUMNS)
+            temp_path = self.path + '.tmp'
+            alias_df.to_csv(temp_path, index=False, encoding='utf-8-sig')
+            os.replace(temp_path, self.path)
+            self._dirty = False
+            return True
+
+@st.cache_resource(show_spinner=False)
+def get_activity_aliases():
+    """Tabella degli alias delle attività, condivisa tra le sessioni del processo."""
+    return ActivityAliasTable()
+
+def match_activities_with_cfu(activities, cfu_data):
+    """
+    Abbina i CFU a una colonna di denominazioni delle attività usando la tabella degli alias.
+    Ogni nome distinto viene risolto una sola volta; i nuovi alias vengono salvati su file.
+
+    Args:
+        activities: Series con le denominazioni delle attività
+        cfu_data: DataFrame dei CFU (output di load_cfu_data)
+
+    Returns:
+        Series dei CFU con lo stesso indice di `activities`
+    """
+    aliases = get_activity_aliases()
+    resolved, added = aliases.resolve(activities.dropna().unique(), cfu_data)
+    if added:
+        try:
+            aliases.save()
+            st.info(f"Registrati {added} nuovi alias di attività (totale {len(aliases)}).")
+        except OSError as e:
+            st.warning(f"Impossibile salvare il file degli alias delle attività: {e}")
+    return map_unique(activities, resolved.get)
@@ -0,0 +1,147 @@
+# Archivio storico delle presenze elaborate in formato Parquet, partizionato per anno e mese di DataPresenza
+import os
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    ARCHIVE_AVAILABLE = True
+except ImportError:
+    ARCHIVE_AVAILABLE = False
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archivio_presenze')
+PARTITION_COLS = ['Anno', 'Mese']
+
+def _prepare_for_parquet(df):
+    """
+    Prepara il DataFrame per la scrittura: aggiunge le colonne di partizione
+    Anno e Mese e converte in stringa le colonne object con tipi misti
+    (date e orari omogenei vengono scritti come date32 e time64).
+    """
+    dates = pd.to_datetime(df['DataPresenza'], errors='coerce')
+    prepared = df[dates.notna()].copy()
+    dates = dates[dates.notna()]
+    prepared['DataPresenza'] = dates.dt.date
+    prepared['Anno'] = dates.dt.year.astype('int32')
+    prepared['Mese'] = dates.dt.month.astype('int32')
+    for col in prepared.columns:
+        if prepared[col].dtype == object and col != 'DataPresenza':
+            types = set(type(v) for v in prepared[col].dropna())
+            if len(types) > 1:
+                prepared[col] = prepared[col].map(lambda v: None if pd.isna(v) else str(v))
+    return prepared
+
+def write_archive(df, archive_dir=ARCHIVE_DIR):
+    """
+    Scrive le presenze elaborate nell'archivio Parquet, partizionato per Anno e Mese
+    di DataPresenza. I mesi presenti in `df` sostituiscono interamente quelli già
+    archiviati; gli altri mesi restano invariati.
+
+    Args:
+        df: DataFrame elaborato (output di load_multiple_files, eventualmente ripulito dai duplicati)
+        archive_dir: Cartella radice dell'archivio
+
+    Returns:
+        Lista ordinata dei mesi (anno, mese) scritti
+    """
+    if not ARCHIVE_AVAILABLE:
+        raise ImportError("pyarrow non è installato: archivio Parquet non disponibile.")
+    if df is None or df.empty or 'DataPresenza' not in df.columns:
+        return []
+
+    prepared = _prepare_for_parquet(df)
+    if prepared.empty:
+        return []
+    table = pa.Table.from_pandas(prepared, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=archive_dir,
+        partition_cols=PARTITION_COLS,
+        existing_data_behavior='delete_matching'
+    )
+    return sorted(set(zip(prepared['Anno'].tolist(), prepared['Mese'].tolist())))
+
+def archived_months(archive_dir=ARCHIVE_DIR):
+    """
+    Restituisce i mesi presenti nell'archivio leggendo solo i nomi delle cartelle di partizione.
+
+    Returns:
+        Lista ordinata di tuple (anno, mese)
+    """
+    months = []
+    if not os.path.isdir(archive_dir):
+        return months
+    for year_dir in os.listdir(archive_dir):
+        if not year_dir.startswith('Anno='):
+            continue
+        for month_dir in os.listdir(os.path.join(archive_dir, year_dir)):
+            if month_dir.startswith('Mese='):
+                try:
+                    months.append((int(year_dir[5:]), int(month_dir[5:])))
+                except ValueError:
+                    continue
+    return sorted(months)
+
+def _date_filter(start_date=None, end_date=None):
+    """
+    Costruisce il filtro per l'intervallo di date: le condizioni su Anno e Mese
+    escludono le partizioni non necessarie, quella su DataPresenza le righe
+    ai bordi dell'intervallo.
+    """
+    expr = None
+    if start_date is not None:
+        year, month = start_date.year, start_date.month
+        partition = (ds.field('Anno') > year) | ((ds.field('Anno') == year) & (ds.field('Mese') >= month))
+        expr = partition & (ds.field('DataPresenza') >= pa.scalar(start_date, pa.date32()))
+    if end_date is not None:
+        year, month = end_date.year, end_date.month
+        partition = (ds.field('Anno') < year) | ((ds.field('Anno') == year) & (ds.field('Mese') <= month))
+        end_expr = partition & (ds.field('DataPresenza') <= pa.scalar(end_date, pa.date32()))
+        expr = end_expr if expr is None else expr & end_expr
+    return expr
+
+def load_archive(start_date=None, end_date=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Carica dall'archivio le presenze di un intervallo di date, leggendo solo
+    le partizioni (anno/mese) necessarie.
+
+    Args:
+        start_date: Data iniziale inclusa (None per nessun limite)
+        end_date: Data finale inclusa (None per nessun limite)
+        columns: Colonne da leggere (tutte se None)
+        archive_dir: Cartella radice dell'archivio
+
+    Returns:
+        DataFrame con le presenze dell'intervallo (vuoto se l'archivio non esiste)
+    """
+    if not ARCHIVE_AVAILABLE or not archived_months(archive_dir):
+        return pd.DataFrame()
+    dataset = ds.dataset(archive_dir, format='parquet', partitioning='hive')
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    table = dataset.to_table(columns=columns, filter=_date_filter(start_date, end_date))
+    df = table.to_pandas()
+    return df.drop(columns=[c for c in PARTITION_COLS if c in df.columns])
+
+def render_archive_sidebar(df):
+    """Mostra nella sidebar il pulsante per archiviare i dati elaborati correnti."""
+    if not ARCHIVE_AVAILABLE:
+        st.caption("Archivio Parquet non disponibile (installa `pyarrow`).")
+        return
+    st.caption("I mesi presenti nei dati correnti sostituiscono quelli già archiviati.")
+    if st.button("💾 Archivia dati elaborati (Parquet)", key="write_parquet_archive", disabled=df is None or df.empty):
+        try:
+            with st.spinner("Scrittura archivio..."):
+                months = write_archive(df)
+            if months:
+                st.success(f"Archiviati {len(months)} mesi: " + ", ".join(f"{m:02d}/{y}" for y, m in months))
+            else:
+                st.warning("Nessun record con DataPresenza valida da archiviare.")
+        except Exception as e:
+            st.error(f"Errore durante la scrittura dell'archivio: {e}")
+    months = archived_months()
+    if months:
+        first, last = months[0], months[-1]
+        st.caption(f"Archivio: {len(months)} mesi, da {first[1]:02d}/{first[0]} a {last[1]:02d}/{last[0]}")
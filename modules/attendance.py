@@ -1,6 +1,44 @@
 # Funzioni per il calcolo delle presenze e delle frequenze
 import pandas as pd
 import streamlit as st
+from modules.dataset_cache import memoize_aggregate
+from modules.filter_index import FilterIndex
+
+def _attendance_group_cols(group_by, cf_column, percorso_chiave_col, percorso_elab_col):
+    """Colonne di raggruppamento di calculate_attendance per il criterio indicato (None se non valido)."""
+    if group_by == "studente":
+        # Raggruppa per studente e percorso
+        return [cf_column, percorso_chiave_col]
+    if group_by == "percorso_originale":
+        # Raggruppa solo per percorso originale
+        return [percorso_chiave_col]
+    if group_by == "percorso_elaborato":
+        # Raggruppa solo per percorso elaborato
+        return [percorso_elab_col]
+    if group_by == "percorso_iscritti":
+        # Raggruppa per percorso degli iscritti ('Percorso' dal CSV degli iscritti)
+        return [percorso_chiave_col]
+    if group_by == "lista_studenti":
+        # Lista degli studenti senza raggruppare per percorso
+        return [cf_column]
+    return None
+
+def _attendance_rename_map(group_by, percorso_chiave_col, percorso_elab_col, original_col):
+    """Nomi delle colonne nel risultato di calculate_attendance per il criterio indicato."""
+    if group_by == "studente" or group_by == "lista_studenti":
+        return {
+            percorso_chiave_col: 'Percorso (Senza Art.13)', 
+            percorso_elab_col: 'Percorso Elaborato (Info)', 
+            original_col: 'Percorso Originale Input (Info)'
+        }
+    if group_by == "percorso_originale":
+        return {percorso_chiave_col: 'Percorso (Senza Art.13)'}
+    if group_by == "percorso_elaborato":
+        return {percorso_elab_col: 'Percorso Elaborato'}
+    if group_by == "percorso_iscritti":
+        # Se stiamo raggruppando per la colonna Percorso degli iscritti
+        return {percorso_chiave_col: 'Tipo Percorso Iscritti'}
+    return {}
 
 def calculate_attendance(df, cf_column='CodiceFiscale', percorso_chiave_col='DenominazioneAttività', 
                          percorso_elab_col='Percorso', original_col='DenominazioneAttività', group_by="studente"):
@@ -38,33 +76,13 @@ def calculate_attendance(df, cf_column='CodiceFiscale', percorso_chiave_col='Den
         return pd.DataFrame()
     
     # Definisci i gruppi in base al criterio selezionato
-    if group_by == "studente":
-        # Raggruppa per studente e percorso
-        group_cols = [cf_column, percorso_chiave_col]
-    elif group_by == "percorso_originale":
-        # Raggruppa solo per percorso originale
-        group_cols = [percorso_chiave_col]
-        if percorso_chiave_col not in df.columns:
-            st.error(f"Impossibile procedere: colonna {percorso_chiave_col} mancante")
-            return pd.DataFrame()
-    elif group_by == "percorso_elaborato":
-        # Raggruppa solo per percorso elaborato
-        group_cols = [percorso_elab_col]
-        if percorso_elab_col not in df.columns:
-            st.error(f"Impossibile procedere: colonna {percorso_elab_col} mancante")
-            return pd.DataFrame()
-    elif group_by == "percorso_iscritti":
-        # Raggruppa per percorso degli iscritti
-        group_cols = [percorso_chiave_col]  # percorso_chiave_col qui sarà 'Percorso' dal CSV degli iscritti
-        if percorso_chiave_col not in df.columns:
-            st.error(f"Impossibile procedere: colonna {percorso_chiave_col} mancante")
-            return pd.DataFrame()
-    elif group_by == "lista_studenti":
-        # Lista degli studenti senza raggruppare per percorso
-        group_cols = [cf_column]
-    else:
+    group_cols = _attendance_group_cols(group_by, cf_column, percorso_chiave_col, percorso_elab_col)
+    if group_cols is None:
         st.error(f"Criterio di raggruppamento non valido: {group_by}")
         return pd.DataFrame()
+    if group_by in ("percorso_originale", "percorso_elaborato", "percorso_iscritti") and group_cols[0] not in df.columns:
+        st.error(f"Impossibile procedere: colonna {group_cols[0]} mancante")
+        return pd.DataFrame()
     
     # Separa i CFU dalle altre colonne per poterli sommare
     cfu_column = 'CFU'
@@ -106,25 +124,7 @@ def calculate_attendance(df, cf_column='CodiceFiscale', percorso_chiave_col='Den
             attendance = attendance.drop(columns=['CFU'])
     
     # Rinomina le colonne in base al raggruppamento
-    if group_by == "studente" or group_by == "lista_studenti":
-        rename_map = {
-            percorso_chiave_col: 'Percorso (Senza Art.13)', 
-            percorso_elab_col: 'Percorso Elaborato (Info)', 
-            original_col: 'Percorso Originale Input (Info)'
-        }
-    elif group_by == "percorso_originale":
-        rename_map = {
-            percorso_chiave_col: 'Percorso (Senza Art.13)'
-        }
-    elif group_by == "percorso_elaborato":
-        rename_map = {
-            percorso_elab_col: 'Percorso Elaborato'
-        }
-    elif group_by == "percorso_iscritti":
-        # Se stiamo raggruppando per la colonna Percorso degli iscritti
-        rename_map = {
-            percorso_chiave_col: 'Tipo Percorso Iscritti'
-        }
+    rename_map = _attendance_rename_map(group_by, percorso_chiave_col, percorso_elab_col, original_col)
     
     attendance = attendance.rename(columns={k: v for k, v in rename_map.items() if k in attendance.columns})
     
@@ -163,6 +163,42 @@ def calculate_attendance(df, cf_column='CodiceFiscale', percorso_chiave_col='Den
     
     return attendance
 
+def update_attendance_cfu(attendance, df, positions, previous_cfu, cf_column='CodiceFiscale',
+                          percorso_chiave_col='DenominazioneAttività', percorso_elab_col='Percorso',
+                          original_col='DenominazioneAttività', group_by="studente"):
+    """
+    Aggiorna 'CFU Totali' di un risultato di calculate_attendance dopo che sono cambiati
+    i CFU di alcune righe: si sommano le sole differenze delle righe modificate nei
+    rispettivi gruppi, senza ricalcolare l'aggregazione.
+
+    Args:
+        attendance: Risultato di calculate_attendance sul DataFrame prima della modifica
+        df: DataFrame con i CFU aggiornati (stesse righe, nello stesso ordine)
+        positions: Posizioni delle righe di `df` con i CFU modificati
+        previous_cfu: CFU precedenti delle stesse righe
+        (gli altri argomenti sono quelli passati a calculate_attendance)
+
+    Returns:
+        DataFrame aggiornato, o None se il risultato va ricalcolato da capo
+    """
+    group_cols = _attendance_group_cols(group_by, cf_column, percorso_chiave_col, percorso_elab_col)
+    if group_cols is None or attendance is None or 'CFU Totali' not in attendance.columns:
+        return None
+    rename_map = _attendance_rename_map(group_by, percorso_chiave_col, percorso_elab_col, original_col)
+    key_cols = [rename_map.get(col, col) for col in group_cols]
+    if not all(col in df.columns for col in group_cols) or not all(col in attendance.columns for col in key_cols):
+        return None
+
+    changed = df.iloc[positions]
+    delta = (pd.to_numeric(changed['CFU'], errors='coerce').fillna(0).to_numpy()
+             - pd.to_numeric(pd.Series(previous_cfu), errors='coerce').fillna(0).to_numpy())
+    deltas = changed[group_cols].assign(DeltaCFU=delta).groupby(group_cols, dropna=False)['DeltaCFU'].sum().reset_index()
+    deltas.columns = key_cols + ['DeltaCFU']
+
+    updated = attendance.merge(deltas, on=key_cols, how='left')
+    updated['CFU Totali'] = updated['CFU Totali'] + updated['DeltaCFU'].fillna(0)
+    return updated.drop(columns=['DeltaCFU'])
+
 def calculate_lesson_attendance(df, date_filter=None, activity_filter=None, cf_column='CodiceFiscale', 
                                date_col='DataPresenza', activity_col='DenominazioneAttivitaNormalizzataInternal'):
     """
@@ -212,3 +248,11 @@ def calculate_lesson_attendance(df, date_filter=None, activity_filter=None, cf_c
         attendance_counts = attendance_counts.sort_values(by=[date_col, activity_col])
     
     return attendance_counts
+
+# Colonne filtrabili delle presenze aggregate
+AGG_FILTER_COLUMNS = ('Codice_classe_di_concorso_e_denominazione', 'CodiceFiscale')
+
+def build_attendance_filter_index(df, group_by):
+    """Costruisce l'indice dei filtri sulle presenze aggregate (memoizzato per versione del dataset)"""
+    attendance_df = memoize_aggregate(calculate_attendance, df, group_by=group_by)
+    return FilterIndex(attendance_df, AGG_FILTER_COLUMNS)
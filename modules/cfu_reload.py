@@ -0,0 +1,113 @@
+# Aggiornamento a caldo dei CFU quando il file crediti.csv viene modificato
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.activity_aliases import match_activities_with_cfu
+from modules.attendance import (
+    build_attendance_filter_index, calculate_attendance, calculate_lesson_attendance, update_attendance_cfu
+)
+from modules.data_loader import cfu_file_version, load_cfu_data
+from modules.dataset_cache import aggregate_name, carry_over_aggregates
+from modules.duplicates import detect_duplicate_records
+from modules.filter_index import build_filter_index, sorted_positions
+from modules.search_index import build_student_search_index
+from modules.tombstones import publish_patched_dataset
+
+CFU_COLUMN = 'CFU'
+ACTIVITY_COLUMN = 'DenominazioneAttività'
+
+def cfu_changes(df, cfu_data):
+    """
+    Confronta i CFU attuali di ogni attività distinta con quelli del file dei CFU.
+
+    Args:
+        df: DataFrame elaborato con le colonne DenominazioneAttività e CFU
+        cfu_data: DataFrame dei CFU (output di load_cfu_data)
+
+    Returns:
+        Dizionario {attività: nuovo CFU} delle sole attività il cui CFU è cambiato
+    """
+    current = df.groupby(ACTIVITY_COLUMN, sort=False, observed=True)[CFU_COLUMN].first()
+    activities = pd.Series(current.index, dtype=object)
+    updated = match_activities_with_cfu(activities, cfu_data)
+    old_values = pd.to_numeric(current, errors='coerce').to_numpy()
+    new_values = pd.to_numeric(updated, errors='coerce').to_numpy()
+    unchanged = (old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values))
+    return dict(zip(activities[~unchanged], updated[~unchanged]))
+
+def patch_cfu_column(df, changes):
+    """Sostituisce i CFU delle sole righe delle attività modificate."""
+    positions = _changed_positions(df, changes)
+    new_cfu = pd.to_numeric(df[CFU_COLUMN], errors='coerce')
+    new_cfu.iloc[positions] = pd.to_numeric(df[ACTIVITY_COLUMN].iloc[positions].map(changes), errors='coerce').to_numpy()
+    return df.assign(**{CFU_COLUMN: new_cfu})
+
+def _changed_positions(df, changes):
+    """Posizioni delle righe delle attività modificate."""
+    return np.flatnonzero(df[ACTIVITY_COLUMN].isin(list(changes)).to_numpy())
+
+def _aggregate_updater(df, positions, previous):
+    """
+    Regole per riportare gli aggregati memoizzati dopo la modifica dei CFU:
+    quelli che non leggono la colonna CFU restano validi, le presenze aggregate
+    vengono corrette per differenza, gli altri vengono ricalcolati.
+    """
+    cfu_independent = {
+        aggregate_name(calculate_lesson_attendance),
+        aggregate_name(build_student_search_index),
+        aggregate_name(build_attendance_filter_index),
+    }
+
+    def updater(name, result, params):
+        if name in cfu_independent:
+            return result
+        if name == aggregate_name(build_filter_index):
+            return result if CFU_COLUMN not in params.get('columns', ()) else None
+        if name == aggregate_name(sorted_positions):
+            return result if params.get('sort_col') != CFU_COLUMN else None
+        if name == aggregate_name(detect_duplicate_records):
+            return result if params.get('compact') else None
+        if name == aggregate_name(calculate_attendance):
+            return update_attendance_cfu(result, df, positions, previous, **params)
+        return None
+
+    return updater
+
+def apply_cfu_file_changes():
+    """
+    Se crediti.csv è stato modificato dopo il caricamento dei dati della sessione,
+    aggiorna la colonna CFU solo per le attività il cui CFU è cambiato, senza
+    rileggere i file delle presenze, e riporta sulla nuova versione del dataset
+    gli aggregati memoizzati che restano validi.
+
+    Returns:
+        Numero di attività con CFU aggiornato (0 se non è cambiato nulla)
+    """
+    df = st.session_state.get('processed_df')
+    loaded_version = st.session_state.get('cfu_file_version')
+    current_version = cfu_file_version()
+    if df is None or current_version is None or current_version == loaded_version:
+        return 0
+    st.session_state.cfu_file_version = current_version
+    if CFU_COLUMN not in df.columns or ACTIVITY_COLUMN not in df.columns:
+        return 0
+    cfu_data = load_cfu_data()
+    if cfu_data.empty:
+        return 0
+
+    # Con rimozioni in corso si confronta il DataFrame base, che contiene tutte le righe
+    tombstones = st.session_state.get('processed_tombstones')
+    if tombstones is not None and tombstones.view() is not df:
+        tombstones = None
+    changes = cfu_changes(tombstones.base if tombstones is not None else df, cfu_data)
+    if not changes:
+        st.info("File dei CFU modificato: nessun CFU delle attività caricate è cambiato.")
+        return 0
+
+    positions = _changed_positions(df, changes)
+    previous = df[CFU_COLUMN].iloc[positions]
+    previous_version = publish_patched_dataset(lambda data: patch_cfu_column(data, changes))
+    new_df = st.session_state.processed_df
+    carry_over_aggregates(previous_version, _aggregate_updater(new_df, positions, previous))
+    st.info(f"File dei CFU modificato: CFU aggiornati per {len(changes)} attività ({len(positions)} record).")
+    return len(changes)
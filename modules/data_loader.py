@@ -1,60 +1,62 @@
 # Funzioni per il caricamento e la trasformazione dei dati
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta, date, time
 import unicodedata  # Per la normalizzazione dei caratteri Unicode
-import difflib
 import re
 import os  # Aggiunto per verificare l'esistenza dei file
-from modules.utils import normalize_name_advanced  # Importo la funzione di normalizzazione avanzata
+from modules.utils import (  # Normalizzazioni condivise, applicate una volta per valore distinto con map_unique
+    map_unique, normalize_generic, normalize_name_advanced,
+    parse_datetime_column, describe_date_formats, DATE_FORMATS, DATETIME_FORMATS, MONTH_FIRST_DATE_FORMATS
+)
+from modules.dataset_cache import compute_upload_fingerprint, MAX_SHARED_DATASETS
+from modules.search_index import FuzzyNameMatcher
+from modules.enrollment_snapshots import KEY_COL, find_enrolled_dir, get_enrollment_snapshots
+from modules.activity_aliases import match_activities_with_cfu
+from modules.record_hashes import RECORD_HASH_COL, compute_record_hashes
+from modules.file_formats import detect_format, read_header, read_with_format, read_workbook_sheets
 
-def normalize_generic(name):
-    """Rimuove 'art.13' e spazi dalle stringhe"""
-    if not isinstance(name, str): return name
-    normalized = re.sub(r'\s*\(?art\.?\s*13\.?\)?.*$', '', name, flags=re.IGNORECASE)
-    return normalized.strip()
-    
-def reposition_code_to_front(text):
-    """Prende il testo, estrae il codice tra parentesi e lo riposiziona all'inizio della stringa."""
-    if not isinstance(text, str): return text
-    match = re.search(r'\(([-\w]+)\)', text)  # Cerca codice alfanumerico con trattini tra parentesi
-    if match:
-        code = match.group(1).strip()
-        # Rimuovi il codice con le parentesi dal testo originale
-        cleaned_text = re.sub(r'\s*\(' + re.escape(code) + r'\)\s*', ' ', text).strip()
-        # Restituisci il codice all'inizio seguito dal testo pulito
-        return f"[{code}] {cleaned_text}"
-    return text
-    
-def transform_by_codice_percorso(codice, default_name):
-    """Trasforma il percorso in base al codice"""
-    if pd.isna(codice): return default_name
-    codice_str = str(codice).strip()
-    if len(codice_str) < 3: return default_name
-    prefix = codice_str[:3]
-    if prefix == '600': return "PeF60 All. 1"
-    elif prefix == '300': return "PeF30 All. 2"
-    elif prefix == '360': return "PeF36 All. 5"
-    elif prefix == '200': return "PeF30 art. 13"
-    else: return default_name
+# Similarità minima (0-1) per accettare un abbinamento approssimato nome/cognome con gli iscritti
+FUZZY_MATCH_THRESHOLD = 0.85
+
+def find_cfu_file():
+    """Restituisce il percorso del file 'crediti.csv' (assoluto o, in alternativa, relativo), o None."""
+    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    file_path = os.path.join(base_path, 'crediti.csv')
+    if os.path.exists(file_path):
+        return file_path
+    return 'crediti.csv' if os.path.exists('crediti.csv') else None
+
+def cfu_file_version():
+    """Versione del file dei CFU (data di ultima modifica), o None se il file non esiste."""
+    file_path = find_cfu_file()
+    try:
+        return os.path.getmtime(file_path) if file_path else None
+    except OSError:
+        return None
 
-@st.cache_data
 def load_cfu_data():
-    """Carica i dati dei CFU dal file 'crediti.csv'."""
+    """
+    Carica i dati dei CFU dal file 'crediti.csv'.
+    La cache è indicizzata sulla data di modifica del file: se il file viene
+    modificato, la chiamata successiva lo rilegge senza riavviare il server.
+    """
+    file_path = find_cfu_file()
+    if file_path is None:
+        st.error("File dei CFU 'crediti.csv' non trovato né al path assoluto né al path relativo")
+        return pd.DataFrame()
+    file_version = cfu_file_version()
+    cfu_df = _load_cfu_file(file_path, file_version)
+    if cfu_df.empty:
+        # Una lettura fallita (es. file in fase di scrittura) non resta in cache
+        _load_cfu_file.clear(file_path, file_version)
+    return cfu_df
+
+@st.cache_data(max_entries=4)
+def _load_cfu_file(file_path, file_version):
+    """Legge e normalizza il file dei CFU (memoizzata su percorso e data di modifica)."""
     try:
-        # Provo prima con il percorso assoluto
-        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        file_path = os.path.join(base_path, 'crediti.csv')
-        
-        # Controllo se il file esiste al path assoluto
-        if not os.path.exists(file_path):
-            st.warning(f"File dei CFU non trovato al path assoluto: {file_path}")
-            # Provo con un path relativo come fallback
-            file_path = 'crediti.csv'
-            if not os.path.exists(file_path):
-                st.error(f"File dei CFU non trovato nemmeno al path relativo: {file_path}")
-                return pd.DataFrame()
-        
         st.info(f"Caricamento dati CFU da: {os.path.abspath(file_path)}")
         
         # Carica il CSV con vari encoding come fallback
@@ -74,47 +76,47 @@ def load_cfu_data():
         st.info(f"File CFU caricato: {cfu_df.shape[0]} righe, {cfu_df.shape[1]} colonne")
         
         # Normalizza i nomi delle attività per facilitare il matching
-        cfu_df['DenominazioneAttivitaNormalizzata'] = cfu_df['DenominazioneAttività'].apply(lambda x: x.strip() if isinstance(x, str) else x)
+        cfu_df['DenominazioneAttivitaNormalizzata'] = map_unique(cfu_df['DenominazioneAttività'], lambda x: x.strip() if isinstance(x, str) else x)
+        cfu_df.attrs['file_version'] = file_version
         return cfu_df
     except Exception as e:
         st.error(f"Errore durante il caricamento del file dei CFU: {e}")
         return pd.DataFrame()
 
-def match_activity_with_cfu(activity_name, cfu_data):
-    """Abbina un'attività con il suo CFU dal dataset dei CFU.
-    Gestisce differenze minori nei nomi delle attività, ignorando maiuscole/minuscole."""
-    if not isinstance(activity_name, str) or activity_name.strip() == '' or cfu_data.empty:
-        return None
-    
-    # Normalizza il nome dell'attività (strip e lowercase)
-    normalized_activity = activity_name.strip().lower()
-    
-    # Confronto case-insensitive
-    for idx, row in cfu_data.iterrows():
-        if row['DenominazioneAttivitaNormalizzata'].lower() == normalized_activity:
-            return row['CFU']
-    
-    # Se non trova un match esatto case-insensitive, cerca il più simile
-    similarity_threshold = 0.9  # Soglia di similarità (90%)
-    activities = cfu_data['DenominazioneAttivitaNormalizzata'].tolist()
-    activities_lower = [act.lower() for act in activities if isinstance(act, str)]
-    
-    # Usa difflib per trovare il match più simile (case-insensitive)
-    matches = difflib.get_close_matches(normalized_activity, activities_lower, n=1, cutoff=similarity_threshold)
-    if matches:
-        closest_match_lower = matches[0]
-        # Trova l'indice corrispondente nell'array originale
-        for idx, act in enumerate(activities):
-            if isinstance(act, str) and act.lower() == closest_match_lower:
-                return cfu_data.iloc[idx]['CFU']
-    
-    return None
+def load_data(uploaded_file, fingerprint=None, all_sheets=False):
+    """
+    Carica e preprocessa i dati dal file Excel caricato.
+    La cache è indicizzata sull'impronta del contenuto del file, calcolata una
+    sola volta al caricamento: il file non viene ri-hashato a ogni chiamata.
 
-@st.cache_data
-@st.cache_data
-def load_data(uploaded_file):
-    """Carica e preprocessa i dati dal file Excel caricato"""
+    Args:
+        uploaded_file: File caricato dall'utente
+        fingerprint: Impronta del file (calcolata se non indicata)
+        all_sheets: Se True legge e combina tutti i fogli riconosciuti della cartella di lavoro
+            (colonna di provenienza SourceSheet), altrimenti solo il primo foglio
+    """
     if uploaded_file is None: return None
+    if fingerprint is None:
+        fingerprint = compute_upload_fingerprint([uploaded_file])
+    df = _load_data_cached(fingerprint, all_sheets, uploaded_file)
+    if df is None:
+        # Un caricamento fallito non resta in cache: il prossimo caricamento dello stesso file riprova
+        _load_data_cached.clear(fingerprint, all_sheets, uploaded_file)
+    return df
+
+def _split_sheet_datetime(df, adapter):
+    """Separa in DataPresenza e OraPresenza il campo data/ora del formato di un foglio, se previsto."""
+    if adapter.datetime_field and adapter.datetime_field in df.columns:
+        return process_datetime_field(df, adapter.datetime_field)
+    return df
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_SHARED_DATASETS)
+def _load_data_cached(fingerprint, all_sheets, _uploaded_file):
+    """
+    Implementazione di load_data memoizzata sull'impronta (il file, con prefisso '_', non viene hashato).
+    Il DataFrame è condiviso da tutte le sessioni che caricano lo stesso file e va trattato in sola lettura.
+    """
+    uploaded_file = _uploaded_file
     try:
         st.info("Inizializzazione caricamento dati...")
         
@@ -134,9 +136,31 @@ def load_data(uploaded_file):
         else:
             st.success(f"Dati iscritti caricati con successo: {len(enrolled_students)} iscritti trovati.")
         
-        st.info("Caricamento file Excel...")
-        df = pd.read_excel(uploaded_file)
-        st.success(f"File Excel caricato con successo: {len(df)} record trovati.")
+        if all_sheets:
+            st.info("Caricamento di tutti i fogli del file Excel...")
+            # Il campo data/ora di ogni foglio è separato secondo il suo formato prima di combinare i fogli
+            df, sheet_report = read_workbook_sheets(uploaded_file, prepare_sheet=_split_sheet_datetime)
+            for sheet_name, format_name, rows in sheet_report:
+                if format_name is None:
+                    st.warning(f"Foglio '{sheet_name}': formato non riconosciuto, ignorato")
+                else:
+                    st.info(f"Foglio '{sheet_name}': formato '{format_name}', {rows} record")
+            if df is None:
+                st.error("Nessun foglio del file ha un formato riconosciuto.")
+                return None
+            st.success(f"Combinati {df['SourceSheet'].cat.categories.size} fogli: {len(df)} record trovati.")
+        else:
+            st.info("Caricamento file Excel...")
+            # Formato riconosciuto dall'intestazione tramite il registro dei formati (vedi modules.file_formats)
+            header, read_options = read_header(uploaded_file)
+            adapter, rename = detect_format(header)
+            if adapter is None:
+                st.warning("Formato del file non riconosciuto: le colonne vengono lette senza rinomina.")
+                df = pd.read_excel(uploaded_file)
+            else:
+                st.info(f"Formato '{adapter.name}' riconosciuto, {len(rename)} colonne riconosciute su {len(header)}")
+                df = _split_sheet_datetime(read_with_format(uploaded_file, adapter, rename, read_options), adapter)
+            st.success(f"File Excel caricato con successo: {len(df)} record trovati.")
 
         original_columns = df.columns.tolist()
 
@@ -189,6 +213,9 @@ def load_data(uploaded_file):
         if 'recapito_ateneo' in df.columns:
             df['Email'] = df['recapito_ateneo']
             st.success("Email caricate dalla colonna 'recapito_ateneo'")
+        elif 'Email' in df.columns:
+            # Con il registro dei formati 'recapito_ateneo' è già rinominata in 'Email'
+            st.success("Email caricate dalla colonna 'Email'")
         else:
             st.warning("Colonna 'recapito_ateneo' per le email non trovata nel file. Le email non saranno disponibili.")
             df['Email'] = ''
@@ -202,12 +229,12 @@ def load_data(uploaded_file):
             
         activity_col_norm_internal = 'DenominazioneAttivitaNormalizzataInternal'
         if 'DenominazioneAttività' in df.columns: 
-            df[activity_col_norm_internal] = df['DenominazioneAttività'].apply(normalize_generic)
+            df[activity_col_norm_internal] = map_unique(df['DenominazioneAttività'], normalize_generic)
             
             # Aggiungi colonna CFU abbinando le attività
             if not cfu_data.empty:
                 st.info("Abbinamento dei CFU alle attività in corso...")
-                df['CFU'] = df['DenominazioneAttività'].apply(lambda x: match_activity_with_cfu(x, cfu_data))
+                df['CFU'] = match_activities_with_cfu(df['DenominazioneAttività'], cfu_data)
                 # Conta quante attività non hanno trovato un match per i CFU
                 missing_cfu = df['CFU'].isna().sum()
                 total_activities = len(df)
@@ -218,8 +245,11 @@ def load_data(uploaded_file):
                 
         # Gestione delle date e orari
         try: 
-            # Specifichiamo esplicitamente dayfirst=True per il formato dd.mm.yyyy
-            df['DataPresenza'] = pd.to_datetime(df['DataPresenza'], errors='coerce', dayfirst=True).dt.date
+            # Formato dedotto sulla colonna (giorno prima del mese, es. dd.mm.yyyy), non valore per valore
+            parsed_dates, date_formats = parse_datetime_column(df['DataPresenza'], DATE_FORMATS, dayfirst=True)
+            df['DataPresenza'] = parsed_dates.dt.date
+            if len(date_formats) > 1:
+                st.info(f"Formati di 'DataPresenza' rilevati: {describe_date_formats(date_formats)}")
             df.loc[pd.isna(df['DataPresenza']), 'DataPresenza'] = pd.NaT
         except Exception as e: 
             st.warning(f"Problema conversione 'DataPresenza': {e}.")
@@ -315,6 +345,8 @@ def load_data(uploaded_file):
             final_cols.append('CodicePercorso')
         if 'CFU' in df.columns and 'CFU' not in final_cols:
             final_cols.append('CFU')  # Aggiungi la colonna CFU all'elenco delle colonne da mantenere
+        if 'SourceSheet' in df.columns:
+            final_cols.append('SourceSheet')
         
         # Integra i dati degli iscritti se disponibili
         if not enrolled_students.empty:
@@ -378,8 +410,9 @@ def load_data(uploaded_file):
                     st.error("ATTENZIONE: Nessuna colonna degli iscritti è stata integrata nei dati!")
                 
         # Aggiungo le nuove colonne degli iscritti alla lista di colonne da mantenere
+        # (ChiaveIscritto serve all'aggiornamento incrementale quando cambia l'elenco degli iscritti)
         new_cols = ['Percorso', 'Codice_Classe_di_concorso', 'Codice_classe_di_concorso_e_denominazione', 
-                    'Dipartimento', 'LogonName', 'Matricola']
+                    'Dipartimento', 'LogonName', 'Matricola', KEY_COL]
         for col in new_cols:
             if col in df.columns and col not in final_cols:
                 final_cols.append(col)
@@ -394,6 +427,12 @@ def load_data(uploaded_file):
         df_final = df[cols_to_keep].copy()
         # Rimuovi eventuali colonne duplicate dal DataFrame finale (può succedere dopo merge/concat)
         df_final = df_final.loc[:, ~df_final.columns.duplicated()]
+        # Versione di crediti.csv usata per i CFU (per l'aggiornamento a caldo, vedi modules.cfu_reload)
+        df_final.attrs['cfu_file_version'] = cfu_data.attrs.get('file_version')
+        # Versione dell'elenco degli iscritti usata per l'integrazione (vedi modules.roster_reload)
+        df_final.attrs['enrolled_roster_version'] = get_enrollment_snapshots().version
+        # Impronta stabile di ogni record (identificativo tra un caricamento e l'altro)
+        df_final[RECORD_HASH_COL] = compute_record_hashes(df_final)
         return df_final
         
     except Exception as e: 
@@ -401,63 +440,34 @@ def load_data(uploaded_file):
         st.exception(e)
         return None
 
-@st.cache_data(ttl=1) # Disabilitiamo quasi completamente la cache per il debug
 def load_enrolled_students_data():
-    """Carica i dati degli studenti iscritti dal file CSV."""
+    """
+    Carica gli studenti iscritti dalle istantanee iscritti_*.csv (vedi modules.enrollment_snapshots).
+    Le istantanee nuove vengono acquisite come differenze rispetto a quelle già lette.
+
+    Returns:
+        DataFrame con l'ultima istantanea più gli iscritti non più presenti (ultima versione nota),
+        con la colonna ChiaveIscritto per le ricerche per data
+    """
     try:
-        # Costruisco il path con varie possibilità per robustezza
-        # Percorso 1: Dalla directory di root del progetto
-        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        file_path = os.path.join(base_path, 'modules', 'dati', 'iscritti_05_maggio.csv')
-        
-        # Verifica se il file esiste
-        if not os.path.exists(file_path):
-            st.warning(f"File degli iscritti non trovato al path: {file_path}")
-            
-            # Percorso 2: Considerando che __file__ potrebbe già essere in modules/
-            file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dati', 'iscritti_05_maggio.csv')
-            
-            if not os.path.exists(file_path):
-                st.warning(f"File degli iscritti non trovato al path alternativo: {file_path}")
-                
-                # Percorso 3: Path relativo come ultima risorsa
-                file_path = 'modules/dati/iscritti_05_maggio.csv'
-                
-                if not os.path.exists(file_path):
-                    st.error(f"File degli iscritti non trovato in nessun percorso! Ultimo tentativo: {file_path}")
-                    # Prima di rinunciare, cerca nella directory corrente
-                    import glob
-                    csv_files = glob.glob('**/*.csv', recursive=True)
-                    st.error(f"File CSV disponibili nella directory: {csv_files}")
-                    return pd.DataFrame()
-        
-        # Stampiamo informazioni di debug
-        st.info(f"Caricamento dati iscritti da: {os.path.abspath(file_path)}")
-        
-        # Carica il CSV con delimitatore punto e virgola e vari encoding come fallback
-        try:
-            enrolled_df = pd.read_csv(file_path, delimiter=';', encoding='utf-8-sig')
-        except UnicodeDecodeError:
-            try:
-                enrolled_df = pd.read_csv(file_path, delimiter=';', encoding='utf-8')
-            except UnicodeDecodeError:
-                enrolled_df = pd.read_csv(file_path, delimiter=';', encoding='latin-1')
-        
-        # Stampa informazioni sul dataframe caricato
-        st.info(f"File iscritti caricato: {enrolled_df.shape[0]} righe, {enrolled_df.shape[1]} colonne")
-        st.info(f"Colonne disponibili: {', '.join(enrolled_df.columns.tolist())}")
-        
-        # Verifico che ci siano le colonne necessarie
-        required_cols = ['Cognome', 'Nome', 'CodiceFiscale', 'Codice_Classe_di_concorso']
-        if not all(col in enrolled_df.columns for col in required_cols):
-            missing_cols = [col for col in required_cols if col not in enrolled_df.columns]
-            st.error(f"File degli iscritti: colonne richieste mancanti ({', '.join(missing_cols)})")
+        enrolled_dir = find_enrolled_dir()
+        if enrolled_dir is None:
+            st.error("Cartella dei file iscritti (modules/dati) non trovata!")
             return pd.DataFrame()
-        
-        # Pulisco i dati
-        if 'CodiceFiscale' in enrolled_df.columns:
-            enrolled_df['CodiceFiscale'] = enrolled_df['CodiceFiscale'].astype(str).str.strip()
-        
+
+        snapshots = get_enrollment_snapshots()
+        for file_name, stats in snapshots.refresh(enrolled_dir):
+            st.info(f"Istantanea iscritti acquisita: {file_name} "
+                    f"(nuovi: {stats['nuovi']}, modificati: {stats['modificati']}, rimossi: {stats['rimossi']})")
+        if not snapshots.snapshots:
+            st.error(f"Nessun file iscritti_*.csv trovato in {os.path.abspath(enrolled_dir)}")
+            return pd.DataFrame()
+
+        enrolled_df = snapshots.roster()
+        first, last = snapshots.snapshots[0][0], snapshots.snapshots[-1][0]
+        st.info(f"Iscritti: {len(snapshots.snapshots)} istantanee dal {first:%d/%m/%Y} al {last:%d/%m/%Y}, "
+                f"{len(enrolled_df)} iscritti, {len(snapshots.records)} versioni")
+
         # Creo una colonna di identificazione per facilitare il matching
         enrolled_df['NomeCognome'] = enrolled_df['Nome'].str.lower() + ' ' + enrolled_df['Cognome'].str.lower()
         
@@ -466,12 +476,161 @@ def load_enrolled_students_data():
         st.error(f"Errore durante il caricamento del file degli iscritti: {e}")
         return pd.DataFrame()
 
+def _student_key(series, mode='upper'):
+    """Normalizza una colonna identificativa per il join (stringa ripulita, vuoti come NaN)."""
+    keys = series.astype('string').str.strip()
+    keys = keys.str.upper() if mode == 'upper' else keys.str.lower()
+    return keys.mask(keys == '')
+
+def _resolve_by_key(match_pos, match_method, keys, enrolled_keys, tier_name):
+    """
+    Abbina le righe ancora non risolte tramite una tabella hash chiave -> posizione
+    dell'iscritto (in caso di chiavi ripetute vale il primo iscritto, come nel matching per nome).
+    Modifica sul posto `match_pos` e `match_method`.
+    """
+    lookup = pd.Series(range(len(enrolled_keys)), index=enrolled_keys.to_numpy())
+    lookup = lookup[lookup.index.notna()]
+    lookup = lookup[~lookup.index.duplicated(keep='first')]
+    unresolved = (match_pos < 0) & keys.notna()
+    if not unresolved.any() or lookup.empty:
+        return
+    positions = keys[unresolved].map(lookup).dropna()
+    match_pos.loc[positions.index] = positions.astype(int)
+    match_method.loc[positions.index] = tier_name
+
+def resolve_student_matches(df, df_enrolled, try_inverted=False):
+    """
+    Risolve lo studente iscritto corrispondente a ogni riga delle presenze, a livelli:
+    1. CodiceFiscale, 2. Email (minuscolo), 3. LogonName (parte locale dell'email),
+    4. Nome e cognome normalizzati (anche invertiti se `try_inverted`), 5. nome approssimato.
+    Ogni livello considera solo le righe non risolte dai precedenti; i primi quattro sono
+    join vettoriali su tabelle hash costruite dagli iscritti.
+
+    Args:
+        df: DataFrame presenze con le colonne 'Nome_norm' e 'Cognome_norm'
+        df_enrolled: DataFrame iscritti con le colonne 'Nome_norm' e 'Cognome_norm'
+        try_inverted: Se provare anche nome e cognome invertiti
+
+    Returns:
+        Tuple di Series allineate a df: (posizione dell'iscritto in df_enrolled o -1,
+        metodo di abbinamento, punteggio di abbinamento)
+    """
+    match_pos = pd.Series(-1, index=df.index, dtype='int64')
+    match_method = pd.Series('Nessuna Corrispondenza', index=df.index, dtype=object)
+
+    # 1-3. Identificativi già presenti nelle presenze
+    if 'CodiceFiscale' in df.columns and 'CodiceFiscale' in df_enrolled.columns:
+        _resolve_by_key(match_pos, match_method, _student_key(df['CodiceFiscale']),
+                        _student_key(df_enrolled['CodiceFiscale']), 'CodiceFiscale')
+    if 'Email' in df.columns and 'Email' in df_enrolled.columns:
+        presence_email = _student_key(df['Email'], mode='lower')
+        _resolve_by_key(match_pos, match_method, presence_email,
+                        _student_key(df_enrolled['Email'], mode='lower'), 'Email')
+        if 'LogonName' in df_enrolled.columns:
+            presence_logon = _student_key(df['LogonName'], mode='lower') if 'LogonName' in df.columns else presence_email.str.split('@').str[0]
+            _resolve_by_key(match_pos, match_method, presence_logon,
+                            _student_key(df_enrolled['LogonName'], mode='lower'), 'LogonName')
+
+    # 4. Nome e cognome normalizzati
+    presence_names = df['Nome_norm'] + '|' + df['Cognome_norm']
+    enrolled_names = df_enrolled['Nome_norm'] + '|' + df_enrolled['Cognome_norm']
+    _resolve_by_key(match_pos, match_method, presence_names, enrolled_names, 'Standard')
+    if try_inverted:
+        _resolve_by_key(match_pos, match_method, df['Cognome_norm'] + '|' + df['Nome_norm'],
+                        enrolled_names, 'NomeCognomeInvertiti')
+
+    match_score = pd.Series(float('nan'), index=df.index)
+    match_score.loc[match_pos >= 0] = 1.0
+
+    # 5. Abbinamento approssimato per i nomi rimasti senza corrispondenza (es. errori di battitura):
+    # candidati da un indice di trigrammi sugli iscritti, una sola ricerca per ogni coppia nome/cognome distinta
+    unmatched_mask = match_pos < 0
+    if unmatched_mask.any():
+        matcher = FuzzyNameMatcher((df_enrolled['Nome_norm'] + ' ' + df_enrolled['Cognome_norm']).tolist(),
+                                   min_score=FUZZY_MATCH_THRESHOLD)
+        fuzzy_positions = {}
+        fuzzy_scores = {}
+        unmatched_names = df.loc[unmatched_mask, ['Nome_norm', 'Cognome_norm']].drop_duplicates()
+        for nome_norm, cognome_norm in unmatched_names.itertuples(index=False):
+            pos, score = matcher.match(f"{nome_norm} {cognome_norm}")
+            if pos is None and try_inverted:
+                pos, score = matcher.match(f"{cognome_norm} {nome_norm}")
+            if pos is not None:
+                fuzzy_positions[f"{nome_norm}|{cognome_norm}"] = pos
+                fuzzy_scores[f"{nome_norm}|{cognome_norm}"] = round(score, 3)
+        fuzzy_rows = df.index[unmatched_mask & presence_names.isin(fuzzy_positions)]
+        if len(fuzzy_rows) > 0:
+            match_pos.loc[fuzzy_rows] = presence_names[fuzzy_rows].map(fuzzy_positions).astype(int)
+            match_method.loc[fuzzy_rows] = 'Approssimato'
+            match_score.loc[fuzzy_rows] = presence_names[fuzzy_rows].map(fuzzy_scores)
+
+    return match_pos, match_method, match_score
+
+def _enrolled_merge_columns(df_enrolled):
+    """Colonne integrate dal file degli iscritti: sempre CF ed Email, poi quelle disponibili."""
+    base_cols = ['CodiceFiscale', 'Email'] # Questi sono sempre da prendere dagli iscritti
+    other_cols = ['Percorso', 'Codice_Classe_di_concorso', 'Codice_classe_di_concorso_e_denominazione', 
+                 'Dipartimento', 'LogonName', 'Matricola']
+    
+    # Assicurarsi che le matricole nel file iscritti siano stringhe
+    if 'Matricola' in df_enrolled.columns:
+        df_enrolled['Matricola'] = df_enrolled['Matricola'].fillna('').astype(str)
+    
+    # Filtra per includere solo colonne esistenti nel dataframe iscritti
+    return base_cols + [col for col in other_cols if col in df_enrolled.columns]
+
+def _count_inverted_names(result_df, df_enrolled, test_count=20):
+    """
+    Test preliminare sui primi record: conta quanti trovano un iscritto solo
+    scambiando nome e cognome (colonne 'Nome_norm' e 'Cognome_norm').
+    """
+    inverted_matches = 0
+    for nome_norm, cognome_norm in result_df[['Nome_norm', 'Cognome_norm']].head(test_count).itertuples(index=False):
+        # Cerco corrispondenza con nomi invertiti (nome<->cognome)
+        inverted_match = df_enrolled[(df_enrolled['Nome_norm'] == cognome_norm) & 
+                                    (df_enrolled['Cognome_norm'] == nome_norm)]
+        if not inverted_match.empty:
+            inverted_matches += 1
+    return inverted_matches
+
+def _integrate_enrolled_values(result_df, rows, enrolled_rows, cols_to_merge):
+    """
+    Scrive sul posto in `result_df`, per le righe `rows`, i dati degli iscritti
+    abbinati (`enrolled_rows`, nello stesso ordine) e la loro ChiaveIscritto.
+    Con più istantanee degli iscritti gli attributi sono quelli validi alla DataPresenza di ogni riga.
+
+    Returns:
+        True se gli attributi sono stati allineati alla data di presenza
+    """
+    enrolled_values = enrolled_rows.set_index(rows)
+    as_of = False
+    if KEY_COL in enrolled_rows.columns:
+        result_df.loc[rows, KEY_COL] = enrolled_rows[KEY_COL].to_numpy()
+        snapshots = get_enrollment_snapshots()
+        if 'DataPresenza' in result_df.columns and len(snapshots.snapshots) > 1:
+            enrolled_values = snapshots.attributes_as_of(
+                enrolled_values[KEY_COL], result_df.loc[rows, 'DataPresenza'], cols_to_merge
+            )
+            as_of = True
+
+    for col in cols_to_merge:
+        values = enrolled_values[col]
+        if col in result_df.columns:
+            values = values.fillna(result_df.loc[rows, col])
+            # Colonne numeriche nelle presenze (es. ID usato come CodiceFiscale) ricevono testo dagli iscritti
+            if not (pd.api.types.is_object_dtype(result_df[col]) or pd.api.types.is_string_dtype(result_df[col])):
+                result_df[col] = result_df[col].astype(object)
+        result_df.loc[rows, col] = values
+    return as_of
+
 def match_students_data(df_presences, df_enrolled):
     """
     Integra i dati degli studenti iscritti nel dataframe delle presenze.
-    L'accoppiamento avviene esclusivamente per nome e cognome, considerando che possono essere
-    scritti con diverse capitalizzazioni. Il codice fiscale e l'email vengono presi dal file 
-    degli iscritti.
+    L'accoppiamento avviene a livelli (vedi resolve_student_matches): prima per CodiceFiscale,
+    email e LogonName se presenti nelle presenze, poi per nome e cognome normalizzati
+    (anche invertiti) e infine per nome approssimato. Il codice fiscale e l'email vengono
+    presi dal file degli iscritti; con più istantanee degli iscritti gli attributi
+    integrati sono quelli validi alla DataPresenza di ogni riga.
     
     Args:
         df_presences: DataFrame con i dati delle presenze
@@ -523,110 +682,52 @@ def match_students_data(df_presences, df_enrolled):
         # Utilizzo la funzione di normalizzazione avanzata per nomi e cognomi
         
         # Preparo colonne normalizzate per il matching utilizzando la funzione avanzata
-        result_df['Nome_norm'] = result_df['Nome'].apply(normalize_name_advanced)
-        result_df['Cognome_norm'] = result_df['Cognome'].apply(normalize_name_advanced)
-        df_enrolled['Nome_norm'] = df_enrolled['Nome'].apply(normalize_name_advanced)
-        df_enrolled['Cognome_norm'] = df_enrolled['Cognome'].apply(normalize_name_advanced)
+        result_df['Nome_norm'] = map_unique(result_df['Nome'], normalize_name_advanced)
+        result_df['Cognome_norm'] = map_unique(result_df['Cognome'], normalize_name_advanced)
+        df_enrolled['Nome_norm'] = map_unique(df_enrolled['Nome'], normalize_name_advanced)
+        df_enrolled['Cognome_norm'] = map_unique(df_enrolled['Cognome'], normalize_name_advanced)
         
         # Salvo anche le versioni originali prima della normalizzazione per confronto
         result_df['Nome_originale'] = result_df['Nome']
         result_df['Cognome_originale'] = result_df['Cognome']
     
         # Colonne da integrare dal file degli iscritti, inclusi sempre CF ed Email
-        base_cols = ['CodiceFiscale', 'Email'] # Questi sono sempre da prendere dagli iscritti
-        other_cols = ['Percorso', 'Codice_Classe_di_concorso', 'Codice_classe_di_concorso_e_denominazione', 
-                     'Dipartimento', 'LogonName', 'Matricola']
-        
-        # Assicurarsi che le matricole nel file iscritti siano stringhe
-        if 'Matricola' in df_enrolled.columns:
-            df_enrolled['Matricola'] = df_enrolled['Matricola'].fillna('').astype(str)
-        
-        # Filtra per includere solo colonne esistenti nel dataframe iscritti
-        available_other_cols = [col for col in other_cols if col in df_enrolled.columns]
-        cols_to_merge = base_cols + available_other_cols
-    
-        # Contatore per statistiche
-        matched_count = 0
+        cols_to_merge = _enrolled_merge_columns(df_enrolled)
     
         # Flag per tracciare se i nomi sembrano essere invertiti
         names_seem_inverted = False
-        test_count = min(20, len(result_df))  # Controlliamo al massimo 20 record
-        inverted_matches = 0
-        
-        # Test preliminare sui primi record per verificare se i nomi sono invertiti
-        for idx, row in result_df.head(test_count).iterrows():
-            # Provo con il matching invertito (nome<->cognome)
-            cognome_test = row['Nome_norm'] 
-            nome_test = row['Cognome_norm']
-            
-            # Cerco corrispondenza con nomi invertiti
-            inverted_match = df_enrolled[(df_enrolled['Nome_norm'] == nome_test) & 
-                                        (df_enrolled['Cognome_norm'] == cognome_test)]
-            
-            if not inverted_match.empty:
-                inverted_matches += 1
+        inverted_matches = _count_inverted_names(result_df, df_enrolled)
         
         # Se troviamo più match invertiti che normali, probabilmente i nomi sono invertiti
         if inverted_matches > 0:
             st.warning(f"Rilevati {inverted_matches} possibili match con nome e cognome invertiti. Proverò entrambe le combinazioni.")
             names_seem_inverted = True
             
-        # Creo colonne per tracciare il metodo di matching e cambiamenti nella normalizzazione
-        result_df['MatchMethod'] = 'Nessuna Corrispondenza'
-        result_df['NomeDiversoDaOriginale'] = False
-        result_df['CognomeDiversoDaOriginale'] = False
-        
-        # Statistiche di normalizzazione
-        nomi_normalizzati = 0
-        cognomi_normalizzati = 0
+        # Colonne diagnostiche sulla normalizzazione (vettoriali)
+        result_df['NomeDiversoDaOriginale'] = result_df['Nome_norm'] != result_df['Nome_originale'].astype(str).str.lower().str.strip()
+        result_df['CognomeDiversoDaOriginale'] = result_df['Cognome_norm'] != result_df['Cognome_originale'].astype(str).str.lower().str.strip()
 
-        # Eseguo il matching per nome e cognome normalizzati
-        for idx, row in result_df.iterrows():
-            nome_norm = row['Nome_norm'] 
-            cognome_norm = row['Cognome_norm']
-            nome_originale = row['Nome_originale']
-            cognome_originale = row['Cognome_originale']
-            
-            # Verifica se la normalizzazione ha cambiato il valore
-            if nome_norm != nome_originale.lower().strip():
-                result_df.loc[idx, 'NomeDiversoDaOriginale'] = True
-                nomi_normalizzati += 1
-                
-            if cognome_norm != cognome_originale.lower().strip():
-                result_df.loc[idx, 'CognomeDiversoDaOriginale'] = True
-                cognomi_normalizzati += 1
-                
-            # Tento prima il match normale
-            matches = df_enrolled[(df_enrolled['Nome_norm'] == nome_norm) & 
-                                 (df_enrolled['Cognome_norm'] == cognome_norm)]
-            
-            match_method = 'Standard'
-            
-            # Se non trovo match e il test preliminare suggerisce nomi invertiti, provo invertendo
-            if matches.empty and names_seem_inverted:
-                inverted_matches = df_enrolled[(df_enrolled['Nome_norm'] == cognome_norm) & 
-                                             (df_enrolled['Cognome_norm'] == nome_norm)]
-                                     
-                if not inverted_matches.empty:
-                    matches = inverted_matches
-                    match_method = 'NomeCognomeInvertiti'
-            
-            if not matches.empty:
-                # Se trovo corrispondenza, integro tutti i dati richiesti
-                match_row = matches.iloc[0]  # Prendo il primo match in caso di più corrispondenze
-                
-                # Registro il metodo di matching utilizzato
-                result_df.loc[idx, 'MatchMethod'] = match_method
-                
-                # Salvo i dati dello studente corrispondente per confronto
-                result_df.loc[idx, 'NomeIscritto'] = match_row['Nome']
-                result_df.loc[idx, 'CognomeIscritto'] = match_row['Cognome']
-                
-                for col in cols_to_merge:
-                    if col in df_enrolled.columns and pd.notna(match_row[col]):
-                        result_df.loc[idx, col] = match_row[col]
-                
-                matched_count += 1
+        # Risoluzione a livelli: identificativi (CF, email, LogonName) e poi nome e cognome
+        match_pos, match_method, match_score = resolve_student_matches(result_df, df_enrolled, names_seem_inverted)
+
+        # Integrazione dei dati degli iscritti per le righe abbinate, in un'unica assegnazione per colonna
+        result_df['MatchMethod'] = match_method
+        result_df['MatchScore'] = match_score
+        matched_rows = result_df.index[match_pos >= 0]
+        matched_count = len(matched_rows)
+        if matched_count > 0:
+            enrolled_rows = df_enrolled.iloc[match_pos[matched_rows].to_numpy()]
+            result_df.loc[matched_rows, 'NomeIscritto'] = enrolled_rows['Nome'].to_numpy()
+            result_df.loc[matched_rows, 'CognomeIscritto'] = enrolled_rows['Cognome'].to_numpy()
+            if _integrate_enrolled_values(result_df, matched_rows, enrolled_rows, cols_to_merge):
+                st.info(f"Attributi degli iscritti allineati alla data di presenza su {len(get_enrollment_snapshots().snapshots)} istantanee.")
+
+        method_counts = match_method.value_counts()
+        id_matches = {tier: int(method_counts.get(tier, 0)) for tier in ['CodiceFiscale', 'Email', 'LogonName']}
+        if sum(id_matches.values()) > 0:
+            st.info("Abbinamento per identificativo: " + ", ".join(f"{tier}: {count}" for tier, count in id_matches.items()))
+        if method_counts.get('Approssimato', 0) > 0:
+            st.info(f"Abbinamento approssimato: {int(method_counts['Approssimato'])} record abbinati con similarità ≥ {FUZZY_MATCH_THRESHOLD}")
     
         # Mostro statistiche sul matching
         total_records = len(result_df)
@@ -644,6 +745,7 @@ def match_students_data(df_presences, df_enrolled):
         # Statistiche sul metodo di matching
         match_standard = result_df[result_df['MatchMethod'] == 'Standard'].shape[0] if 'MatchMethod' in result_df.columns else 0
         match_invertiti = result_df[result_df['MatchMethod'] == 'NomeCognomeInvertiti'].shape[0] if 'MatchMethod' in result_df.columns else 0
+        match_approssimati = result_df[result_df['MatchMethod'] == 'Approssimato'].shape[0] if 'MatchMethod' in result_df.columns else 0
         
         # Verifica dell'efficacia del matching
         if matched_count == 0:
@@ -695,7 +797,7 @@ def match_students_data(df_presences, df_enrolled):
                 
         else:
             match_percentage = (matched_count / total_records) * 100
-            st.success(f"Matching Nome-Cognome: {matched_count}/{total_records} record abbinati ({match_percentage:.1f}%)")
+            st.success(f"Matching studenti: {matched_count}/{total_records} record abbinati ({match_percentage:.1f}%)")
             
             # Dettagli integrazione
             st.info(f"Colonne integrate dai dati iscritti:")
@@ -713,6 +815,7 @@ def match_students_data(df_presences, df_enrolled):
             st.info("Metodi di matching utilizzati:")
             st.info(f"- Match standard: {match_standard}/{matched_count} ({match_standard/matched_count*100 if matched_count > 0 else 0:.1f}%)")
             st.info(f"- Match con nome/cognome invertiti: {match_invertiti}/{matched_count} ({match_invertiti/matched_count*100 if matched_count > 0 else 0:.1f}%)")
+            st.info(f"- Match approssimati: {match_approssimati}/{matched_count} ({match_approssimati/matched_count*100 if matched_count > 0 else 0:.1f}%)")
             
             # Mostrare alcuni esempi di normalizzazione
             if nome_norm_count > 0 or cognome_norm_count > 0:
@@ -765,7 +868,103 @@ def match_students_data(df_presences, df_enrolled):
             
         return df_presences
 
-@st.cache_data
+def changed_roster_keys(previous_roster, roster, columns):
+    """
+    Confronta due elenchi degli iscritti per ChiaveIscritto.
+
+    Args:
+        previous_roster: Elenco usato per l'integrazione precedente
+        roster: Elenco corrente
+        columns: Colonne degli iscritti da confrontare
+
+    Returns:
+        Tuple (insieme delle chiavi modificate o rimosse, numero di chiavi nuove)
+    """
+    cols = [col for col in columns if col in previous_roster.columns and col in roster.columns]
+    previous = previous_roster.set_index(KEY_COL)[cols].fillna('').astype(str)
+    current = roster.set_index(KEY_COL)[cols].fillna('').astype(str)
+    common = current.index.intersection(previous.index)
+    differs = (current.loc[common] != previous.loc[common]).any(axis=1).to_numpy()
+    changed = set(common[differs]) | set(previous.index.difference(current.index))
+    return changed, len(current.index.difference(previous.index))
+
+def rematch_students_incremental(df, df_enrolled, previous_roster=None):
+    """
+    Aggiorna l'integrazione con gli iscritti di un DataFrame già elaborato dopo un
+    cambio dell'elenco degli iscritti, senza ricaricare le presenze: gli attributi
+    vengono riscritti solo per le righe abbinate a iscritti modificati, e il
+    matching (resolve_student_matches) viene rieseguito solo per le righe rimaste
+    senza corrispondenza o il cui iscritto non è più nell'elenco.
+
+    Args:
+        df: DataFrame elaborato con la colonna ChiaveIscritto
+        df_enrolled: Elenco corrente degli iscritti (output di load_enrolled_students_data)
+        previous_roster: Elenco usato per l'integrazione di `df`; se None tutte le righe
+            abbinate vengono aggiornate
+
+    Returns:
+        Tuple (DataFrame aggiornato, dizionario con il numero di righe aggiornate,
+        riesaminate e abbinate)
+    """
+    stats = {'aggiornate': 0, 'riesaminate': 0, 'abbinate': 0}
+    if df.empty or df_enrolled.empty or KEY_COL not in df_enrolled.columns:
+        return df, stats
+
+    result_df = df.copy()
+    cols_to_merge = _enrolled_merge_columns(df_enrolled)
+    if KEY_COL not in result_df.columns:
+        result_df[KEY_COL] = pd.Series(pd.NA, index=result_df.index, dtype=object)
+    keys = result_df[KEY_COL]
+
+    if previous_roster is not None and KEY_COL in previous_roster.columns:
+        changed_keys, added_keys = changed_roster_keys(previous_roster, df_enrolled, cols_to_merge + ['Nome', 'Cognome'])
+        refresh = keys.isin(changed_keys)
+        roster_changed = bool(changed_keys) or added_keys > 0
+    else:
+        refresh = keys.notna()
+        roster_changed = True
+
+    # 1. Righe abbinate a iscritti modificati: nuovi attributi per la stessa chiave
+    lookup = pd.Series(np.arange(len(df_enrolled)), index=df_enrolled[KEY_COL].to_numpy())
+    positions = keys[refresh].map(lookup)
+    found = positions.notna().to_numpy()
+    refreshed_rows = positions.index[found]
+    if len(refreshed_rows) > 0:
+        enrolled_rows = df_enrolled.iloc[positions[found].astype(int).to_numpy()]
+        _integrate_enrolled_values(result_df, refreshed_rows, enrolled_rows, cols_to_merge)
+    lost_rows = positions.index[~found]
+    if len(lost_rows) > 0:
+        result_df.loc[lost_rows, KEY_COL] = pd.NA
+    stats['aggiornate'] = len(refreshed_rows)
+
+    # 2. Righe senza corrispondenza: nuovo matching solo se l'elenco può offrire nuovi abbinamenti
+    unmatched_rows = result_df.index[result_df[KEY_COL].isna().to_numpy()]
+    if len(unmatched_rows) > 0 and roster_changed:
+        subset = result_df.loc[unmatched_rows, [col for col in ['CodiceFiscale', 'Email', 'LogonName', 'Nome', 'Cognome']
+                                               if col in result_df.columns]].copy()
+        subset['Nome_norm'] = map_unique(subset['Nome'], normalize_name_advanced)
+        subset['Cognome_norm'] = map_unique(subset['Cognome'], normalize_name_advanced)
+        enrolled = df_enrolled.copy()
+        enrolled['Nome_norm'] = map_unique(enrolled['Nome'], normalize_name_advanced)
+        enrolled['Cognome_norm'] = map_unique(enrolled['Cognome'], normalize_name_advanced)
+        match_pos, match_method, match_score = resolve_student_matches(
+            subset, enrolled, _count_inverted_names(subset, enrolled) > 0
+        )
+        new_rows = match_pos.index[(match_pos >= 0).to_numpy()]
+        if len(new_rows) > 0:
+            enrolled_rows = enrolled.iloc[match_pos[new_rows].to_numpy()]
+            for col, source in [('NomeIscritto', 'Nome'), ('CognomeIscritto', 'Cognome')]:
+                if col in result_df.columns:
+                    result_df.loc[new_rows, col] = enrolled_rows[source].to_numpy()
+            if 'MatchMethod' in result_df.columns:
+                result_df.loc[new_rows, 'MatchMethod'] = match_method[new_rows]
+            if 'MatchScore' in result_df.columns:
+                result_df.loc[new_rows, 'MatchScore'] = match_score[new_rows]
+            _integrate_enrolled_values(result_df, new_rows, enrolled_rows, cols_to_merge)
+        stats['riesaminate'] = len(unmatched_rows)
+        stats['abbinate'] = len(new_rows)
+    return result_df, stats
+
 def process_datetime_field(df, field_name):
     """
     Processa un campo contenente data e ora nel formato '4/29/25 18:10:26'
@@ -785,8 +984,9 @@ def process_datetime_field(df, field_name):
     result_df = df.copy()
     
     try:
-        # Converti il campo in datetime
-        result_df['timestamp_temp'] = pd.to_datetime(result_df[field_name], errors='coerce')
+        # Converti il campo in datetime con il formato dedotto da un campione della colonna
+        result_df['timestamp_temp'], datetime_formats = parse_datetime_column(result_df[field_name], DATETIME_FORMATS)
+        st.info(f"Formati del campo {field_name} rilevati: {describe_date_formats(datetime_formats)}")
         
         # Estrai data e ora
         result_df['DataPresenza'] = result_df['timestamp_temp'].dt.date
@@ -809,13 +1009,46 @@ def process_datetime_field(df, field_name):
         st.error(f"Errore durante la conversione del campo {field_name}: {e}")
         return df
 
-@st.cache_data
-def load_multiple_files(uploaded_files):
+def concat_without_cross_file_duplicates(dataframes, source_names):
+    """
+    Unisce i DataFrame dei singoli file eliminando i record identici (stessi valori
+    in tutte le colonne) già presenti in un file precedente, come accade con
+    esportazioni settimanali su periodi sovrapposti. Il confronto avviene sull'impronta
+    vettoriale di ogni riga; i duplicati interni a uno stesso file restano invariati
+    e sono gestiti dal rilevamento dei duplicati.
+
+    Args:
+        dataframes: Lista dei DataFrame dei file, nell'ordine di caricamento
+        source_names: Nomi dei file corrispondenti
+
+    Returns:
+        Tuple (DataFrame combinato, lista di (nome file, record rimossi) dei soli file con rimozioni)
+    """
+    combined_df = pd.concat(dataframes, ignore_index=True)
+    if len(dataframes) < 2 or combined_df.empty:
+        return combined_df, []
+
+    source = np.repeat(np.arange(len(dataframes)), [len(df) for df in dataframes])
+    row_hashes = pd.util.hash_pandas_object(combined_df, index=False).to_numpy()
+    # Un record è un duplicato tra file se la stessa riga compare in un file precedente
+    first_source = pd.Series(source).groupby(row_hashes, sort=False).transform('min').to_numpy()
+    cross_file = source > first_source
+    if not cross_file.any():
+        return combined_df, []
+
+    removed = np.bincount(source[cross_file], minlength=len(dataframes))
+    removed_per_file = [(name, int(count)) for name, count in zip(source_names, removed) if count]
+    return combined_df.loc[~cross_file].reset_index(drop=True), removed_per_file
+
+def load_multiple_files(uploaded_files, fingerprint=None):
     """
-    Carica e preprocessa i dati da più file Excel/CSV caricati
+    Carica e preprocessa i dati da più file Excel/CSV caricati.
+    La cache è indicizzata sull'impronta complessiva dei file invece che
+    sul loro contenuto completo.
     
     Args:
         uploaded_files: Lista di file caricati dall'utente
+        fingerprint: Impronta complessiva dei file (calcolata se non indicata)
     
     Returns:
         DataFrame combinato con i dati di tutti i file
@@ -823,8 +1056,24 @@ def load_multiple_files(uploaded_files):
     if not uploaded_files:
         st.error("Nessun file caricato")
         return None
+    if fingerprint is None:
+        fingerprint = compute_upload_fingerprint(uploaded_files)
+    combined_df = _load_multiple_files_cached(fingerprint, uploaded_files)
+    if combined_df is None:
+        # Un caricamento fallito non resta in cache: il prossimo caricamento degli stessi file riprova
+        _load_multiple_files_cached.clear(fingerprint, uploaded_files)
+    return combined_df
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_SHARED_DATASETS)
+def _load_multiple_files_cached(fingerprint, _uploaded_files):
+    """
+    Implementazione di load_multiple_files memoizzata sull'impronta (i file non vengono hashati).
+    Il DataFrame è condiviso da tutte le sessioni che caricano gli stessi file e va trattato in sola lettura.
+    """
+    uploaded_files = _uploaded_files
         
     all_dataframes = []
+    source_names = []
     processed_files = 0
     failed_files = 0
     
@@ -832,112 +1081,30 @@ def load_multiple_files(uploaded_files):
         try:
             # Determina il tipo di file
             file_ext = uploaded_file.name.split('.')[-1].lower()
-            
-            if file_ext == 'xlsx':
-                df = pd.read_excel(uploaded_file)
-            elif file_ext in ['csv', 'txt']:
-                # Tenta di caricare CSV con diverse codifiche e delimitatori
-                try:
-                    df = pd.read_csv(uploaded_file, sep=',', encoding='utf-8-sig')
-                except UnicodeDecodeError:
-                    try:
-                        df = pd.read_csv(uploaded_file, sep=',', encoding='utf-8')
-                    except UnicodeDecodeError:
-                        try:
-                            df = pd.read_csv(uploaded_file, sep=';', encoding='utf-8-sig')
-                        except UnicodeDecodeError:
-                            df = pd.read_csv(uploaded_file, sep=';', encoding='latin-1')
-            else:
+            if file_ext not in ['xlsx', 'csv', 'txt']:
                 st.error(f"Formato file non supportato: {file_ext}")
                 continue
-                
-            # Verifica schema dati per i nuovi formati
-            columns = df.columns.tolist();
-            
-            # Identificazione e mappatura colonne
-            # Formato 1: Con colonne DataPresenza e OraPresenza già presenti
-            if 'DataPresenza' in columns and 'OraPresenza' in columns:
-                st.info(f"File {uploaded_file.name} con formato standard riconosciuto")
-            
-            # Formato 2: Con colonna "Ora di inizio" che contiene data e ora insieme
-            elif 'Ora di inizio' in columns:
-                st.info(f"File {uploaded_file.name}: trovata colonna 'Ora di inizio', la elaboro...")
-                df = process_datetime_field(df, 'Ora di inizio')
-                
-                # Mappatura delle altre colonne
-                # Verifica tutte le possibili varianti del nome della colonna dell'attività
-                activity_col_variants = [
-                    'Denominazione dell\'attività',
-                    'Denominazione dell\'attività',
-                    'Denominazione dell\'attivita',
-                    'Denominazione dell\'attivitá',
-                    'Denominazione dell\'attività',
-                    'Denominazione dell\'attivita\'',
-                    'Denominazione dell attività',
-                    'Denominazione dell attivita'
-                ]
-                
-                activity_col_found = None
-                for variant in activity_col_variants:
-                    if variant in columns:
-                        activity_col_found = variant
-                        break
-                
-                # Cerca anche varianti senza apostrofo
-                if not activity_col_found:
-                    possible_activity_cols = [col for col in columns if 'attivit' in col.lower() and 'denominazione' in col.lower()]
-                    if possible_activity_cols:
-                        activity_col_found = possible_activity_cols[0]
-                
-                if activity_col_found:
-                    df.rename(columns={activity_col_found: 'DenominazioneAttività'}, inplace=True)
-                    st.info(f"Rinominata colonna '{activity_col_found}' in 'DenominazioneAttività'")
-                
-                # Gestione colonna Nome con opzioni alternative
-                if 'Nome (del corsista)' in columns:
-                    df.rename(columns={'Nome (del corsista)': 'Nome'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Nome (del corsista)' in 'Nome'")
-                elif 'nome2' in columns:
-                    df.rename(columns={'nome2': 'Nome'}, inplace=True)
-                    st.info(f"Rinominata colonna 'nome2' in 'Nome'")
-                    
-                if 'Cognome (del corsista)' in columns:
-                    df.rename(columns={'Cognome (del corsista)': 'Cognome'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Cognome (del corsista)' in 'Cognome'")
-                    
-                if 'Tipo di percorso' in columns:
-                    df.rename(columns={'Tipo di percorso': 'DenominazionePercorso'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Tipo di percorso' in 'DenominazionePercorso'")
-                
-                # Gestione colonna Percorso alternativa
-                if 'Tipo di percorso' not in columns and 'Denominazione del percorso' in columns:
-                    df.rename(columns={'Denominazione del percorso': 'DenominazionePercorso'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Denominazione del percorso' in 'DenominazionePercorso'")
-                    
-                if 'Posta elettronica' in columns:
-                    df.rename(columns={'Posta elettronica': 'Email'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Posta elettronica' in 'Email'")
-                
-                # Usa email da posta elettronica se disponibile
-                if 'Posta elettronica' not in columns and 'Email' not in df.columns and 'Posta elettronica' in columns:
-                    df.rename(columns={'Posta elettronica': 'Email'}, inplace=True)
-                    st.info(f"Rinominata colonna 'Posta elettronica' in 'Email'")
-                
-                # Mappatura alternativa dell'email
-                if 'Email' not in df.columns and any('mail' in col.lower() for col in columns):
-                    email_cols = [col for col in columns if 'mail' in col.lower()]
-                    if email_cols:
-                        df.rename(columns={email_cols[0]: 'Email'}, inplace=True)
-                        st.info(f"Rinominata colonna '{email_cols[0]}' in 'Email'")
-                    
-                if 'ID' in columns:
-                    df['CodiceFiscale'] = df['ID']  # Usiamo ID come sostituto del codice fiscale se non c'è altro
-                    st.warning(f"Usata colonna 'ID' come sostituto per 'CodiceFiscale'")
-            else:
-                # Formato non riconosciuto
+
+            # Riconoscimento del formato dalla sola intestazione (vedi modules.file_formats)
+            header, read_options = read_header(uploaded_file)
+            adapter, rename = detect_format(header)
+            if adapter is None:
                 st.warning(f"File {uploaded_file.name}: formato non riconosciuto, non elaborato")
                 failed_files += 1
                 continue
+            st.info(f"File {uploaded_file.name}: formato '{adapter.name}' riconosciuto, "
+                    f"{len(rename)} colonne riconosciute su {len(header)}")
+            renamed = [f"'{src}' → '{dst}'" for src, dst in rename.items() if src != dst]
+            if renamed:
+                st.info("Colonne rinominate: " + ", ".join(renamed))
+
+            # Lettura completa con i tipi dichiarati dal formato per le colonne riconosciute
+            df = read_with_format(uploaded_file, adapter, rename, read_options)
+            for missing, source in adapter.fallback_columns.items():
+                if missing not in rename.values() and source in df.columns:
+                    st.warning(f"Usata colonna '{source}' come sostituto per '{missing}'")
+            if adapter.datetime_field:
+                df = process_datetime_field(df, adapter.datetime_field)
                 
             # Verifica requisiti minimi (solo data e ora sono obbligatorie inizialmente)
             required_cols = ['DataPresenza', 'OraPresenza']
@@ -962,6 +1129,7 @@ def load_multiple_files(uploaded_files):
                 
             # Aggiungi il dataframe alla lista
             all_dataframes.append(df)
+            source_names.append(uploaded_file.name)
             processed_files += 1
             
         except Exception as e:
@@ -975,9 +1143,13 @@ def load_multiple_files(uploaded_files):
         
     # Combina tutti i dataframe
     try:
-        combined_df = pd.concat(all_dataframes, ignore_index=True)
+        combined_df, removed_per_file = concat_without_cross_file_duplicates(all_dataframes, source_names)
         st.success(f"Caricati con successo {processed_files} file, combinati {len(all_dataframes)} dataframe con un totale di {len(combined_df)} righe")
-        
+        if removed_per_file:
+            details = ", ".join(f"{name}: {count}" for name, count in removed_per_file)
+            st.info(f"Rimossi {sum(count for _, count in removed_per_file)} record identici già presenti "
+                    f"in un file precedente (periodi sovrapposti) - {details}")
+
         if failed_files > 0:
             st.warning(f"{failed_files} file non sono stati processati a causa di errori")
             
@@ -1026,7 +1198,10 @@ def load_multiple_files(uploaded_files):
                 # Normalizzazione dei tipi di dati data e ora prima di combinarli
                 # Converto esplicitamente DataPresenza in oggetto date
                 try:
-                    combined_df['DataPresenza'] = pd.to_datetime(combined_df['DataPresenza'], errors='coerce').dt.date
+                    parsed_dates, date_formats = parse_datetime_column(combined_df['DataPresenza'], MONTH_FIRST_DATE_FORMATS)
+                    combined_df['DataPresenza'] = parsed_dates.dt.date
+                    if len(date_formats) > 1:
+                        st.info(f"Formati di 'DataPresenza' rilevati: {describe_date_formats(date_formats)}")
                 except Exception as e:
                     st.warning(f"Problema di conversione 'DataPresenza': {e}")
                 
@@ -1123,8 +1298,8 @@ def load_multiple_files(uploaded_files):
             if 'DenominazioneAttività' in combined_df.columns:
                 st.info("Abbinamento dei CFU alle attività in corso...")
                 activity_col_norm_internal = 'DenominazioneAttivitaNormalizzataInternal'
-                combined_df[activity_col_norm_internal] = combined_df['DenominazioneAttività'].apply(normalize_generic)
-                combined_df['CFU'] = combined_df['DenominazioneAttività'].apply(lambda x: match_activity_with_cfu(x, cfu_data))
+                combined_df[activity_col_norm_internal] = map_unique(combined_df['DenominazioneAttività'], normalize_generic)
+                combined_df['CFU'] = match_activities_with_cfu(combined_df['DenominazioneAttività'], cfu_data)
                 
                 # Conta quante attività non hanno trovato un match per i CFU
                 missing_cfu = combined_df['CFU'].isna().sum()
@@ -1171,6 +1346,12 @@ def load_multiple_files(uploaded_files):
             st.error("ATTENZIONE: Nessuna colonna degli iscritti è stata integrata nei dati!")
             
         st.success("Elaborazione del caricamento multiplo completata.")
+        # Versione di crediti.csv usata per i CFU (per l'aggiornamento a caldo, vedi modules.cfu_reload)
+        combined_df.attrs['cfu_file_version'] = cfu_data.attrs.get('file_version')
+        # Versione dell'elenco degli iscritti usata per l'integrazione (vedi modules.roster_reload)
+        combined_df.attrs['enrolled_roster_version'] = get_enrollment_snapshots().version
+        # Impronta stabile di ogni record (identificativo tra un caricamento e l'altro)
+        combined_df[RECORD_HASH_COL] = compute_record_hashes(combined_df)
         return combined_df
         
     except Exception as e:
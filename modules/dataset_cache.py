@@ -0,0 +1,240 @@
+# Gestione della versione del dataset e memoizzazione dei calcoli aggregati
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+import streamlit as st
+
+# Numero massimo di risultati aggregati conservati per sessione (eviction LRU)
+MAX_CACHED_AGGREGATES = 32
+# Numero massimo di dataset (impronte distinte) condivisi tra le sessioni del processo
+MAX_SHARED_DATASETS = 8
+
+def compute_file_fingerprint(uploaded_file):
+    """
+    Calcola l'impronta (hash del contenuto) di un file caricato.
+    L'hash viene calcolato una sola volta per upload e conservato nello stato
+    sessione, indicizzato sul file_id assegnato da Streamlit.
+
+    Args:
+        uploaded_file: File caricato dall'utente
+
+    Returns:
+        Stringa esadecimale con l'impronta del file
+    """
+    file_id = getattr(uploaded_file, 'file_id', None)
+    fingerprints = st.session_state.setdefault('upload_fingerprints', {})
+    if file_id is not None and file_id in fingerprints:
+        return fingerprints[file_id]
+
+    if hasattr(uploaded_file, 'getvalue'):
+        content = uploaded_file.getvalue()
+    else:
+        content = uploaded_file.read()
+        uploaded_file.seek(0)
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(getattr(uploaded_file, 'name', '')).encode('utf-8'))
+    digest.update(content)
+    fingerprint = digest.hexdigest()
+
+    if file_id is not None:
+        fingerprints[file_id] = fingerprint
+    return fingerprint
+
+def compute_upload_fingerprint(uploaded_files):
+    """
+    Calcola l'impronta complessiva di uno o più file caricati,
+    indipendente dall'ordine dei file.
+
+    Args:
+        uploaded_files: Lista di file caricati dall'utente
+
+    Returns:
+        Stringa esadecimale con l'impronta dell'insieme dei file
+    """
+    file_fingerprints = sorted(compute_file_fingerprint(f) for f in uploaded_files)
+    if len(file_fingerprints) == 1:
+        return file_fingerprints[0]
+    digest = hashlib.blake2b(digest_size=16)
+    for fingerprint in file_fingerprints:
+        digest.update(fingerprint.encode('ascii'))
+    return digest.hexdigest()
+
+def get_dataset_version():
+    """Restituisce il token di versione del dataset corrente (None se nessun dataset è caricato)."""
+    return st.session_state.get('dataset_version')
+
+def bump_dataset_version(fingerprint=None):
+    """
+    Genera un nuovo token di versione per il dataset corrente.
+    Va chiamata ogni volta che `processed_df` viene caricato o modificato
+    (es. dopo la rimozione dei duplicati): i risultati memoizzati con la
+    versione precedente non vengono più restituiti.
+
+    Args:
+        fingerprint: Impronta dei file appena caricati; se indicata diventa
+            la versione iniziale del dataset, altrimenti viene generato un
+            nuovo identificativo derivato dall'impronta di partenza
+
+    Returns:
+        Il nuovo token di versione
+    """
+    if fingerprint is not None:
+        st.session_state.dataset_fingerprint = fingerprint
+        st.session_state.dataset_version = fingerprint
+    else:
+        base = st.session_state.get('dataset_fingerprint', 'dataset')
+        st.session_state.dataset_version = f"{base}-{uuid.uuid4().hex[:12]}"
+    return st.session_state.dataset_version
+
+def clear_dataset_version():
+    """Rimuove il token di versione e svuota la cache degli aggregati (nessun dataset caricato)."""
+    if 'dataset_version' in st.session_state:
+        del st.session_state.dataset_version
+    if 'dataset_fingerprint' in st.session_state:
+        del st.session_state.dataset_fingerprint
+    if 'aggregate_cache' in st.session_state:
+        del st.session_state.aggregate_cache
+
+def _params_key(params):
+    """Converte i parametri della funzione in una chiave hashable."""
+    items = []
+    for name, value in sorted(params.items()):
+        try:
+            hash(value)
+            items.append((name, value))
+        except TypeError:
+            items.append((name, repr(value)))
+    return tuple(items)
+
+class SharedAggregateStore:
+    """
+    Risultati aggregati di un dataset non modificato, condivisi da tutte le
+    sessioni che hanno caricato gli stessi file (stessa impronta).
+    I risultati vanno trattati in sola lettura: ogni sessione applica le
+    proprie modifiche (rimozioni, filtri) sopra di essi senza alterarli.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_AGGREGATES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def items(self):
+        """Copia delle coppie (chiave, risultato) conservate."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_SHARED_DATASETS)
+def get_shared_aggregate_store(fingerprint):
+    """Restituisce lo SharedAggregateStore del processo per l'impronta indicata."""
+    return SharedAggregateStore()
+
+def is_shared_version():
+    """Indica se la sessione usa il dataset così come caricato (versione uguale all'impronta dei file)."""
+    version = get_dataset_version()
+    return version is not None and version == st.session_state.get('dataset_fingerprint')
+
+_MISSING = object()
+
+def aggregate_name(func):
+    """Nome con cui i risultati di `func` sono memoizzati nelle chiavi di cache."""
+    return f"{func.__module__}.{func.__qualname__}"
+
+def memoize_aggregate(func, df, **params):
+    """
+    Calcola `func(df, **params)` memoizzando il risultato sulla chiave
+    (versione dataset, funzione, parametri). Il DataFrame non viene mai
+    hashato: la versione del dataset ne fa le veci. Finché la sessione non
+    modifica il dataset caricato i risultati sono condivisi tra le sessioni
+    con la stessa impronta; dopo una modifica restano nella sessione.
+
+    Args:
+        func: Funzione di aggregazione (es. calculate_attendance)
+        df: DataFrame corrispondente alla versione corrente del dataset
+        **params: Parametri della funzione (devono determinare il risultato insieme alla versione)
+
+    Returns:
+        Il risultato della funzione (da trattare in sola lettura)
+    """
+    version = get_dataset_version()
+    if version is None:
+        # Nessuna versione registrata: calcolo diretto senza cache
+        return func(df, **params)
+
+    key = (version, aggregate_name(func), _params_key(params))
+
+    if is_shared_version():
+        store = get_shared_aggregate_store(version)
+        result = store.get(key, _MISSING)
+        if result is _MISSING:
+            result = func(df, **params)
+            store.put(key, result)
+        return result
+
+    if 'aggregate_cache' not in st.session_state:
+        st.session_state.aggregate_cache = OrderedDict()
+    cache = st.session_state.aggregate_cache
+
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    result = func(df, **params)
+    cache[key] = result
+    # Eviction LRU: rimuove i risultati usati meno di recente
+    while len(cache) > MAX_CACHED_AGGREGATES:
+        cache.popitem(last=False)
+    return result
+
+def carry_over_aggregates(previous_version, updater):
+    """
+    Riporta sulla versione corrente del dataset i risultati memoizzati per una
+    versione precedente, quando la modifica del dataset non li invalida del tutto
+    (es. cambiano i valori di una sola colonna). Va chiamata subito dopo
+    bump_dataset_version; i risultati riportati restano nella cache della sessione.
+
+    Args:
+        previous_version: Versione del dataset a cui appartengono i risultati
+        updater: Funzione updater(nome della funzione, risultato, parametri) che
+            restituisce il risultato valido per la nuova versione, o None per scartarlo
+
+    Returns:
+        Tuple (risultati riportati, risultati scartati)
+    """
+    version = get_dataset_version()
+    if previous_version is None or version is None or version == previous_version:
+        return 0, 0
+
+    entries = []
+    if previous_version == st.session_state.get('dataset_fingerprint'):
+        entries.extend(get_shared_aggregate_store(previous_version).items())
+    cache = st.session_state.setdefault('aggregate_cache', OrderedDict())
+    entries.extend((key, value) for key, value in cache.items() if key[0] == previous_version)
+
+    kept = dropped = 0
+    for (_, name, params_key), result in entries:
+        updated = updater(name, result, dict(params_key))
+        if updated is None:
+            dropped += 1
+            continue
+        cache[(version, name, params_key)] = updated
+        kept += 1
+    while len(cache) > MAX_CACHED_AGGREGATES:
+        cache.popitem(last=False)
+    return kept, dropped
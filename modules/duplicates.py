@@ -1,10 +1,74 @@
 # filepath: /mnt/git/presenze-pef/modules/duplicates.py
 # Funzioni per il rilevamento e la gestione dei duplicati
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import timedelta, time
 
-def detect_duplicate_records(df, timestamp_col='TimestampPresenza', time_delta_minutes=120):
+class DuplicateDetectionResult:
+    """
+    Risultato compatto del rilevamento duplicati: solo posizioni delle righe
+    coinvolte nel DataFrame analizzato, id del gruppo e flag di rimozione suggerita,
+    ordinati per gruppo e timestamp. I DataFrame da mostrare vengono materializzati
+    su richiesta dal DataFrame di partenza, che deve essere lo stesso usato per il rilevamento.
+    """
+
+    def __init__(self, positions=None, group_ids=None, suggested=None):
+        """
+        Args:
+            positions: Posizioni (iloc) delle righe coinvolte
+            group_ids: Id del gruppo di ciascuna riga
+            suggested: True per le righe di cui si suggerisce la rimozione
+        """
+        self.positions = np.asarray(positions if positions is not None else [], dtype=np.int64)
+        self.group_ids = np.asarray(group_ids if group_ids is not None else [], dtype=np.int64)
+        self.suggested = np.asarray(suggested if suggested is not None else [], dtype=bool)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def empty(self):
+        return len(self.positions) == 0
+
+    @property
+    def n_groups(self):
+        """Numero di gruppi di duplicati."""
+        return len(np.unique(self.group_ids))
+
+    def involved_indices(self, df):
+        """Indici (etichette) di tutte le righe coinvolte."""
+        return df.index[self.positions].tolist()
+
+    def indices_to_drop(self, df):
+        """Indici (etichette) delle righe di cui si suggerisce la rimozione."""
+        return df.index[self.positions[self.suggested]].tolist()
+
+    def group_series(self, df):
+        """Serie indice -> GruppoDuplicati delle righe coinvolte."""
+        return pd.Series(self.group_ids, index=df.index[self.positions], name='GruppoDuplicati')
+
+    def to_frame(self, df, columns=None, rows=None):
+        """
+        Materializza il DataFrame dei duplicati (con 'GruppoDuplicati' e 'SuggerisciRimuovere').
+
+        Args:
+            df: DataFrame usato per il rilevamento
+            columns: Colonne da includere (tutte se None)
+            rows: Slice opzionale delle righe del risultato da materializzare (es. una pagina di gruppi)
+
+        Returns:
+            DataFrame ordinato per gruppo e timestamp
+        """
+        rows = rows if rows is not None else slice(None)
+        positions = self.positions[rows]
+        frame = df.iloc[positions] if columns is None else df.iloc[positions][[c for c in columns if c in df.columns]]
+        frame = frame.copy()
+        frame['GruppoDuplicati'] = self.group_ids[rows]
+        frame['SuggerisciRimuovere'] = self.suggested[rows]
+        return frame
+
+def detect_duplicate_records(df, timestamp_col='TimestampPresenza', time_delta_minutes=120, compact=False):
     """
     Rileva record duplicati nei dati in base a:
     - Cognome (insensibile a maiuscole/minuscole)
@@ -22,26 +86,31 @@ def detect_duplicate_records(df, timestamp_col='TimestampPresenza', time_delta_m
     
     Note: La funzione assume che i campi DataPresenza e OraPresenza siano già stati 
     standardizzati dal modulo data_loader per garantire coerenza nei confronti.
+
+    Con compact=True restituisce un DuplicateDetectionResult (posizioni, gruppi e
+    suggerimenti come array NumPy) invece della tupla
+    (duplicates_df, indici coinvolti, indici da rimuovere).
     """
+    empty_result = DuplicateDetectionResult() if compact else (pd.DataFrame(), [], [])
     if df is None or len(df) == 0: 
-        return pd.DataFrame(), [], []
+        return empty_result
         
     required_cols = [timestamp_col, 'Nome', 'Cognome', 'DenominazioneAttività']
     if not all(col in df.columns for col in required_cols):
         missing_but_exist = [col for col in required_cols if col in df.columns and df[col].isnull().all()]
         if len(missing_but_exist) == len(required_cols): 
             st.warning(f"Colonne necessarie ({', '.join(required_cols)}) vuote.")
-            return pd.DataFrame(), [], []
+            return empty_result
             
         missing_cols = [col for col in required_cols if col not in df.columns]
         if missing_cols: 
             st.error(f"Colonne necessarie ({', '.join(missing_cols)}) mancanti.")
-            return pd.DataFrame(), [], []
+            return empty_result
             
     df_copy = df.dropna(subset=required_cols).copy()
     if df_copy.empty: 
         st.info("Nessun record con Timestamp, Nome, Cognome e DenominazioneAttività validi per controllo duplicati.")
-        return pd.DataFrame(), [], []
+        return empty_result
     
     # Normalizzazione delle date e orari
     # Assicurati che TimestampPresenza sia datetime
@@ -163,7 +232,7 @@ def detect_duplicate_records(df, timestamp_col='TimestampPresenza', time_delta_m
                 
     involved_df_sorted = df_sorted[df_sorted['GruppoDuplicati'] != 0].copy()
     if involved_df_sorted.empty: 
-        return pd.DataFrame(), [], []
+        return empty_result
         
     group_mapping = pd.Series(involved_df_sorted['GruppoDuplicati'].values, index=involved_df_sorted['OriginalIndex']).to_dict()
     involved_original_indices = involved_df_sorted['OriginalIndex'].unique().tolist()
@@ -175,8 +244,16 @@ def detect_duplicate_records(df, timestamp_col='TimestampPresenza', time_delta_m
         
     valid_involved_indices = [idx for idx in involved_original_indices if idx in df.index]
     if not valid_involved_indices: 
-        return pd.DataFrame(), [], []
+        return empty_result
         
+    if compact:
+        positions = df.index.get_indexer(valid_involved_indices)
+        group_ids = pd.Series(valid_involved_indices).map(group_mapping).fillna(0).astype(np.int64).to_numpy()
+        suggested = pd.Index(valid_involved_indices).isin(indices_to_drop_suggestion)
+        timestamps = pd.to_datetime(df[timestamp_col].iloc[positions], errors='coerce').to_numpy()
+        order = np.lexsort((timestamps, group_ids))
+        return DuplicateDetectionResult(positions[order], group_ids[order], suggested[order])
+
     duplicates_df = df.loc[valid_involved_indices].copy()
     duplicates_df['GruppoDuplicati'] = duplicates_df.index.map(group_mapping).fillna(0).astype(int)
     duplicates_df['SuggerisciRimuovere'] = duplicates_df.index.isin(indices_to_drop_suggestion)
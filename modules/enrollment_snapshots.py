@@ -0,0 +1,272 @@
+# Archivio temporale degli iscritti: più istantanee iscritti_*.csv confrontate per CodiceFiscale
+import glob
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+ENROLLED_FILE_PATTERN = 'iscritti_*.csv'
+REQUIRED_ENROLLED_COLS = ['Cognome', 'Nome', 'CodiceFiscale', 'Codice_Classe_di_concorso']
+# Valori segnaposto del codice fiscale: per questi iscritti la chiave usa la matricola
+PLACEHOLDER_CF = {'', 'CFMANCANTE', 'NAN', 'NONE'}
+KEY_COL = 'ChiaveIscritto'
+# Elenchi degli iscritti di versioni precedenti conservati per il confronto incrementale
+MAX_ROSTER_HISTORY = 4
+
+ITALIAN_MONTHS = {
+    'gennaio': 1, 'febbraio': 2, 'marzo': 3, 'aprile': 4, 'maggio': 5, 'giugno': 6,
+    'luglio': 7, 'agosto': 8, 'settembre': 9, 'ottobre': 10, 'novembre': 11, 'dicembre': 12,
+}
+
+_SNAPSHOT_NAME_PATTERN = re.compile(r'^iscritti_(\d{1,2})_([a-z]+)(?:_(\d{4}))?\.csv$', re.IGNORECASE)
+
+def parse_snapshot_date(file_name, modified=None):
+    """
+    Ricava la data dell'istantanea dal nome del file, nel formato
+    iscritti_<giorno>_<mese in italiano>[_<anno>].csv.
+
+    Se il nome non riporta l'anno (es. iscritti_05_maggio.csv) lo si deduce dalla data
+    di modifica del file: è l'anno dell'ultima occorrenza di quel giorno e mese non
+    successiva alla modifica.
+
+    Args:
+        file_name: Nome o percorso del file
+        modified: Data di modifica del file, usata quando il nome non riporta l'anno
+
+    Returns:
+        La data dell'istantanea, o None se il nome non rispetta il formato
+        o l'anno non è deducibile
+    """
+    match = _SNAPSHOT_NAME_PATTERN.match(os.path.basename(file_name))
+    if not match:
+        return None
+    month = ITALIAN_MONTHS.get(match.group(2).lower())
+    if month is None:
+        return None
+    day = int(match.group(1))
+    if match.group(3):
+        year = int(match.group(3))
+    elif modified is not None:
+        year = modified.year if (month, day) <= (modified.month, modified.day) else modified.year - 1
+    else:
+        return None
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def find_enrolled_dir():
+    """Restituisce la cartella con i file degli iscritti (modules/dati), provando più percorsi."""
+    candidates = [
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modules', 'dati'),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dati'),
+        os.path.join('modules', 'dati'),
+    ]
+    for path in candidates:
+        if os.path.isdir(path):
+            return path
+    return None
+
+def read_enrolled_csv(file_path):
+    """
+    Legge un file degli iscritti (delimitatore punto e virgola, encoding con fallback).
+    Tutte le colonne sono lette come testo, così le istantanee si confrontano senza
+    differenze dovute ai tipi.
+    """
+    for encoding in ['utf-8-sig', 'utf-8', 'latin-1']:
+        try:
+            enrolled_df = pd.read_csv(file_path, delimiter=';', encoding=encoding, dtype=str)
+            break
+        except UnicodeDecodeError:
+            continue
+    missing_cols = [col for col in REQUIRED_ENROLLED_COLS if col not in enrolled_df.columns]
+    if missing_cols:
+        raise ValueError(f"colonne richieste mancanti ({', '.join(missing_cols)})")
+    enrolled_df['CodiceFiscale'] = enrolled_df['CodiceFiscale'].astype(str).str.strip()
+    enrolled_df[KEY_COL] = _record_keys(enrolled_df)
+    return enrolled_df.reset_index(drop=True)
+
+def _record_keys(enrolled_df):
+    """
+    Chiave stabile di ogni iscritto tra le istantanee: il CodiceFiscale, oppure la
+    matricola se il CF è un segnaposto. Uno studente iscritto a più percorsi compare
+    più volte: le occorrenze successive ricevono un suffisso progressivo.
+    """
+    cf = enrolled_df['CodiceFiscale'].fillna('').str.upper()
+    keys = 'CF:' + cf
+    if 'Matricola' in enrolled_df.columns:
+        placeholder = cf.isin(PLACEHOLDER_CF)
+        keys = keys.where(~placeholder, 'MAT:' + enrolled_df['Matricola'].fillna('').astype(str).str.strip())
+    occurrence = keys.groupby(keys).cumcount()
+    return keys.where(occurrence == 0, keys + '#' + occurrence.astype(str))
+
+class EnrollmentSnapshotStore:
+    """
+    Storico versionato degli iscritti costruito dalle istantanee iscritti_*.csv.
+    Ogni istantanea viene confrontata con lo stato corrente per chiave (CodiceFiscale):
+    gli iscritti nuovi aprono una versione, quelli modificati chiudono la versione
+    corrente e ne aprono una nuova, quelli scomparsi la chiudono. Ogni versione è
+    valida nell'intervallo [ValidoDal, ValidoAl) (ValidoAl vuoto per le versioni correnti).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history = OrderedDict()  # Versione -> elenco degli iscritti di quella versione
+        self._reset()
+
+    def _reset(self):
+        self.records = pd.DataFrame()
+        self.snapshots = []  # Lista di tuple (data, nome file), in ordine cronologico
+        self._files = {}  # Percorso -> mtime dei file già acquisiti
+        self._latest = pd.DataFrame()
+        self._roster = None
+        self.version = None  # Token che cambia a ogni istantanea acquisita o ricostruzione
+
+    @property
+    def attribute_cols(self):
+        return [c for c in self.records.columns if c not in (KEY_COL, 'ValidoDal', 'ValidoAl')]
+
+    def refresh(self, enrolled_dir):
+        """
+        Acquisisce le istantanee nuove della cartella come differenze rispetto allo stato
+        corrente. Lo storico viene ricostruito da capo solo se un file già acquisito è stato
+        modificato o rimosso, o se la nuova istantanea è precedente all'ultima acquisita.
+
+        Args:
+            enrolled_dir: Cartella con i file iscritti_*.csv
+
+        Returns:
+            Lista di tuple (nome file, statistiche della differenza) delle istantanee acquisite
+        """
+        found = {}
+        for path in glob.glob(os.path.join(enrolled_dir, ENROLLED_FILE_PATTERN)):
+            mtime = os.path.getmtime(path)
+            snapshot_date = parse_snapshot_date(path, date.fromtimestamp(mtime))
+            if snapshot_date is None:
+                st.warning(f"File iscritti ignorato, data non riconoscibile dal nome: {os.path.basename(path)}")
+                continue
+            if path not in self._files and not _SNAPSHOT_NAME_PATTERN.match(os.path.basename(path)).group(3):
+                st.info(f"{os.path.basename(path)}: anno {snapshot_date.year} dedotto dalla data di modifica del file")
+            found[path] = (snapshot_date, mtime)
+
+        with self._lock:
+            changed = any(path not in found or found[path][1] != mtime for path, mtime in self._files.items())
+            new_paths = sorted((p for p in found if p not in self._files), key=lambda p: found[p][0])
+            last_date = self.snapshots[-1][0] if self.snapshots else None
+            if changed or (new_paths and last_date is not None and found[new_paths[0]][0] <= last_date):
+                self._reset()
+                new_paths = sorted(found, key=lambda p: found[p][0])
+
+            ingested = []
+            for path in new_paths:
+                snapshot_df = read_enrolled_csv(path)
+                stats = self._apply_snapshot(found[path][0], snapshot_df)
+                self._files[path] = found[path][1]
+                self.snapshots.append((found[path][0], os.path.basename(path)))
+                ingested.append((os.path.basename(path), stats))
+            if ingested:
+                self._roster = None
+                self.version = uuid.uuid4().hex[:12]
+            return ingested
+
+    def _apply_snapshot(self, snapshot_date, snapshot_df):
+        """Applica un'istantanea come differenza rispetto alle versioni correnti."""
+        valid_from = pd.Timestamp(snapshot_date)
+        new = snapshot_df.set_index(KEY_COL)
+        if self.records.empty:
+            added = new.reset_index().assign(ValidoDal=valid_from, ValidoAl=pd.NaT)
+            self.records = added.reset_index(drop=True)
+            self._latest = snapshot_df
+            return {'nuovi': len(added), 'modificati': 0, 'rimossi': 0}
+
+        is_open = self.records['ValidoAl'].isna()
+        current = self.records[is_open].set_index(KEY_COL)
+        attr_cols = [c for c in new.columns if c in current.columns]
+        common = new.index.intersection(current.index)
+        differs = (new.loc[common, attr_cols].fillna('') != current.loc[common, attr_cols].fillna('')).any(axis=1)
+        modified = common[differs.to_numpy()]
+        removed = current.index.difference(new.index)
+        added = new.index.difference(current.index)
+
+        # Chiusura delle versioni modificate o scomparse
+        to_close = is_open & self.records[KEY_COL].isin(modified.union(removed))
+        self.records.loc[to_close, 'ValidoAl'] = valid_from
+
+        opened = new.loc[modified.union(added)].reset_index().assign(ValidoDal=valid_from, ValidoAl=pd.NaT)
+        self.records = pd.concat([self.records, opened], ignore_index=True)
+        self._latest = snapshot_df
+        return {'nuovi': len(added), 'modificati': len(modified), 'rimossi': len(removed)}
+
+    def roster(self):
+        """
+        Elenco degli iscritti per il matching: l'ultima istantanea, seguita dall'ultima
+        versione nota degli iscritti non più presenti, con la colonna ChiaveIscritto.
+        """
+        with self._lock:
+            if self._roster is None:
+                if self.records.empty:
+                    self._roster = pd.DataFrame()
+                else:
+                    last_versions = self.records.drop_duplicates(KEY_COL, keep='last')
+                    removed = last_versions[~last_versions[KEY_COL].isin(self._latest[KEY_COL])]
+                    self._roster = pd.concat(
+                        [self._latest, removed.drop(columns=['ValidoDal', 'ValidoAl'])], ignore_index=True
+                    )
+                if self.version is not None:
+                    self._history[self.version] = self._roster
+                    self._history.move_to_end(self.version)
+                    while len(self._history) > MAX_ROSTER_HISTORY:
+                        self._history.popitem(last=False)
+            return self._roster.copy()
+
+    def roster_for(self, version):
+        """Elenco degli iscritti di una versione precedente (None se non più conservato)."""
+        with self._lock:
+            roster = self._history.get(version)
+            return roster.copy() if roster is not None else None
+
+    def attributes_as_of(self, keys, dates, columns):
+        """
+        Restituisce gli attributi di iscrizione validi alla data di ogni riga.
+        Per le date precedenti alla prima versione di un iscritto vale la prima versione,
+        per quelle successive alla sua rimozione l'ultima versione nota; le date mancanti
+        usano la versione più recente.
+
+        Args:
+            keys: Series con la ChiaveIscritto di ogni riga
+            dates: Series (stesso indice) con la data di riferimento di ogni riga
+            columns: Colonne di attributi da restituire
+
+        Returns:
+            DataFrame con lo stesso indice di `keys` e le colonne richieste
+        """
+        columns = [c for c in columns if c in self.records.columns]
+        dates = pd.to_datetime(dates, errors='coerce').dt.normalize()
+        dates = dates.fillna(pd.Timestamp.max.normalize())
+        left = pd.DataFrame({KEY_COL: keys.to_numpy(), 'Data': dates.to_numpy(), '_pos': np.arange(len(keys))})
+        left = left.dropna(subset=[KEY_COL]).sort_values('Data')
+        right = self.records[[KEY_COL, 'ValidoDal'] + columns].sort_values('ValidoDal')
+
+        merged = pd.merge_asof(left, right, left_on='Data', right_on='ValidoDal', by=KEY_COL, direction='backward')
+        missing = merged['ValidoDal'].isna()
+        if missing.any():
+            forward = pd.merge_asof(left[missing.to_numpy()], right, left_on='Data', right_on='ValidoDal',
+                                    by=KEY_COL, direction='forward')
+            merged = pd.concat([merged[~missing], forward], ignore_index=True)
+
+        result = pd.DataFrame(index=np.arange(len(keys)), columns=columns, dtype=object)
+        positions = merged['_pos'].to_numpy()
+        for col in columns:
+            result.loc[positions, col] = merged[col].to_numpy()
+        result.index = keys.index
+        return result
+
+@st.cache_resource(show_spinner=False)
+def get_enrollment_snapshots():
+    """Archivio delle istantanee degli iscritti, condiviso tra le sessioni del processo."""
+    return EnrollmentSnapshotStore()
@@ -0,0 +1,293 @@
+# Riconoscimento del formato dei file presenze dalla sola riga di intestazione
+# e registro dichiarativo dei formati supportati (colonne accettate, tipi, trasformazioni)
+import unicodedata
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+import numpy as np
+import pandas as pd
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Fogli di una cartella di lavoro letti in parallelo (processi separati) al massimo
+MAX_SHEET_WORKERS = 4
+
+# Combinazioni separatore/encoding provate per i file CSV, nell'ordine
+CSV_READ_OPTIONS = [
+    {'sep': ',', 'encoding': 'utf-8-sig'},
+    {'sep': ',', 'encoding': 'utf-8'},
+    {'sep': ';', 'encoding': 'utf-8-sig'},
+    {'sep': ';', 'encoding': 'latin-1'},
+]
+
+def normalize_header(name):
+    """Normalizza un'intestazione per il confronto: minuscole, senza accenti, apostrofi uniformati e spazi compattati."""
+    text = str(name).replace('\u2019', "'").replace('\u2018', "'")
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    text = text.replace('`', "'").lower()
+    return ' '.join(text.split())
+
+class FormatAdapter:
+    """
+    Descrizione dichiarativa di un formato di file presenze.
+    Ogni colonna canonica elenca le intestazioni accettate in ordine di preferenza:
+    una stringa è confrontata (normalizzata) per uguaglianza, una tupla di stringhe
+    accetta la prima intestazione che le contiene tutte.
+    """
+
+    def __init__(self, name, required, columns, dtypes=None, datetime_field=None, fallback_columns=None):
+        """
+        Args:
+            name: Nome del formato mostrato all'utente
+            required: Colonne canoniche che devono essere presenti per riconoscere il formato
+            columns: Dizionario {colonna canonica: lista di intestazioni accettate}
+            dtypes: Dizionario {colonna canonica: dtype} passato alla lettura
+            datetime_field: Colonna canonica con data e ora insieme, da separare in DataPresenza e OraPresenza
+            fallback_columns: Dizionario {colonna mancante: colonna da cui copiarla}
+        """
+        self.name = name
+        self.required = required
+        self.columns = columns
+        self.dtypes = dtypes or {}
+        self.datetime_field = datetime_field
+        self.fallback_columns = fallback_columns or {}
+
+    def resolve(self, header):
+        """
+        Abbina l'intestazione del file alle colonne canoniche del formato.
+
+        Args:
+            header: Lista dei nomi di colonna del file
+
+        Returns:
+            Dizionario {colonna del file: colonna canonica}, o None se mancano colonne obbligatorie
+        """
+        normalized = [(col, normalize_header(col)) for col in header]
+        rename = {}
+        for canonical, variants in self.columns.items():
+            for variant in variants:
+                if isinstance(variant, tuple):
+                    found = next((col for col, norm in normalized
+                                  if col not in rename and all(part in norm for part in variant)), None)
+                else:
+                    target = normalize_header(variant)
+                    found = next((col for col, norm in normalized if col not in rename and norm == target), None)
+                if found is not None:
+                    rename[found] = canonical
+                    break
+        if not all(col in rename.values() for col in self.required):
+            return None
+        return rename
+
+# Registro dei formati supportati, in ordine di priorità
+FORMAT_ADAPTERS = [
+    FormatAdapter(
+        name='Standard',
+        required=['DataPresenza', 'OraPresenza'],
+        columns={
+            'CodiceFiscale': ['CodiceFiscale'],
+            'DataPresenza': ['DataPresenza'],
+            'OraPresenza': ['OraPresenza'],
+            'Nome': ['Nome'],
+            'Cognome': ['Cognome'],
+            'Email': ['Email', 'recapito_ateneo'],
+            'DenominazioneAttività': ['DenominazioneAttività'],
+            'DenominazionePercorso': ['DenominazionePercorso', 'percoro'],
+            'CodicePercorso': ['CodicePercorso'],
+        },
+        dtypes={'CodiceFiscale': str, 'Nome': str, 'Cognome': str, 'Email': str, 'CodicePercorso': str},
+    ),
+    FormatAdapter(
+        name='Modulo con "Ora di inizio"',
+        required=['Ora di inizio'],
+        columns={
+            'ID': ['ID'],
+            'Ora di inizio': ['Ora di inizio'],
+            'Nome': ['Nome (del corsista)', 'nome2', 'Nome'],
+            'Cognome': ['Cognome (del corsista)', 'Cognome'],
+            'DenominazioneAttività': ["Denominazione dell'attività", "Denominazione dell'attività'",
+                                      'Denominazione dell attività', ('denominazione', 'attivit')],
+            'DenominazionePercorso': ['Tipo di percorso', 'Denominazione del percorso'],
+            'Email': ['Posta elettronica', 'Email', ('mail',)],
+        },
+        dtypes={'ID': str, 'Nome': str, 'Cognome': str, 'Email': str},
+        datetime_field='Ora di inizio',
+        fallback_columns={'CodiceFiscale': 'ID'},
+    ),
+]
+
+def read_header(uploaded_file):
+    """
+    Legge solo la riga di intestazione di un file Excel o CSV.
+
+    Args:
+        uploaded_file: File caricato (o percorso) con estensione xlsx, csv o txt
+
+    Returns:
+        Tuple (lista delle colonne, opzioni di lettura da riusare per il file completo)
+    """
+    file_name = getattr(uploaded_file, 'name', str(uploaded_file))
+    file_ext = file_name.split('.')[-1].lower()
+    if file_ext == 'xlsx':
+        if openpyxl is not None:
+            workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+            try:
+                # Primo foglio, lo stesso letto da pd.read_excel senza sheet_name
+                first_row = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+            header = [col for col in first_row if col is not None]
+        else:
+            header = pd.read_excel(uploaded_file, nrows=0).columns.tolist()
+        _rewind(uploaded_file)
+        return [str(col) for col in header], {}
+
+    for options in CSV_READ_OPTIONS:
+        try:
+            header = pd.read_csv(uploaded_file, nrows=0, **options).columns.tolist()
+        except UnicodeDecodeError:
+            _rewind(uploaded_file)
+            continue
+        _rewind(uploaded_file)
+        # Un'unica colonna che contiene ';' indica il separatore sbagliato
+        if options['sep'] == ',' and len(header) == 1 and ';' in header[0]:
+            continue
+        return header, options
+    raise ValueError("impossibile leggere l'intestazione del file")
+
+def _rewind(uploaded_file):
+    if hasattr(uploaded_file, 'seek'):
+        uploaded_file.seek(0)
+
+def detect_format(header):
+    """
+    Individua il primo formato del registro compatibile con l'intestazione.
+
+    Returns:
+        Tuple (FormatAdapter, dizionario {colonna del file: colonna canonica}), o (None, None)
+    """
+    for adapter in FORMAT_ADAPTERS:
+        rename = adapter.resolve(header)
+        if rename is not None:
+            return adapter, rename
+    return None, None
+
+def read_with_format(uploaded_file, adapter, rename, read_options):
+    """
+    Legge il file completo con i tipi dichiarati per le colonne riconosciute dal formato
+    e le rinomina con i nomi canonici; le altre colonne del file restano invariate.
+
+    Args:
+        uploaded_file: File caricato
+        adapter: FormatAdapter riconosciuto da detect_format
+        rename: Dizionario {colonna del file: colonna canonica}
+        read_options: Opzioni di lettura restituite da read_header (vuote per Excel)
+
+    Returns:
+        DataFrame con le colonne canoniche e quelle non riconosciute
+    """
+    dtypes = {col: adapter.dtypes[canonical] for col, canonical in rename.items() if canonical in adapter.dtypes}
+    file_name = getattr(uploaded_file, 'name', str(uploaded_file))
+    if file_name.split('.')[-1].lower() == 'xlsx':
+        df = pd.read_excel(uploaded_file, dtype=dtypes)
+    else:
+        df = pd.read_csv(uploaded_file, dtype=dtypes, **read_options)
+    return _apply_format(df, adapter, rename)
+
+def _apply_format(df, adapter, rename):
+    """Rinomina le colonne con i nomi canonici e aggiunge le colonne sostitutive del formato."""
+    # Una colonna non riconosciuta con lo stesso nome di una colonna canonica (es. 'Nome' accanto
+    # a 'Nome (del corsista)') lascia il posto a quella abbinata dal formato
+    clashing = [col for col in df.columns if col not in rename and col in rename.values()]
+    df = df.drop(columns=clashing).rename(columns=rename)
+    for missing, source in adapter.fallback_columns.items():
+        if missing not in df.columns and source in df.columns:
+            df[missing] = df[source]
+    return df
+
+def read_sheet_headers(content):
+    """
+    Elenca i fogli di una cartella di lavoro Excel con la rispettiva intestazione,
+    leggendo solo i metadati e la prima riga di ogni foglio.
+
+    Args:
+        content: Contenuto binario del file xlsx
+
+    Returns:
+        Lista di tuple (nome del foglio, lista delle colonne)
+    """
+    if openpyxl is None:
+        with pd.ExcelFile(BytesIO(content)) as workbook:
+            return [(name, [str(c) for c in workbook.parse(name, nrows=0).columns]) for name in workbook.sheet_names]
+    workbook = openpyxl.load_workbook(BytesIO(content), read_only=True, data_only=True)
+    try:
+        sheets = []
+        for sheet in workbook.worksheets:
+            first_row = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            sheets.append((sheet.title, [str(col) for col in first_row if col is not None]))
+        return sheets
+    finally:
+        workbook.close()
+
+def _read_sheet(content, sheet_name, adapter, rename):
+    """Legge un singolo foglio con i tipi del formato riconosciuto (eseguita nei worker)."""
+    dtypes = {col: adapter.dtypes[canonical] for col, canonical in rename.items() if canonical in adapter.dtypes}
+    df = pd.read_excel(BytesIO(content), sheet_name=sheet_name, dtype=dtypes)
+    return _apply_format(df, adapter, rename)
+
+def read_workbook_sheets(uploaded_file, max_workers=MAX_SHEET_WORKERS, prepare_sheet=None):
+    """
+    Legge tutti i fogli di una cartella di lavoro Excel: il formato di ogni foglio è
+    riconosciuto dall'intestazione tramite il registro dei formati, i fogli riconosciuti
+    sono letti in processi paralleli e combinati in un unico DataFrame con la colonna di
+    provenienza SourceSheet (categorica). Ogni foglio può essere preparato secondo il
+    proprio formato prima della combinazione (es. separazione del campo data/ora),
+    perché fogli di formati diversi possono avere colonne diverse.
+
+    Args:
+        uploaded_file: File xlsx caricato
+        max_workers: Numero massimo di processi che leggono i fogli contemporaneamente
+        prepare_sheet: Funzione (DataFrame, FormatAdapter) -> DataFrame applicata a ogni foglio letto
+
+    Returns:
+        Tuple (DataFrame combinato o None se nessun foglio è riconosciuto,
+        lista di tuple (foglio, nome del formato o None, righe lette))
+    """
+    content = uploaded_file.getvalue() if hasattr(uploaded_file, 'getvalue') else uploaded_file.read()
+    jobs = []
+    report = []
+    for sheet_name, header in read_sheet_headers(content):
+        adapter, rename = detect_format(header) if header else (None, None)
+        if adapter is None:
+            report.append((sheet_name, None, 0))
+        else:
+            jobs.append((sheet_name, adapter, rename))
+
+    if not jobs:
+        return None, report
+
+    # openpyxl è Python puro e tiene il GIL: i fogli sono letti in processi separati, ciascuno
+    # da un proprio buffer ('spawn' perché il server Streamlit è multithread). Con un solo
+    # foglio o una sola CPU i fogli sono letti in sequenza, senza il costo di avvio dei processi.
+    workers = min(max_workers, len(jobs), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            frames = list(executor.map(_read_sheet, repeat(content), *zip(*jobs)))
+    else:
+        frames = [_read_sheet(content, *job) for job in jobs]
+
+    for (sheet_name, adapter, _), frame in zip(jobs, frames):
+        report.append((sheet_name, adapter.name, len(frame)))
+    if prepare_sheet is not None:
+        frames = [prepare_sheet(frame, adapter) for (_, adapter, _), frame in zip(jobs, frames)]
+
+    combined = pd.concat(frames, ignore_index=True)
+    sheet_names = [sheet_name for sheet_name, _, _ in jobs]
+    codes = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+    combined['SourceSheet'] = pd.Categorical.from_codes(codes, categories=sheet_names)
+    return combined, report
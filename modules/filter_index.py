@@ -0,0 +1,150 @@
+# Indice dei filtri: posizioni delle righe per ogni valore delle colonne filtrabili
+import numpy as np
+import pandas as pd
+
+class FilterIndex:
+    """
+    Indice invertito su alcune colonne di un DataFrame.
+    Per ogni valore di ciascuna colonna conserva l'array ordinato delle posizioni
+    delle righe che lo contengono, così che i filtri a cascata si risolvano
+    come intersezioni di array di posizioni, senza copiare né riscandire il
+    DataFrame. Solo la selezione finale va materializzata (es. con `df.iloc`).
+
+    L'indice va costruito una volta per versione del dataset e trattato in sola lettura.
+    """
+
+    def __init__(self, df, columns):
+        """
+        Args:
+            df: DataFrame da indicizzare
+            columns: Colonne su cui costruire l'indice (quelle assenti vengono ignorate)
+        """
+        self.n_rows = len(df)
+        self._codes = {}
+        self._uniques = {}
+        self._order = {}
+        self._offsets = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            # Codici ordinati per valore; NaN/None ricevono il codice -1 e non sono indicizzati
+            try:
+                codes, uniques = pd.factorize(df[col], sort=True)
+            except TypeError:
+                # Valori non confrontabili tra loro (tipi misti): indice senza ordinamento dei valori
+                codes, uniques = pd.factorize(df[col])
+            codes = np.asarray(codes, dtype=np.int64)
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            missing = int((codes < 0).sum())
+            offsets = np.empty(len(uniques) + 1, dtype=np.int64)
+            offsets[0] = missing
+            np.cumsum(counts, out=offsets[1:])
+            offsets[1:] += missing
+            self._codes[col] = codes
+            self._uniques[col] = pd.Index(uniques)
+            self._order[col] = order
+            self._offsets[col] = offsets
+
+    def has_column(self, col):
+        """Indica se la colonna è presente nell'indice."""
+        return col in self._codes
+
+    def all_positions(self):
+        """Restituisce le posizioni di tutte le righe."""
+        return np.arange(self.n_rows, dtype=np.int64)
+
+    def positions(self, col, value):
+        """
+        Restituisce le posizioni (ordinate) delle righe in cui `col` vale `value`.
+
+        Args:
+            col: Colonna indicizzata
+            value: Valore cercato
+
+        Returns:
+            Array numpy di posizioni (vuoto se il valore non esiste)
+        """
+        code = self._uniques[col].get_indexer([value])[0]
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self._offsets[col]
+        # L'argsort stabile mantiene le posizioni di ogni valore già in ordine crescente
+        return self._order[col][offsets[code]:offsets[code + 1]]
+
+    def positions_for_values(self, col, values):
+        """
+        Restituisce le posizioni (ordinate) delle righe in cui `col` assume uno qualsiasi dei valori indicati.
+
+        Args:
+            col: Colonna indicizzata
+            values: Sequenza di valori cercati
+
+        Returns:
+            Array numpy di posizioni
+        """
+        codes = self._uniques[col].get_indexer(list(values))
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = self._offsets[col]
+        order = self._order[col]
+        chunks = [order[offsets[c]:offsets[c + 1]] for c in codes]
+        return np.sort(np.concatenate(chunks))
+
+    def values(self, col, positions=None):
+        """
+        Restituisce i valori distinti (ordinati) di `col` presenti nelle posizioni indicate.
+
+        Args:
+            col: Colonna indicizzata
+            positions: Posizioni da considerare (tutte le righe se None)
+
+        Returns:
+            Lista dei valori distinti, esclusi i mancanti
+        """
+        codes = self._codes[col] if positions is None else self._codes[col][positions]
+        present = np.unique(codes[codes >= 0])
+        return self._uniques[col][present].tolist()
+
+    def count(self, col, value, positions=None):
+        """Conta le righe con `col == value`, eventualmente limitate alle posizioni indicate."""
+        matches = self.positions(col, value)
+        if positions is None:
+            return len(matches)
+        return len(intersect_positions(positions, matches))
+
+def intersect_positions(left, right):
+    """Interseca due array ordinati di posizioni (filtro a cascata)."""
+    return np.intersect1d(left, right, assume_unique=True)
+
+def build_filter_index(df, columns):
+    """
+    Costruisce un FilterIndex sulle colonne indicate.
+    Pensata per essere memoizzata per versione del dataset (vedi modules.dataset_cache).
+    """
+    return FilterIndex(df, columns)
+
+def sorted_positions(df, sort_col=None, ascending=True):
+    """
+    Restituisce le posizioni delle righe di `df` ordinate per `sort_col`.
+    Pensata per essere memoizzata per versione del dataset, così che cambiare
+    pagina non richieda un nuovo ordinamento.
+
+    Args:
+        df: DataFrame da ordinare
+        sort_col: Colonna di ordinamento (None per l'ordine originale)
+        ascending: Ordinamento crescente o decrescente
+
+    Returns:
+        Array numpy di posizioni
+    """
+    values = df[sort_col].reset_index(drop=True) if sort_col in df.columns else None
+    if values is None:
+        return pd.RangeIndex(len(df)).to_numpy()
+    try:
+        ordered = values.sort_values(ascending=ascending, kind='stable', na_position='last')
+    except TypeError:
+        # Tipi misti non confrontabili: si ordina sulla rappresentazione testuale
+        ordered = values.astype(str).sort_values(ascending=ascending, kind='stable')
+    return ordered.index.to_numpy()
@@ -0,0 +1,182 @@
+# Impronte a 64 bit dei singoli record: identificativi stabili tra un caricamento e l'altro
+import hashlib
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+RECORD_HASH_COL = 'HashRecord'
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'registro_record')
+PREVIOUS_UPLOAD_FILE = 'caricamento_precedente.npy'
+LAST_UPLOAD_FILE = 'ultimo_caricamento.npy'
+REMOVED_FILE = 'rimozioni.npy'
+# Provenienze (insiemi di file) di cui si conserva il registro
+MAX_RECORD_LINEAGES = 20
+
+def compute_record_hashes(df):
+    """
+    Calcola in modo vettoriale l'impronta a 64 bit di ogni record a partire dal suo
+    contenuto: CodiceFiscale (o, se mancante, nome e cognome), attività e timestamp.
+    I record con contenuto identico ricevono impronte distinte in base all'ordine
+    di comparsa, così ogni riga ha un identificativo proprio.
+
+    Args:
+        df: DataFrame elaborato (output di load_data o load_multiple_files)
+
+    Returns:
+        Array numpy int64 con l'impronta di ogni riga
+    """
+    if df.empty:
+        return np.empty(0, dtype=np.int64)
+
+    def text(col, mode='upper'):
+        if col not in df.columns:
+            return pd.Series('', index=df.index, dtype=object)
+        values = df[col].astype('string').str.strip().fillna('')
+        return values.str.upper() if mode == 'upper' else values.str.lower()
+
+    person = text('CodiceFiscale')
+    missing_cf = person.isin(['', 'NAN', 'NONE', 'CFMANCANTE']).to_numpy()
+    if missing_cf.any():
+        names = 'NOME:' + text('Nome', 'lower') + '|' + text('Cognome', 'lower')
+        person = person.where(~missing_cf, names)
+
+    if 'TimestampPresenza' in df.columns:
+        timestamp = pd.to_datetime(df['TimestampPresenza'], errors='coerce')
+    else:
+        timestamp = pd.to_datetime(text('DataPresenza') + ' ' + text('OraPresenza'), errors='coerce', format='mixed')
+
+    content = pd.DataFrame({
+        'persona': person.to_numpy(dtype=object),
+        'attivita': text('DenominazioneAttività', 'lower').to_numpy(dtype=object),
+        'timestamp': timestamp.to_numpy(),
+    })
+    hashes = pd.util.hash_pandas_object(content, index=False)
+    occurrence = hashes.groupby(hashes.to_numpy()).cumcount()
+    if occurrence.any():
+        # Record ripetuti: l'impronta include il numero di occorrenza
+        repeated = occurrence.to_numpy() > 0
+        rehashed = pd.util.hash_pandas_object(
+            pd.DataFrame({'h': hashes.to_numpy()[repeated], 'n': occurrence.to_numpy()[repeated]}), index=False
+        )
+        hashes = hashes.to_numpy().copy()
+        hashes[repeated] = rehashed.to_numpy()
+    return np.asarray(hashes, dtype=np.uint64).view(np.int64)
+
+def diff_record_hashes(previous, current):
+    """
+    Confronta le impronte di due caricamenti.
+
+    Returns:
+        Dizionario con il numero di record nuovi, rimossi e invariati
+    """
+    unchanged = np.isin(current, previous)
+    return {
+        'nuovi': int((~unchanged).sum()),
+        'rimossi': int((~np.isin(previous, current)).sum()),
+        'invariati': int(unchanged.sum()),
+    }
+
+def record_lineage(file_names, all_sheets=False):
+    """
+    Chiave della provenienza di un caricamento: i nomi dei file (e la lettura di tutti i fogli).
+    I caricamenti successivi degli stessi file sono confrontati tra loro.
+    """
+    return ','.join(sorted(file_names)) + (':fogli' if all_sheets else '')
+
+def _lineage_dir(lineage):
+    return os.path.join(REGISTRY_DIR, hashlib.sha1(lineage.encode('utf-8')).hexdigest()[:16])
+
+def _prune_lineages(keep_dir):
+    """Mantiene su disco solo le cartelle delle MAX_RECORD_LINEAGES provenienze usate più di recente."""
+    try:
+        dirs = [os.path.join(REGISTRY_DIR, name) for name in os.listdir(REGISTRY_DIR)]
+    except OSError:
+        return
+    dirs = sorted((d for d in dirs if os.path.isdir(d) and d != keep_dir), key=os.path.getmtime, reverse=True)
+    for old_dir in dirs[MAX_RECORD_LINEAGES - 1:]:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+class RecordRegistry:
+    """
+    Registro su file delle impronte dei record di una provenienza (vedi record_lineage):
+    quelle del caricamento precedente e dell'ultimo, per confrontare i caricamenti,
+    e quelle dei record rimossi (es. duplicati), per proporre di riapplicare le
+    rimozioni quando gli stessi record vengono caricati di nuovo.
+    """
+
+    def __init__(self, registry_dir):
+        self.registry_dir = registry_dir
+        self._lock = threading.Lock()
+        self.previous_upload = self._read(PREVIOUS_UPLOAD_FILE)
+        self.last_upload = self._read(LAST_UPLOAD_FILE)
+        self.removed = self._read(REMOVED_FILE)
+
+    def _read(self, file_name):
+        path = os.path.join(self.registry_dir, file_name)
+        try:
+            return np.load(path).astype(np.int64) if os.path.exists(path) else None
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, file_name, hashes):
+        os.makedirs(self.registry_dir, exist_ok=True)
+        path = os.path.join(self.registry_dir, file_name)
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, hashes)
+        os.replace(path + '.tmp', path)
+        os.utime(self.registry_dir)
+        _prune_lineages(self.registry_dir)
+
+    def register_upload(self, hashes):
+        """
+        Registra le impronte di un nuovo caricamento. Se il contenuto coincide con
+        l'ultimo caricamento (es. stessi file ricaricati) il confronto resta quello
+        con il caricamento precedente. Le impronte rimosse di record non più presenti
+        escono dal registro, che resta limitato alla dimensione del dataset.
+
+        Returns:
+            Il confronto con il caricamento precedente (vedi diff_record_hashes), o None se è il primo
+        """
+        hashes = np.asarray(hashes, dtype=np.int64)
+        with self._lock:
+            if self.last_upload is None or not np.array_equal(np.unique(hashes), np.unique(self.last_upload)):
+                if self.last_upload is not None:
+                    self.previous_upload = self.last_upload
+                    self._write(PREVIOUS_UPLOAD_FILE, self.previous_upload)
+                self.last_upload = hashes
+                self._write(LAST_UPLOAD_FILE, self.last_upload)
+            if self.removed is not None:
+                still_present = self.removed[np.isin(self.removed, hashes)]
+                if len(still_present) < len(self.removed):
+                    self.removed = still_present
+                    self._write(REMOVED_FILE, still_present)
+            return diff_record_hashes(self.previous_upload, hashes) if self.previous_upload is not None else None
+
+    def removed_mask(self, hashes):
+        """Maschera dei record già rimossi in un caricamento precedente."""
+        with self._lock:
+            if self.removed is None or len(self.removed) == 0:
+                return np.zeros(len(hashes), dtype=bool)
+            return np.isin(hashes, self.removed)
+
+    def sync_removed(self, dataset_hashes, removed_hashes):
+        """
+        Aggiorna i record rimossi per un dataset: quelli del dataset non più rimossi
+        (es. rimozione annullata) escono dal registro, quelli rimossi vi entrano.
+        """
+        with self._lock:
+            current = self.removed if self.removed is not None else np.empty(0, dtype=np.int64)
+            kept = current[~np.isin(current, dataset_hashes)]
+            updated = np.union1d(kept, np.asarray(removed_hashes, dtype=np.int64))
+            if np.array_equal(updated, current):
+                return
+            self.removed = updated
+            self._write(REMOVED_FILE, updated)
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_RECORD_LINEAGES)
+def get_record_registry(lineage):
+    """Registro delle impronte dei record di una provenienza, condiviso tra le sessioni del processo."""
+    return RecordRegistry(_lineage_dir(lineage))
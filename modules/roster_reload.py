@@ -0,0 +1,59 @@
+# Aggiornamento incrementale dell'integrazione con gli iscritti quando cambia l'elenco iscritti_*.csv
+import streamlit as st
+from modules.data_loader import load_enrolled_students_data, rematch_students_incremental
+from modules.dataset_cache import aggregate_name, carry_over_aggregates
+from modules.enrollment_snapshots import find_enrolled_dir, get_enrollment_snapshots
+from modules.filter_index import build_filter_index, sorted_positions
+from modules.tombstones import publish_patched_dataset
+
+# Colonne che l'integrazione con gli iscritti può modificare
+ENROLLED_COLUMNS = ['CodiceFiscale', 'Email', 'Percorso', 'Codice_Classe_di_concorso',
+                    'Codice_classe_di_concorso_e_denominazione', 'Dipartimento', 'LogonName', 'Matricola']
+
+def _aggregate_updater(name, result, params):
+    """Riporta solo gli aggregati che non leggono le colonne degli iscritti; gli altri vengono ricalcolati."""
+    if name == aggregate_name(build_filter_index):
+        return result if not set(params.get('columns', ())) & set(ENROLLED_COLUMNS) else None
+    if name == aggregate_name(sorted_positions):
+        return result if params.get('sort_col') not in ENROLLED_COLUMNS else None
+    return None
+
+def apply_roster_changes():
+    """
+    Se è stata pubblicata una nuova istantanea degli iscritti dopo il caricamento dei
+    dati della sessione, aggiorna l'integrazione confrontando il nuovo elenco con
+    quello usato (vedi rematch_students_incremental), senza rileggere le presenze.
+
+    Returns:
+        Dizionario con le statistiche dell'aggiornamento, o None se l'elenco non è cambiato
+    """
+    df = st.session_state.get('processed_df')
+    enrolled_dir = find_enrolled_dir()
+    if df is None or enrolled_dir is None:
+        return None
+    snapshots = get_enrollment_snapshots()
+    ingested = snapshots.refresh(enrolled_dir)
+    loaded_version = st.session_state.get('enrolled_roster_version')
+    if snapshots.version is None or snapshots.version == loaded_version:
+        return None
+    st.session_state.enrolled_roster_version = snapshots.version
+    if loaded_version is None and not ingested:
+        # Dati caricati senza elenco degli iscritti registrato: nulla da confrontare
+        return None
+
+    previous_roster = snapshots.roster_for(loaded_version) if loaded_version is not None else None
+    enrolled_df = load_enrolled_students_data()
+    if enrolled_df.empty:
+        return None
+
+    stats = {}
+    def patch(data):
+        patched, stats_patch = rematch_students_incremental(data, enrolled_df, previous_roster)
+        stats.update(stats_patch)
+        return patched
+
+    previous_version = publish_patched_dataset(patch)
+    carry_over_aggregates(previous_version, _aggregate_updater)
+    st.info(f"Elenco iscritti aggiornato: attributi aggiornati per {stats.get('aggiornate', 0)} record, "
+            f"{stats.get('abbinate', 0)} nuovi abbinamenti su {stats.get('riesaminate', 0)} record senza corrispondenza.")
+    return stats
@@ -0,0 +1,252 @@
+# Indici di ricerca testuale: n-grammi di caratteri e ricerca studenti
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from difflib import SequenceMatcher
+import numpy as np
+import pandas as pd
+from modules.utils import map_unique, normalize_name_advanced
+
+NGRAM_SIZE = 3
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """
+    Restituisce l'insieme degli n-grammi di caratteri di una stringa.
+    Le stringhe più corte di n producono un solo n-gramma (la stringa stessa).
+    """
+    if not text:
+        return set()
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class NGramIndex:
+    """
+    Indice invertito n-gramma -> identificativi dei documenti.
+    Restituisce i candidati che condividono n-grammi con la query, con il
+    numero di n-grammi in comune, senza confrontare la query con tutti i documenti.
+    """
+
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self._postings = defaultdict(set)
+        self._ngram_counts = {}
+
+    def add(self, doc_id, text):
+        """Indicizza il testo `text` sotto l'identificativo `doc_id`."""
+        grams = char_ngrams(text, self.n)
+        for gram in grams:
+            self._postings[gram].add(doc_id)
+        self._ngram_counts[doc_id] = self._ngram_counts.get(doc_id, 0) + len(grams)
+
+    def candidates(self, text):
+        """
+        Restituisce i documenti che condividono almeno un n-gramma con `text`.
+
+        Returns:
+            Tuple (dizionario {doc_id: n-grammi in comune}, numero di n-grammi della query)
+        """
+        grams = char_ngrams(text, self.n)
+        shared = defaultdict(int)
+        for gram in grams:
+            for doc_id in self._postings.get(gram, ()):
+                shared[doc_id] += 1
+        return shared, len(grams)
+
+    def ngram_count(self, doc_id):
+        """Numero di n-grammi indicizzati per il documento."""
+        return self._ngram_counts.get(doc_id, 0)
+
+def _split_tokens(text):
+    """Divide un testo normalizzato in token (spazi, punti, chiocciole, trattini)."""
+    return [t for t in re.split(r'[\s@._\-]+', text) if t]
+
+class StudentSearchIndex:
+    """
+    Indice di ricerca degli studenti di un dataset, costruito una volta per versione.
+    Per ogni studente (identificato dal Codice Fiscale) conserva l'etichetta
+    'Cognome Nome (CF)' e i token normalizzati di nome, cognome, CodiceFiscale,
+    Matricola ed email. La ricerca combina un indice per prefisso (token ordinati
+    + ricerca binaria) e un indice di trigrammi per le corrispondenze parziali
+    all'interno delle parole.
+    """
+
+    # Punteggi per tipo di corrispondenza di un termine della query
+    SCORE_EXACT = 3.0
+    SCORE_PREFIX = 2.0
+    MIN_NGRAM_SIMILARITY = 0.6
+
+    def __init__(self, df, cf_column='CodiceFiscale'):
+        """
+        Args:
+            df: DataFrame con almeno la colonna del codice fiscale (Nome, Cognome, Matricola, Email opzionali)
+            cf_column: Nome della colonna del codice fiscale
+        """
+        if df is None or df.empty or cf_column not in df.columns:
+            students = pd.DataFrame(columns=[cf_column])
+        else:
+            cols = [c for c in [cf_column, 'Nome', 'Cognome', 'Matricola', 'Email'] if c in df.columns]
+            students = df[cols].dropna(subset=[cf_column]).drop_duplicates(subset=[cf_column])
+
+        def text_col(col):
+            if col in students.columns:
+                return students[col].fillna('').astype(str)
+            return pd.Series('', index=students.index)
+
+        self.cf = text_col(cf_column).to_numpy(dtype=object)
+        self.labels = (text_col('Cognome') + ' ' + text_col('Nome') + ' (' + self.cf + ')').str.strip().to_numpy(dtype=object)
+        self._position_by_cf = {cf: i for i, cf in enumerate(self.cf)}
+
+        # Testo normalizzato per campo: nomi con normalize_name_advanced, identificativi in minuscolo
+        nome_norm = map_unique(text_col('Nome'), normalize_name_advanced)
+        cognome_norm = map_unique(text_col('Cognome'), normalize_name_advanced)
+        cf_norm = text_col(cf_column).str.lower().str.strip()
+        matricola_norm = text_col('Matricola').str.lower().str.strip()
+        # Dell'email si indicizza solo la parte locale: il dominio è comune a tutti gli studenti
+        email_norm = text_col('Email').str.lower().str.strip().str.split('@').str[0].fillna('')
+
+        tokens = []
+        self._ngrams = NGramIndex()
+        for i, fields in enumerate(zip(nome_norm, cognome_norm, cf_norm, matricola_norm, email_norm)):
+            student_tokens = set()
+            for field in fields:
+                student_tokens.update(_split_tokens(field))
+            for token in student_tokens:
+                tokens.append((token, i))
+                self._ngrams.add(i, token)
+        tokens.sort()
+        self._tokens = [t for t, _ in tokens]
+        self._token_students = np.array([i for _, i in tokens], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.cf)
+
+    def label_for(self, cf):
+        """Restituisce l'etichetta dello studente con il codice fiscale indicato (None se assente)."""
+        pos = self._position_by_cf.get(cf)
+        return None if pos is None else self.labels[pos]
+
+    def labels_for(self, cfs):
+        """Restituisce le etichette ordinate degli studenti con i codici fiscali indicati."""
+        return sorted(self.labels[self._position_by_cf[cf]] for cf in cfs if cf in self._position_by_cf)
+
+    def _term_scores(self, term):
+        """Punteggio di ogni studente per un singolo termine della query."""
+        scores = {}
+        # 1. Prefisso (o corrispondenza esatta) sui token ordinati
+        start = bisect_left(self._tokens, term)
+        end = bisect_left(self._tokens, term + '\uffff')
+        for k in range(start, end):
+            student = int(self._token_students[k])
+            score = self.SCORE_EXACT if self._tokens[k] == term else self.SCORE_PREFIX
+            if score > scores.get(student, 0):
+                scores[student] = score
+        # 2. Trigrammi per le corrispondenze all'interno delle parole
+        if len(term) >= NGRAM_SIZE:
+            shared, query_grams = self._ngrams.candidates(term)
+            for student, count in shared.items():
+                similarity = count / query_grams
+                if similarity >= self.MIN_NGRAM_SIMILARITY and similarity > scores.get(student, 0):
+                    scores[student] = similarity
+        return scores
+
+    def search_cfs(self, query, restrict_cfs=None, limit=None):
+        """
+        Cerca gli studenti che corrispondono a tutti i termini della query.
+
+        Args:
+            query: Testo cercato (nome, cognome, CF, matricola o email, anche parziali)
+            restrict_cfs: Insieme opzionale di codici fiscali a cui limitare i risultati
+            limit: Numero massimo di risultati (tutti se None)
+
+        Returns:
+            Lista di codici fiscali ordinati per rilevanza decrescente
+        """
+        terms = []
+        for part in _split_tokens(str(query).lower()):
+            terms.extend(_split_tokens(normalize_name_advanced(part) or part))
+        if not terms:
+            return []
+
+        total = None
+        for term in terms:
+            scores = self._term_scores(term)
+            if total is None:
+                total = scores
+            else:
+                total = {s: total[s] + v for s, v in scores.items() if s in total}
+            if not total:
+                return []
+
+        if restrict_cfs is not None:
+            restrict_cfs = set(restrict_cfs)
+            total = {s: v for s, v in total.items() if self.cf[s] in restrict_cfs}
+
+        ranked = sorted(total.items(), key=lambda item: (-item[1], self.labels[item[0]]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self.cf[s] for s, _ in ranked]
+
+    def search(self, query, restrict_cfs=None, limit=None):
+        """Come search_cfs, ma restituisce le etichette 'Cognome Nome (CF)' degli studenti trovati."""
+        return [self.label_for(cf) for cf in self.search_cfs(query, restrict_cfs=restrict_cfs, limit=limit)]
+
+class FuzzyNameMatcher:
+    """
+    Abbinamento approssimato di nomi completi (nome + cognome normalizzati) a un elenco
+    di riferimento, ad esempio gli iscritti. I candidati vengono recuperati da un indice
+    di trigrammi e solo su di essi si calcola la similarità (SequenceMatcher), evitando
+    il confronto con tutto l'elenco.
+    """
+
+    # Frazione minima di trigrammi della query condivisi da un candidato
+    MIN_SHARED_NGRAMS = 0.5
+    # Numero massimo di candidati valutati per nome
+    MAX_CANDIDATES = 20
+
+    def __init__(self, names, min_score=0.85):
+        """
+        Args:
+            names: Sequenza di nomi completi normalizzati (la posizione è l'identificativo restituito)
+            min_score: Similarità minima (0-1) per accettare un abbinamento
+        """
+        self.names = list(names)
+        self.min_score = min_score
+        self._ngrams = NGramIndex()
+        for i, name in enumerate(self.names):
+            if name:
+                self._ngrams.add(i, name)
+
+    def match(self, name):
+        """
+        Cerca il nome di riferimento più simile.
+
+        Args:
+            name: Nome completo normalizzato da abbinare
+
+        Returns:
+            Tuple (posizione del nome abbinato, punteggio) oppure (None, punteggio migliore) se sotto soglia
+        """
+        if not name:
+            return None, 0.0
+        shared, query_grams = self._ngrams.candidates(name)
+        if not query_grams:
+            return None, 0.0
+        min_shared = self.MIN_SHARED_NGRAMS * query_grams
+        candidates = sorted((c for c, count in shared.items() if count >= min_shared),
+                            key=lambda c: -shared[c])[:self.MAX_CANDIDATES]
+        best_pos, best_score = None, 0.0
+        for pos in candidates:
+            score = SequenceMatcher(None, name, self.names[pos]).ratio()
+            if score > best_score:
+                best_pos, best_score = pos, score
+        if best_score < self.min_score:
+            return None, best_score
+        return best_pos, best_score
+
+def build_student_search_index(df):
+    """
+    Costruisce lo StudentSearchIndex del dataset.
+    Pensata per essere memoizzata per versione del dataset (vedi modules.dataset_cache).
+    """
+    return StudentSearchIndex(df)
@@ -0,0 +1,222 @@
+# Motore SQL incorporato per interrogare presenze, iscritti e CFU
+# Usa DuckDB se installato (più veloce sulle aggregazioni tra più tabelle), altrimenti sqlite3 della libreria standard
+import re
+import sqlite3
+import threading
+import time
+import pandas as pd
+from modules.data_loader import load_cfu_data, load_enrolled_students_data
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+SQL_BACKEND = 'DuckDB' if duckdb is not None else 'SQLite'
+# Righe lette per blocco quando si scorrono i risultati di una query
+FETCH_CHUNK_ROWS = 10000
+
+# Tempo massimo di esecuzione di una query, oltre il quale viene interrotta
+QUERY_TIMEOUT_SECONDS = 30
+# Istruzioni SQLite eseguite tra un controllo e l'altro del tempo massimo
+SQLITE_PROGRESS_STEPS = 10000
+
+# Sono ammesse solo interrogazioni in lettura (un solo statement SELECT o WITH ... SELECT);
+# il tipo di statement è verificato poi dal motore (vedi SqlEngine)
+_READ_ONLY_PATTERN = re.compile(r'^\s*(select|with)\b', re.IGNORECASE)
+# Azioni SQLite consentite dall'autorizzatore: sola lettura delle tabelle registrate
+_SQLITE_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+# Letterali stringa ('...') e identificatori tra virgolette ("..."), con gli apici raddoppiati come escape
+_QUOTED_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+def _strip_sql_comments(sql):
+    """Rimuove i commenti SQL (-- ... e /* ... */) da una query."""
+    sql = re.sub(r'/\*.*?\*/', ' ', sql, flags=re.DOTALL)
+    return re.sub(r'--[^\n]*', ' ', sql)
+
+def _strip_quoted(sql):
+    """Sostituisce letterali e identificatori tra virgolette con un segnaposto, per i controlli sulla struttura."""
+    return _QUOTED_PATTERN.sub(' _ ', sql)
+
+def validate_select_query(sql):
+    """
+    Verifica che la query sia una singola interrogazione in lettura.
+
+    Args:
+        sql: Testo della query
+
+    Returns:
+        La query ripulita (senza commenti né ';' finale)
+
+    Raises:
+        ValueError: Se la query è vuota, contiene più statement o non è una SELECT
+    """
+    cleaned = _strip_sql_comments(sql or '').strip().rstrip(';').strip()
+    if not cleaned:
+        raise ValueError("La query è vuota.")
+    # I controlli ignorano il contenuto di stringhe e identificatori tra virgolette (es. SELECT 'a;b')
+    structure = _strip_quoted(cleaned)
+    if ';' in structure:
+        raise ValueError("È consentita una sola query per volta.")
+    if not _READ_ONLY_PATTERN.match(structure):
+        raise ValueError("Sono consentite solo query di lettura (SELECT o WITH ... SELECT).")
+    return cleaned
+
+def _duckdb_interrupt_errors():
+    """Eccezioni sollevate da DuckDB quando una query viene interrotta."""
+    return (duckdb.InterruptException,) if duckdb is not None else ()
+
+def _to_sqlite_frame(df):
+    """Prepara un DataFrame per sqlite3: date e orari in colonne object diventano stringhe ISO."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v.isoformat() if hasattr(v, 'isoformat') else v)
+    return df
+
+class SqlEngine:
+    """
+    Connessione SQL in memoria con le tabelle del dataset registrate:
+    con DuckDB i DataFrame sono letti direttamente (senza copia), con SQLite
+    vengono caricati una volta nel database in memoria. Va costruita una volta
+    per versione del dataset e usata solo in lettura.
+    """
+
+    def __init__(self, tables):
+        """
+        Args:
+            tables: Dizionario {nome tabella: DataFrame}
+        """
+        self.backend = SQL_BACKEND
+        self._lock = threading.Lock()
+        self.tables = {}
+        if duckdb is not None:
+            # Nessun accesso a file o rete (read_csv, read_text, ATTACH, ...): si leggono solo le tabelle registrate
+            self._con = duckdb.connect(database=':memory:', config={'enable_external_access': False})
+            for name, df in tables.items():
+                if df is None:
+                    continue
+                try:
+                    self._con.register(name, df)
+                except Exception:
+                    # Tipi misti non riconosciuti: registra una copia con le colonne object come stringhe
+                    self._con.register(name, df.astype({c: str for c in df.columns if df[c].dtype == object}))
+                self.tables[name] = list(df.columns)
+            # La configurazione non può più essere modificata dalle query
+            self._con.execute('SET lock_configuration = true')
+        else:
+            self._con = sqlite3.connect(':memory:', check_same_thread=False)
+            for name, df in tables.items():
+                if df is None:
+                    continue
+                _to_sqlite_frame(df).to_sql(name, self._con, index=False)
+                self.tables[name] = list(df.columns)
+            self._con.execute('PRAGMA query_only = ON')
+            # Solo letture: nega tra l'altro ATTACH, PRAGMA e scritture anche dopo un WITH iniziale
+            self._con.set_authorizer(
+                lambda action, *args: sqlite3.SQLITE_OK if action in _SQLITE_ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+            )
+
+    def iter_query(self, sql, chunk_rows=FETCH_CHUNK_ROWS, timeout=QUERY_TIMEOUT_SECONDS):
+        """
+        Esegue una query di lettura e restituisce i risultati a blocchi di DataFrame,
+        senza materializzare l'intero risultato. La connessione è condivisa tra le
+        sessioni: la query viene interrotta se supera `timeout` secondi.
+
+        Args:
+            sql: Query SELECT
+            chunk_rows: Righe per blocco
+            timeout: Tempo massimo di esecuzione in secondi
+
+        Yields:
+            DataFrame con al più `chunk_rows` righe (almeno un blocco, eventualmente vuoto)
+
+        Raises:
+            ValueError: Se la query non è ammessa o supera il tempo massimo
+        """
+        query = validate_select_query(sql)
+        if self.backend == 'DuckDB':
+            # Controllo sul tipo di statement analizzato da DuckDB, oltre a quello sul testo
+            statements = duckdb.extract_statements(query)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise ValueError("Sono consentite solo query di lettura (SELECT o WITH ... SELECT).")
+        with self._lock:
+            # Le tabelle registrate in DuckDB sono visibili solo sulla connessione che le ha registrate
+            cursor = self._con if self.backend == 'DuckDB' else self._con.cursor()
+            deadline = time.monotonic() + timeout
+            if self.backend == 'DuckDB':
+                timer = threading.Timer(timeout, self._con.interrupt)
+                timer.daemon = True
+                timer.start()
+            else:
+                timer = None
+                # Un valore diverso da zero restituito dal gestore interrompe la query
+                self._con.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_STEPS)
+            try:
+                cursor.execute(query)
+                columns = [d[0] for d in cursor.description]
+                first = True
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows and not first:
+                        break
+                    first = False
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+                    if len(rows) < chunk_rows:
+                        break
+            except (sqlite3.OperationalError, *_duckdb_interrupt_errors()) as e:
+                if time.monotonic() > deadline:
+                    raise ValueError(f"La query ha superato il tempo massimo di {timeout} secondi ed è stata interrotta.") from e
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                else:
+                    self._con.set_progress_handler(None, 0)
+                if cursor is not self._con:
+                    cursor.close()
+
+    def query(self, sql, max_rows=None):
+        """
+        Esegue una query di lettura e ne restituisce il risultato.
+
+        Args:
+            sql: Query SELECT
+            max_rows: Numero massimo di righe da leggere (tutte se None)
+
+        Returns:
+            Tuple (DataFrame del risultato, True se il risultato è stato troncato a max_rows)
+        """
+        chunks = []
+        total = 0
+        truncated = False
+        chunk_rows = FETCH_CHUNK_ROWS if max_rows is None else max(1, min(FETCH_CHUNK_ROWS, max_rows + 1))
+        chunk_iter = self.iter_query(sql, chunk_rows=chunk_rows)
+        try:
+            for chunk in chunk_iter:
+                chunks.append(chunk)
+                total += len(chunk)
+                if max_rows is not None and total > max_rows:
+                    truncated = True
+                    break
+        finally:
+            # Rilascia subito la connessione anche se la lettura si è interrotta prima della fine
+            chunk_iter.close()
+        result = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        if truncated:
+            result = result.iloc[:max_rows]
+        return result, truncated
+
+def build_sql_engine(df):
+    """
+    Costruisce lo SqlEngine con le tabelle 'presenze' (dataset elaborato),
+    'iscritti' (studenti iscritti) e 'crediti' (CFU per attività).
+    Pensata per essere memoizzata per versione del dataset (vedi modules.dataset_cache).
+    """
+    enrolled_df = load_enrolled_students_data()
+    cfu_df = load_cfu_data()
+    return SqlEngine({
+        'presenze': df,
+        'iscritti': enrolled_df if enrolled_df is not None and not enrolled_df.empty else None,
+        'crediti': cfu_df if cfu_df is not None and not cfu_df.empty else None,
+    })
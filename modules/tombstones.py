@@ -0,0 +1,229 @@
+# Rimozione dei record tramite tombstone (bitmap delle righe eliminate) su un DataFrame base stabile
+import numpy as np
+import pandas as pd
+import streamlit as st
+from modules.dataset_cache import bump_dataset_version, get_dataset_version
+from modules.record_hashes import RECORD_HASH_COL, get_record_registry
+
+# Oltre questa frazione di righe eliminate viene proposta la compattazione del DataFrame base
+COMPACTION_RATIO = 0.5
+
+class TombstoneFrame:
+    """
+    DataFrame base in sola lettura con una bitmap delle righe eliminate.
+    Le rimozioni marcano le righe invece di copiare il DataFrame; la vista
+    delle righe attive viene materializzata solo quando richiesta e riusata
+    finché non cambia la bitmap. Ogni rimozione è un passo annullabile
+    (annulla/ripristina modificano solo la bitmap).
+    """
+
+    def __init__(self, base_df, compaction_ratio=COMPACTION_RATIO):
+        """
+        Args:
+            base_df: DataFrame di partenza (non viene mai modificato)
+            compaction_ratio: Frazione di righe eliminate oltre la quale proporre la compattazione
+        """
+        self.base = base_df
+        self.compaction_ratio = compaction_ratio
+        self._deleted = np.zeros(len(base_df), dtype=bool)
+        self._undo_stack = []
+        self._redo_stack = []
+        self._view = base_df
+
+    @property
+    def n_deleted(self):
+        """Numero di righe del base attualmente eliminate."""
+        return int(self._deleted.sum())
+
+    @property
+    def tombstone_ratio(self):
+        """Frazione di righe del base attualmente eliminate."""
+        return self.n_deleted / len(self._deleted) if len(self._deleted) else 0.0
+
+    @property
+    def needs_compaction(self):
+        """True se le righe eliminate superano la frazione oltre la quale conviene compattare il base."""
+        return self.tombstone_ratio > self.compaction_ratio
+
+    def view(self):
+        """Restituisce il DataFrame delle righe attive (calcolato una volta per stato della bitmap)."""
+        if self._view is None:
+            if self._deleted.any():
+                self._view = self.base.iloc[np.flatnonzero(~self._deleted)]
+            else:
+                self._view = self.base
+        return self._view
+
+    def _positions_for(self, index_labels):
+        """Posizioni nel base delle righe attive con gli indici indicati."""
+        return np.flatnonzero(self.base.index.isin(list(index_labels)) & ~self._deleted)
+
+    def delete(self, index_labels):
+        """
+        Elimina le righe con gli indici indicati (quelle già eliminate vengono ignorate).
+
+        Args:
+            index_labels: Indici (etichette) delle righe da eliminare
+
+        Returns:
+            Numero di righe effettivamente eliminate
+        """
+        positions = self._positions_for(index_labels)
+        if len(positions) == 0:
+            return 0
+        self._deleted[positions] = True
+        self._undo_stack.append(positions)
+        self._redo_stack.clear()
+        self._view = None
+        return len(positions)
+
+    def deleted_rows(self, last_step_only=True):
+        """
+        Restituisce le righe eliminate (dall'ultima rimozione o in totale),
+        lette dal base solo quando servono (es. per il report).
+        """
+        if last_step_only:
+            positions = self._undo_stack[-1] if self._undo_stack else np.empty(0, dtype=np.int64)
+        else:
+            positions = np.flatnonzero(self._deleted)
+        return self.base.iloc[positions]
+
+    def can_undo(self):
+        return bool(self._undo_stack)
+
+    def can_redo(self):
+        return bool(self._redo_stack)
+
+    def undo(self):
+        """Ripristina le righe dell'ultima rimozione. Restituisce il numero di righe ripristinate."""
+        if not self._undo_stack:
+            return 0
+        positions = self._undo_stack.pop()
+        self._deleted[positions] = False
+        self._redo_stack.append(positions)
+        self._view = None
+        return len(positions)
+
+    def redo(self):
+        """Riapplica l'ultima rimozione annullata. Restituisce il numero di righe eliminate."""
+        if not self._redo_stack:
+            return 0
+        positions = self._redo_stack.pop()
+        self._deleted[positions] = True
+        self._undo_stack.append(positions)
+        self._view = None
+        return len(positions)
+
+    def update_base(self, base_df):
+        """
+        Sostituisce il base con una versione con le stesse righe nello stesso ordine
+        (es. una colonna ricalcolata), conservando la bitmap e le rimozioni annullabili.
+        """
+        if len(base_df) != len(self._deleted):
+            raise ValueError("il nuovo base deve avere le stesse righe del precedente")
+        self.base = base_df
+        self._view = None
+
+    def compact(self):
+        """
+        Sostituisce il base con la vista delle righe attive e azzera la bitmap.
+        Le rimozioni precedenti non sono più annullabili: non viene mai eseguita in
+        automatico, ma solo come passo esplicito (vedi compact_tombstone_frame).
+        """
+        self.base = self.view()
+        self._deleted = np.zeros(len(self.base), dtype=bool)
+        self._undo_stack.clear()
+        self._redo_stack.clear()
+        self._view = self.base
+
+def get_tombstone_frame():
+    """
+    Restituisce il TombstoneFrame della sessione. Se `processed_df` è stato
+    sostituito (es. nuovo caricamento) il TombstoneFrame viene ricreato su di esso.
+    """
+    current_df = st.session_state.get('processed_df')
+    if current_df is None:
+        current_df = pd.DataFrame()
+    tombstones = st.session_state.get('processed_tombstones')
+    if tombstones is None or tombstones.view() is not current_df:
+        tombstones = TombstoneFrame(current_df)
+        st.session_state.processed_tombstones = tombstones
+    return tombstones
+
+def publish_tombstone_view(tombstones):
+    """
+    Pubblica la vista corrente del TombstoneFrame come `processed_df`,
+    invalida gli aggregati memoizzati per la versione precedente e aggiorna
+    il registro delle impronte dei record rimossi.
+    """
+    st.session_state.processed_df = tombstones.view()
+    bump_dataset_version()
+    _sync_removed_hashes(tombstones)
+
+def _sync_removed_hashes(tombstones):
+    """Registra per impronta le righe eliminate del base, per proporle di nuovo ai caricamenti successivi."""
+    lineage = st.session_state.get('record_lineage')
+    if lineage is not None and RECORD_HASH_COL in tombstones.base.columns:
+        get_record_registry(lineage).sync_removed(
+            tombstones.base[RECORD_HASH_COL].to_numpy(),
+            tombstones.deleted_rows(last_step_only=False)[RECORD_HASH_COL].to_numpy()
+        )
+
+def compact_tombstone_frame(tombstones):
+    """
+    Compatta il TombstoneFrame della sessione dopo aver registrato le impronte delle
+    righe eliminate, che escono dal base. Le rimozioni fatte non sono più annullabili.
+    La vista pubblicata non cambia, quindi la versione del dataset resta la stessa.
+
+    Returns:
+        Numero di righe eliminate definitivamente
+    """
+    _sync_removed_hashes(tombstones)
+    dropped = tombstones.n_deleted
+    tombstones.compact()
+    st.session_state.processed_df = tombstones.view()
+    return dropped
+
+def reapply_registered_removals():
+    """
+    Rimuove da `processed_df` i record già rimossi in un caricamento precedente degli
+    stessi file (vedi modules.record_hashes). La rimozione è un passo annullabile.
+
+    Returns:
+        Numero di record rimossi
+    """
+    df = st.session_state.get('processed_df')
+    lineage = st.session_state.get('record_lineage')
+    if df is None or lineage is None or RECORD_HASH_COL not in df.columns:
+        return 0
+    removed_mask = get_record_registry(lineage).removed_mask(df[RECORD_HASH_COL].to_numpy())
+    if not removed_mask.any():
+        return 0
+    tombstones = get_tombstone_frame()
+    removed = tombstones.delete(df.index[removed_mask])
+    publish_tombstone_view(tombstones)
+    return removed
+
+def publish_patched_dataset(patch):
+    """
+    Applica a `processed_df` una trasformazione che conserva righe e ordine
+    (es. colonne ricalcolate). Se ci sono rimozioni in corso la trasformazione
+    viene applicata al DataFrame base, conservando le rimozioni annullabili.
+
+    Args:
+        patch: Funzione patch(df) -> DataFrame con le stesse righe
+
+    Returns:
+        La versione del dataset precedente alla modifica
+    """
+    current_df = st.session_state.get('processed_df')
+    tombstones = st.session_state.get('processed_tombstones')
+    if tombstones is not None and tombstones.view() is current_df:
+        tombstones.update_base(patch(tombstones.base))
+        new_df = tombstones.view()
+    else:
+        new_df = patch(current_df)
+    previous_version = get_dataset_version()
+    st.session_state.processed_df = new_df
+    bump_dataset_version()
+    return previous_version
@@ -1,6 +1,7 @@
 # Interfaccia utente per la Tab 1 (Analisi Dati)
 import streamlit as st
 import pandas as pd
+from modules.ui.table_view import render_paginated_table
 
 def render_tab1(df_main):
     """Renderizza l'interfaccia della Tab 1: Analisi Dati"""
@@ -35,7 +36,8 @@ def render_tab1(df_main):
                           'CodicePercorso', 'CFU', 'TimestampPresenza']
                           
     cols_show_exist = [col for col in cols_show_preferred if col in df_main.columns]
-    st.dataframe(df_main[cols_show_exist], use_container_width=True)
+    # Tabella paginata: viene serializzata solo la pagina visibile
+    render_paginated_table(df_main, cols_show_exist, key="tab1_data", file_prefix="Dati_Presenze")
     
     st.caption("CFU: Crediti Formativi Universitari associati all'attività. " +
                "Percorso, Codice_Classe_di_concorso, ecc.: Dati integrati dal file degli studenti iscritti.")
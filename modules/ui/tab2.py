@@ -1,10 +1,13 @@
 # Interfaccia utente per la Tab 2 (Gestione Duplicati)
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from io import BytesIO
 # Importa il modulo duplicates per la gestione dei duplicati
-from modules.duplicates import detect_duplicate_records
+from modules.duplicates import detect_duplicate_records, DuplicateDetectionResult
+from modules.dataset_cache import bump_dataset_version, memoize_aggregate
+from modules.tombstones import compact_tombstone_frame, get_tombstone_frame, publish_tombstone_view
 
 def ensure_unique_columns(df):
     """
@@ -37,7 +40,7 @@ def render_tab2(df_main):
         st.session_state.duplicates_removed = False
     if 'duplicate_detection_results' not in st.session_state:
         # Inizializza con tuple di strutture vuote per evitare errori
-        st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+        st.session_state.duplicate_detection_results = DuplicateDetectionResult()
     if 'selected_indices_to_drop' not in st.session_state:
         st.session_state.selected_indices_to_drop = []
     if 'report_data_to_download' not in st.session_state:
@@ -47,34 +50,39 @@ def render_tab2(df_main):
     if 'processed_df' not in st.session_state:
         # Inizialmente punta a df_main o è None se df_main è None/vuoto
          st.session_state.processed_df = df_main.copy() if df_main is not None and not df_main.empty else pd.DataFrame()
+         bump_dataset_version()
          
+    render_undo_redo_controls()
+
     # Usa il dataframe processato se disponibile, altrimenti quello principale
     current_df = st.session_state.processed_df if not st.session_state.processed_df.empty else df_main
 
     # Esegui il rilevamento solo se non sono stati rimossi duplicati E non ci sono risultati esistenti validi
-    if not st.session_state.duplicates_removed and st.session_state.duplicate_detection_results[0].empty:
+    if not st.session_state.duplicates_removed and st.session_state.duplicate_detection_results.empty:
         if current_df is not None and not current_df.empty:
             with st.spinner("Rilevamento duplicati in corso..."):
                 # Assicura che le colonne necessarie esistano
                 required_dup_cols = ['TimestampPresenza', 'Nome', 'Cognome', 'DenominazioneAttività']
                 if all(col in current_df.columns for col in required_dup_cols):
-                     # Assicura colonne uniche prima del rilevamento
-                    df_per_detect = ensure_unique_columns(current_df.copy())
-                    st.session_state.duplicate_detection_results = detect_duplicate_records(df_per_detect)
+                     # Assicura colonne uniche prima del rilevamento (copia solo se ci sono colonne duplicate)
+                    df_per_detect = ensure_unique_columns(current_df.copy()) if current_df.columns.duplicated().any() else current_df
+                    # Risultato memoizzato per versione: condiviso tra le sessioni finché il dataset non viene modificato
+                    st.session_state.duplicate_detection_results = memoize_aggregate(detect_duplicate_records, df_per_detect, compact=True)
                 else:
                     missing_cols = [col for col in required_dup_cols if col not in current_df.columns]
                     st.warning(f"Colonne necessarie per il rilevamento duplicati ({', '.join(missing_cols)}) non trovate nel DataFrame.")
-                    st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+                    st.session_state.duplicate_detection_results = DuplicateDetectionResult()
         else:
              # Se il dataframe è vuoto, resetta i risultati
-             st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+             st.session_state.duplicate_detection_results = DuplicateDetectionResult()
 
-    # Estrai i risultati dal session state
-    duplicates_df_display, involved_indices, indices_to_drop_suggested = st.session_state.duplicate_detection_results
-    duplicates_found = not duplicates_df_display.empty
+    # Estrai i risultati (compatti) dal session state: i DataFrame si materializzano solo quando servono
+    detection = st.session_state.duplicate_detection_results
+    duplicates_found = not detection.empty
 
     if duplicates_found and not st.session_state.duplicates_removed:
-        st.warning(f"Trovati **{len(duplicates_df_display)}** record potenzialmente duplicati in **{duplicates_df_display['GruppoDuplicati'].nunique()}** cluster.")
+        indices_to_drop_suggested = detection.indices_to_drop(current_df)
+        st.warning(f"Trovati **{len(detection)}** record potenzialmente duplicati in **{detection.n_groups}** cluster.")
         st.markdown("---")
         
         # --- Sezione Azione Rapida ---
@@ -104,28 +112,9 @@ def render_tab2(df_main):
                         with st.spinner(f"Eliminazione di {num_valid_to_remove} record e preparazione report..."):
                             # 1. Prepara il report PRIMA di modificare il dataframe
                             df_deleted_report = current_df_auto.loc[valid_indices_to_remove_auto].copy()
-                            duplicates_df_display_report = st.session_state.duplicate_detection_results[0] # Usa i risultati del rilevamento corrente
-                            
-                            # Aggiungi 'GruppoDuplicati' al report, se possibile
-                            if not duplicates_df_display_report.empty and 'GruppoDuplicati' in duplicates_df_display_report.columns:
-                                try:
-                                    # Assicurati che gli indici esistano nel df dei duplicati
-                                    valid_report_indices = duplicates_df_display_report.index.intersection(valid_indices_to_remove_auto)
-                                    if not valid_report_indices.empty:
-                                         # Assegna il GruppoDuplicati solo per gli indici validi trovati
-                                         df_deleted_report['GruppoDuplicati'] = duplicates_df_display_report.loc[valid_report_indices, 'GruppoDuplicati']
-                                    else:
-                                         df_deleted_report['GruppoDuplicati'] = 0 # Default se non ci sono corrispondenze
-                                except KeyError as ke:
-                                    st.warning(f"KeyError durante l'aggiunta di GruppoDuplicati al report: {ke}. Il gruppo potrebbe mancare.")
-                                    if 'GruppoDuplicati' not in df_deleted_report.columns:
-                                         df_deleted_report['GruppoDuplicati'] = 0
-                                except Exception as e:
-                                     st.warning(f"Errore generico durante l'aggiunta di GruppoDuplicati al report: {e}. Il gruppo potrebbe mancare.")
-                                     if 'GruppoDuplicati' not in df_deleted_report.columns:
-                                         df_deleted_report['GruppoDuplicati'] = 0
-                            else:
-                                df_deleted_report['GruppoDuplicati'] = 0 # Aggiungi colonna default se non presente nei risultati
+                            # Aggiungi 'GruppoDuplicati' al report dai risultati compatti del rilevamento
+                            group_by_index = detection.group_series(current_df)
+                            df_deleted_report['GruppoDuplicati'] = group_by_index.reindex(df_deleted_report.index).fillna(0).astype(int)
                                     
                             # Definisci colonne preferite per il report
                             cols_report_preferred = ['GruppoDuplicati', 'CodiceFiscale', 'Nome', 'Cognome', 
@@ -150,14 +139,15 @@ def render_tab2(df_main):
                             st.session_state.report_data_to_download = report_csv_bytes
                             st.session_state.report_filename_to_download = report_filename
                             
-                            # 2. Esegui la rimozione dal dataframe principale (usando current_df_auto)
-                            df_cleaned = current_df_auto.drop(index=valid_indices_to_remove_auto)
+                            # 2. Marca le righe come eliminate (tombstone) invece di copiare il dataframe
+                            tombstones = get_tombstone_frame()
+                            tombstones.delete(valid_indices_to_remove_auto)
                             
                             # 3. Aggiorna lo stato della sessione
-                            st.session_state.processed_df = df_cleaned # Aggiorna il dataframe processato
+                            publish_tombstone_view(tombstones) # Aggiorna il dataframe processato e invalida gli aggregati
                             st.session_state.duplicates_removed = True # Segna che i duplicati sono stati gestiti
                             # Resetta i risultati del rilevamento perché il df è cambiato
-                            st.session_state.duplicate_detection_results = (pd.DataFrame(), [], []) 
+                            st.session_state.duplicate_detection_results = DuplicateDetectionResult() 
                             st.session_state.selected_indices_to_drop = [] # Resetta selezione manuale
                             
                         st.success(f"{num_valid_to_remove} record rimossi automaticamente!")
@@ -193,7 +183,7 @@ def render_tab2(df_main):
         st.info("Esamina i gruppi qui sotto. Puoi modificare la selezione predefinita ('Elimina?') e poi confermare la rimozione.")
         
         # Interfaccia per selezionare gli indici da rimuovere
-        selected_indices = select_duplicates_to_remove_ui(duplicates_df_display)
+        selected_indices = select_duplicates_to_remove_ui(detection, current_df)
         # Nota: `selected_indices_to_drop` nello stato sessione viene aggiornato DENTRO `select_duplicates_to_remove_ui` indirettamente tramite le chiavi dei widget
         # Lo rileggiamo qui per chiarezza e per usarlo nel bottone
         st.session_state.selected_indices_to_drop = selected_indices 
@@ -225,11 +215,12 @@ def render_tab2(df_main):
                             # Uso dello spinner (livello 5)
                             with st.spinner(f"Rimozione di {num_actually_removed} record selezionati..."):
                                 # Azioni di rimozione e aggiornamento stato (livello 6)
-                                df_cleaned = current_df_manual.drop(index=valid_indices_to_remove)
-                                st.session_state.processed_df = df_cleaned # Aggiorna il dataframe
+                                tombstones = get_tombstone_frame()
+                                tombstones.delete(valid_indices_to_remove)
+                                publish_tombstone_view(tombstones) # Aggiorna il dataframe e invalida gli aggregati
                                 st.session_state.duplicates_removed = True # Segna come rimossi
                                 # Resetta i risultati del rilevamento e la selezione
-                                st.session_state.duplicate_detection_results = (pd.DataFrame(), [], []) 
+                                st.session_state.duplicate_detection_results = DuplicateDetectionResult() 
                                 st.session_state.selected_indices_to_drop = [] 
                                 # La rimozione manuale non genera un report qui, quindi resetta i dati del report
                                 st.session_state.report_data_to_download = None
@@ -259,39 +250,26 @@ def render_tab2(df_main):
         # --- Sezione Download Report Completo (prima della rimozione) ---
         with st.expander("📄 Scarica Report Tutti i Duplicati Identificati (Prima della rimozione)"):
             # Usa i risultati originali del rilevamento PRIMA di qualsiasi rimozione
-            duplicates_df_display_orig = st.session_state.duplicate_detection_results[0] 
-            
-            if not duplicates_df_display_orig.empty:
+            if not detection.empty:
                 # Colonne preferite per il report completo dei cluster
                 cols_show_dup_preferred = ['GruppoDuplicati', 'CodiceFiscale', 'Nome', 'Cognome', 
                                           'DataPresenza', 'OraPresenza', 'Percorso', 
                                           'DenominazioneAttività', 'DenominazioneAttivitaNormalizzataInternal', 
                                           'CodicePercorso', 'CFU', 'SuggerisciRimuovere', 'TimestampPresenza']
-                                          
-                # Filtra per le colonne esistenti nel dataframe dei duplicati
-                cols_show_dup_exist = [c for c in cols_show_dup_preferred if c in duplicates_df_display_orig.columns]
-                
-                # Assicura che 'GruppoDuplicati' esista, anche se vuoto, per coerenza
-                if 'GruppoDuplicati' not in duplicates_df_display_orig.columns:
-                    st.warning("Colonna 'GruppoDuplicati' non presente nei risultati originali, verrà aggiunta come 0.")
-                    duplicates_df_display_orig['GruppoDuplicati'] = 0
-                    if 'GruppoDuplicati' not in cols_show_dup_exist:
-                         cols_show_dup_exist.insert(0, 'GruppoDuplicati') # Aggiungi all'inizio se mancava
-                    
-                # Ordina per gruppo e timestamp se possibile
-                if 'GruppoDuplicati' in cols_show_dup_exist and 'TimestampPresenza' in cols_show_dup_exist:
-                     df_to_download = duplicates_df_display_orig[cols_show_dup_exist].sort_values(by=['GruppoDuplicati', 'TimestampPresenza'])
-                else:
-                     df_to_download = duplicates_df_display_orig[cols_show_dup_exist]
 
-                # Crea CSV per il download
-                duplicates_csv_orig = df_to_download.to_csv(index=True, index_label='OriginalIndex').encode('utf-8')
+                def build_duplicates_csv():
+                    # Il DataFrame dei cluster viene materializzato solo al click sul pulsante di download
+                    # (già ordinato per gruppo e timestamp)
+                    df_to_download = detection.to_frame(current_df, columns=cols_show_dup_preferred)
+                    cols_show_dup_exist = [c for c in cols_show_dup_preferred if c in df_to_download.columns]
+                    return df_to_download[cols_show_dup_exist].to_csv(index=True, index_label='OriginalIndex').encode('utf-8')
+
                 ts_download = datetime.now().strftime("%Y%m%d_%H%M")
                 download_filename = f"Report_Duplicati_Identificati_{ts_download}.csv"
 
                 st.download_button(
                     label="Scarica CSV Cluster Duplicati Identificati",
-                    data=duplicates_csv_orig,
+                    data=build_duplicates_csv,
                     file_name=download_filename,
                     mime="text/csv",
                     key="dl_involved_clusters_orig" # Chiave unica
@@ -307,7 +285,7 @@ def render_tab2(df_main):
             # Potresti voler offrire un modo per resettare/rianalizzare se necessario
             if st.button("Rianalizza per duplicati (se necessario)", key="reanalyze_duplicates"):
                  st.session_state.duplicates_removed = False
-                 st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+                 st.session_state.duplicate_detection_results = DuplicateDetectionResult()
                  st.session_state.report_data_to_download = None # Pulisce anche il report scaricabile
                  st.session_state.report_filename_to_download = None
                  st.rerun()
@@ -316,132 +294,236 @@ def render_tab2(df_main):
             # Nessun duplicato trovato inizialmente
             st.success("✅ Nessun record potenzialmente duplicato trovato nei dati correnti.")
 
-def select_duplicates_to_remove_ui(df_duplicates):
+def render_undo_redo_controls():
+    """Mostra i pulsanti per annullare o ripristinare l'ultima rimozione di record."""
+    tombstones = st.session_state.get('processed_tombstones')
+    if tombstones is None or tombstones.view() is not st.session_state.get('processed_df'):
+        return
+    if not (tombstones.can_undo() or tombstones.can_redo()):
+        return
+
+    col_undo, col_redo, _ = st.columns([1, 1, 3])
+    with col_undo:
+        if st.button("↩️ Annulla ultima rimozione", key="undo_removal", disabled=not tombstones.can_undo()):
+            restored = tombstones.undo()
+            publish_tombstone_view(tombstones)
+            # I record ripristinati vanno di nuovo analizzati
+            st.session_state.duplicates_removed = False
+            st.session_state.duplicate_detection_results = DuplicateDetectionResult()
+            st.session_state.selected_indices_to_drop = []
+            st.session_state.report_data_to_download = None
+            st.session_state.report_filename_to_download = None
+            st.toast(f"{restored} record ripristinati.")
+            st.rerun()
+    with col_redo:
+        if st.button("↪️ Ripeti rimozione", key="redo_removal", disabled=not tombstones.can_redo()):
+            removed = tombstones.redo()
+            publish_tombstone_view(tombstones)
+            st.session_state.duplicates_removed = True
+            st.session_state.duplicate_detection_results = DuplicateDetectionResult()
+            st.session_state.selected_indices_to_drop = []
+            st.toast(f"{removed} record rimossi di nuovo.")
+            st.rerun()
+    st.caption(f"Record eliminati finora: {tombstones.n_deleted} (annullabili)")
+    if tombstones.needs_compaction:
+        st.info(f"È stato rimosso oltre il {tombstones.compaction_ratio:.0%} dei record: consolidando le rimozioni "
+                "si libera memoria, ma non sarà più possibile annullarle.")
+        if st.button("🧹 Consolida rimozioni", key="compact_removals"):
+            dropped = compact_tombstone_frame(tombstones)
+            st.toast(f"{dropped} record rimossi definitivamente.")
+            st.rerun()
+
+# Numero di gruppi di duplicati mostrati per pagina nella revisione manuale
+GROUP_PAGE_SIZE_OPTIONS = [10, 25, 50]
+
+def build_duplicate_group_index(detection, df, timestamp_col='TimestampPresenza'):
+    """
+    Costruisce l'indice per gruppo dei duplicati a partire dal risultato compatto
+    del rilevamento (già ordinato per gruppo e timestamp): gli offset di inizio/fine
+    di ogni gruppo permettono di materializzare un gruppo con uno slice.
+    Calcola inoltre, con un solo groupby, la tabella riassuntiva dei gruppi.
+
+    Args:
+        detection: DuplicateDetectionResult del rilevamento corrente
+        df: DataFrame su cui è stato eseguito il rilevamento
+        timestamp_col: Colonna del timestamp usata per calcolare l'intervallo
+
+    Returns:
+        Dizionario con 'group_ids', 'starts', 'ends' e 'summary'
+    """
+    group_ids, starts, sizes = np.unique(detection.group_ids, return_index=True, return_counts=True)
+    ends = starts + sizes
+
+    # Tabella riassuntiva: solo le colonne necessarie, un solo groupby per dimensione,
+    # intervallo temporale e rimozioni suggerite
+    summary_cols = ['Nome', 'Cognome', 'DenominazioneAttività', 'DataPresenza', timestamp_col]
+    summary_df = detection.to_frame(df, columns=summary_cols)
+    agg_spec = {'Record': ('GruppoDuplicati', 'size')}
+    for col in ['Nome', 'Cognome', 'DenominazioneAttività', 'DataPresenza']:
+        if col in summary_df.columns:
+            agg_spec[col] = (col, 'first')
+    if timestamp_col in summary_df.columns:
+        agg_spec['_inizio'] = (timestamp_col, 'min')
+        agg_spec['_fine'] = (timestamp_col, 'max')
+    agg_spec['Rimozioni Suggerite'] = ('SuggerisciRimuovere', 'sum')
+    summary = summary_df.groupby('GruppoDuplicati', sort=True).agg(**agg_spec)
+    if '_inizio' in summary.columns:
+        span = pd.to_datetime(summary['_fine']) - pd.to_datetime(summary['_inizio'])
+        summary['Intervallo (min)'] = (span.dt.total_seconds() / 60).round(1)
+        summary = summary.drop(columns=['_inizio', '_fine'])
+    summary = summary.reset_index()
+
+    # Solo i gruppi (diversi da 0) con almeno 2 record sono duplicati in senso stretto
+    keep = (sizes >= 2) & (group_ids != 0)
+    return {
+        'group_ids': group_ids[keep],
+        'starts': starts[keep],
+        'ends': ends[keep],
+        'summary': summary[(summary['Record'] >= 2) & (summary['GruppoDuplicati'] != 0)].reset_index(drop=True),
+    }
+
+def _render_group_editor(group_id, group_df, overrides):
+    """Renderizza il data_editor di un singolo gruppo e registra la selezione in `overrides`."""
+    # Prendi informazioni dalla prima riga per l'etichetta dell'expander
+    first_row = group_df.iloc[0]
+    # Gestisci DataPresenza che potrebbe essere date, datetime, o NaT
+    date_obj = first_row.get('DataPresenza')
+    date_str = 'Data N/D'
+    if pd.notna(date_obj):
+         if hasattr(date_obj, 'strftime'): # Check se è date o datetime
+             date_str = date_obj.strftime('%d/%m/%Y')
+         else: # Altrimenti prova a convertire
+             try:
+                 date_str = pd.to_datetime(date_obj).strftime('%d/%m/%Y')
+             except:
+                 date_str = str(date_obj) # Fallback a stringa
+
+    expander_label = f"Gruppo {int(group_id)}: {first_row.get('Nome', 'N/D')} {first_row.get('Cognome', 'N/D')} - Data {date_str} ({len(group_df)} record)"
+    
+    with st.expander(expander_label, expanded=False):
+        st.markdown(f"**Nome:** `{first_row.get('Nome', 'N/D')}` **Cognome:** `{first_row.get('Cognome', 'N/D')}` - **Data:** `{date_str}` - **Attività:** `{first_row.get('DenominazioneAttività', 'N/D')}`")
+        
+        # Prepara il dataframe per l'editor
+        group_df_edit = group_df.copy()
+        
+        # La colonna 'Elimina' parte dalla selezione già fatta per il gruppo, altrimenti dal suggerimento iniziale
+        if group_id in overrides:
+             group_df_edit['Elimina'] = group_df_edit.index.isin(overrides[group_id])
+        elif 'SuggerisciRimuovere' in group_df_edit.columns:
+             group_df_edit['Elimina'] = group_df_edit['SuggerisciRimuovere'].astype(bool)
+        else:
+             st.warning(f"Colonna 'SuggerisciRimuovere' non trovata per gruppo {group_id}. Selezione 'Elimina' inizializzata a False.")
+             group_df_edit['Elimina'] = False # Default a False se manca il suggerimento
+        
+        # Colonne da mostrare nell'editor: Priorità a Elimina, Ora, Attività, poi Nome/Cognome se esistono
+        cols_to_display_editor = ['Elimina', 'OraPresenza', 'DenominazioneAttività']
+        # Aggiungi nome/cognome se presenti
+        for col in ['Nome', 'Cognome']:
+             if col in group_df_edit.columns:
+                 cols_to_display_editor.append(col)
+                 
+        # Filtra per colonne che esistono effettivamente
+        cols_to_display_editor_final = [c for c in cols_to_display_editor if c in group_df_edit.columns]
+        
+        # Assicura unicità se ci fossero duplicati nei nomi (improbabile qui ma sicuro)
+        cols_to_display_editor_final = list(dict.fromkeys(cols_to_display_editor_final))
+        
+        # Conserva l'indice originale per riferimento
+        group_df_edit['_OriginalIndex'] = group_df_edit.index
+        
+        try:
+             # Configurazione delle colonne per data_editor
+            column_config = {
+                "Elimina": st.column_config.CheckboxColumn("Elimina?", default=False, help="Seleziona per rimuovere questo record"),
+                "_OriginalIndex": None # Nasconde la colonna indice originale
+            }
+            # Aggiungi configurazioni specifiche per altre colonne comuni
+            if 'OraPresenza' in cols_to_display_editor_final:
+                column_config["OraPresenza"] = st.column_config.TimeColumn("Ora", format="HH:mm:ss")
+            if 'DenominazioneAttività' in cols_to_display_editor_final:
+                 column_config["DenominazioneAttività"] = st.column_config.TextColumn("Denominazione Attività")
+            if 'Nome' in cols_to_display_editor_final:
+                 column_config["Nome"] = st.column_config.TextColumn("Nome")
+            if 'Cognome' in cols_to_display_editor_final:
+                 column_config["Cognome"] = st.column_config.TextColumn("Cognome")
+
+            # Colonne da disabilitare (tutte tranne 'Elimina')
+            disabled_cols = [c for c in cols_to_display_editor_final if c != 'Elimina']
+
+            # Mostra il data editor
+            edited_df = st.data_editor(
+                group_df_edit[cols_to_display_editor_final + ['_OriginalIndex']], # Include indice per recuperarlo
+                column_config=column_config,
+                disabled=disabled_cols,
+                hide_index=True, # Nasconde l'indice di default del dataframe modificato
+                key=f"editor_group_{group_id}" # Chiave unica per ogni editor di gruppo
+            )
+            
+            # Registra la selezione del gruppo: resta valida anche quando si cambia pagina
+            overrides[group_id] = edited_df[edited_df['Elimina']]['_OriginalIndex'].tolist()
+
+        except Exception as e:
+             st.error(f"Errore durante la creazione dell'editor per il gruppo {group_id}: {e}")
+             st.exception(e) # Log completo per debug
+
+def select_duplicates_to_remove_ui(detection, df):
     """
-    Crea un'interfaccia utente con st.data_editor per selezionare 
-    i record duplicati da rimuovere all'interno di ciascun gruppo.
+    Crea un'interfaccia utente paginata per selezionare i record duplicati
+    da rimuovere all'interno di ciascun gruppo. Mostra una tabella riassuntiva
+    di tutti i gruppi e un st.data_editor solo per i gruppi della pagina corrente,
+    materializzati dal DataFrame `df` a partire dal risultato compatto `detection`;
+    le selezioni dei gruppi non visibili restano quelle suggerite o quelle già modificate.
     Restituisce una lista di indici originali selezionati per la rimozione.
     """
-    if df_duplicates.empty:
+    if detection.empty:
         # st.info("Nessun gruppo di duplicati da revisionare.")
         return []
-        
-    selected_indices_map = {} # Mappa per tenere traccia della selezione {original_index: bool_elimina}
-    
-    # Verifica colonna essenziale
-    if 'GruppoDuplicati' not in df_duplicates.columns:
-        st.error("Errore interno: Colonna 'GruppoDuplicati' mancante nel dataframe dei duplicati.")
-        return []
-        
-    # Ottieni ID unici dei gruppi, escludendo eventuali 0 o NaN se usati come 'non gruppo'
-    all_groups = sorted([g for g in df_duplicates['GruppoDuplicati'].unique() if pd.notna(g) and g != 0])
-    
-    if not all_groups:
+
+    # Indice per gruppo e selezioni modificate, legati ai risultati di rilevamento correnti
+    review_state = st.session_state.get('duplicate_review_state')
+    if review_state is None or review_state['results'] is not detection:
+        review_state = {
+            'results': detection,
+            'group_index': build_duplicate_group_index(detection, df),
+            'overrides': {},
+        }
+        st.session_state.duplicate_review_state = review_state
+    group_index = review_state['group_index']
+    overrides = review_state['overrides']
+
+    group_ids = group_index['group_ids']
+    if len(group_ids) == 0:
         st.info("Nessun gruppo di duplicati valido trovato per la revisione.")
         return []
         
-    st.write(f"👇 **Revisiona i {len(all_groups)} gruppi e seleziona i record da eliminare:**")
-    
-    indices_selected_overall = []
+    st.write(f"👇 **Revisiona i {len(group_ids)} gruppi e seleziona i record da eliminare:**")
 
-    for group_id in all_groups:
-        # Filtra il dataframe per il gruppo corrente
-        group_df = df_duplicates[df_duplicates['GruppoDuplicati'] == group_id].copy()
-        
-        # Salta gruppi con meno di 2 record, non sono duplicati in senso stretto
-        if len(group_df) < 2:
-            continue
-            
-        # Prendi informazioni dalla prima riga per l'etichetta dell'expander
-        first_row = group_df.iloc[0]
-        # Gestisci DataPresenza che potrebbe essere date, datetime, o NaT
-        date_obj = first_row.get('DataPresenza')
-        date_str = 'Data N/D'
-        if pd.notna(date_obj):
-             if hasattr(date_obj, 'strftime'): # Check se è date o datetime
-                 date_str = date_obj.strftime('%d/%m/%Y')
-             else: # Altrimenti prova a convertire
-                 try:
-                     date_str = pd.to_datetime(date_obj).strftime('%d/%m/%Y')
-                 except:
-                     date_str = str(date_obj) # Fallback a stringa
-
-        expander_label = f"Gruppo {int(group_id)}: {first_row.get('Nome', 'N/D')} {first_row.get('Cognome', 'N/D')} - Data {date_str} ({len(group_df)} record)"
-        
-        with st.expander(expander_label, expanded=False):
-            st.markdown(f"**Nome:** `{first_row.get('Nome', 'N/D')}` **Cognome:** `{first_row.get('Cognome', 'N/D')}` - **Data:** `{date_str}` - **Attività:** `{first_row.get('DenominazioneAttività', 'N/D')}`")
-            
-            # Prepara il dataframe per l'editor
-            group_df_edit = group_df.copy()
-            
-            # La colonna 'Elimina' deve basarsi sul suggerimento iniziale ('SuggerisciRimuovere')
-            if 'SuggerisciRimuovere' in group_df_edit.columns:
-                 group_df_edit['Elimina'] = group_df_edit['SuggerisciRimuovere'].astype(bool)
-            else:
-                 st.warning(f"Colonna 'SuggerisciRimuovere' non trovata per gruppo {group_id}. Selezione 'Elimina' inizializzata a False.")
-                 group_df_edit['Elimina'] = False # Default a False se manca il suggerimento
-            
-            # Colonne da mostrare nell'editor: Priorità a Elimina, Ora, Attività, poi Nome/Cognome se esistono
-            cols_to_display_editor = ['Elimina', 'OraPresenza', 'DenominazioneAttività']
-            # Aggiungi nome/cognome se presenti
-            for col in ['Nome', 'Cognome']:
-                 if col in group_df_edit.columns:
-                     cols_to_display_editor.append(col)
-                     
-            # Filtra per colonne che esistono effettivamente
-            cols_to_display_editor_final = [c for c in cols_to_display_editor if c in group_df_edit.columns]
-            
-            # Assicura unicità se ci fossero duplicati nei nomi (improbabile qui ma sicuro)
-            cols_to_display_editor_final = list(dict.fromkeys(cols_to_display_editor_final))
-            
-            # Conserva l'indice originale per riferimento
-            group_df_edit['_OriginalIndex'] = group_df_edit.index
-            
-            # Verifica che le colonne chiave esistano prima di chiamare data_editor
-            if '_OriginalIndex' in group_df_edit.columns and 'Elimina' in cols_to_display_editor_final:
-                try:
-                     # Configurazione delle colonne per data_editor
-                    column_config = {
-                        "Elimina": st.column_config.CheckboxColumn("Elimina?", default=False, help="Seleziona per rimuovere questo record"),
-                        "_OriginalIndex": None # Nasconde la colonna indice originale
-                    }
-                    # Aggiungi configurazioni specifiche per altre colonne comuni
-                    if 'OraPresenza' in cols_to_display_editor_final:
-                        column_config["OraPresenza"] = st.column_config.TimeColumn("Ora", format="HH:mm:ss")
-                    if 'DenominazioneAttività' in cols_to_display_editor_final:
-                         column_config["DenominazioneAttività"] = st.column_config.TextColumn("Denominazione Attività")
-                    if 'Nome' in cols_to_display_editor_final:
-                         column_config["Nome"] = st.column_config.TextColumn("Nome")
-                    if 'Cognome' in cols_to_display_editor_final:
-                         column_config["Cognome"] = st.column_config.TextColumn("Cognome")
-
-                    # Colonne da disabilitare (tutte tranne 'Elimina')
-                    disabled_cols = [c for c in cols_to_display_editor_final if c != 'Elimina']
-
-                    # Mostra il data editor
-                    edited_df = st.data_editor(
-                        group_df_edit[cols_to_display_editor_final + ['_OriginalIndex']], # Include indice per recuperarlo
-                        column_config=column_config,
-                        disabled=disabled_cols,
-                        hide_index=True, # Nasconde l'indice di default del dataframe modificato
-                        key=f"editor_group_{group_id}" # Chiave unica per ogni editor di gruppo
-                    )
-                    
-                    # Aggiorna la mappa generale con le selezioni di questo gruppo
-                    # Estrai gli indici originali dove 'Elimina' è True nel dataframe modificato
-                    selected_in_group = edited_df[edited_df['Elimina']]['_OriginalIndex'].tolist()
-                    
-                    # Aggiorna la lista generale degli indici selezionati
-                    indices_selected_overall.extend(selected_in_group)
+    with st.expander("📋 Riepilogo di tutti i gruppi", expanded=False):
+        st.dataframe(group_index['summary'], use_container_width=True, hide_index=True)
 
-                except Exception as e:
-                     st.error(f"Errore durante la creazione dell'editor per il gruppo {group_id}: {e}")
-                     st.exception(e) # Log completo per debug
+    page_col1, page_col2 = st.columns([1, 1])
+    with page_col1:
+        page_size = st.selectbox("Gruppi per pagina:", GROUP_PAGE_SIZE_OPTIONS, key="dup_groups_page_size")
+    num_pages = max(1, -(-len(group_ids) // page_size))
+    # Pagina seminata in session_state (nessun valore predefinito del widget) e riportata nell'intervallo valido
+    if "dup_groups_page" not in st.session_state:
+        st.session_state.dup_groups_page = 1
+    elif st.session_state.dup_groups_page > num_pages:
+        st.session_state.dup_groups_page = num_pages
+    with page_col2:
+        page = st.number_input(f"Pagina (di {num_pages}):", min_value=1, max_value=num_pages, step=1, key="dup_groups_page")
 
-            else:
-                st.warning(f"Dati incompleti o errati per visualizzare l'editor del gruppo {group_id}. Colonne richieste: '_OriginalIndex', 'Elimina'. Colonne disponibili: {', '.join(group_df_edit.columns)}")
-                # Mostra comunque i dati in forma statica se l'editor non può essere creato
-                st.dataframe(group_df[[c for c in cols_to_display_editor if c in group_df.columns]])
+    # Editor solo per i gruppi della pagina corrente: ogni gruppo è uno slice del risultato ordinato
+    first = (int(page) - 1) * page_size
+    for k in range(first, min(first + page_size, len(group_ids))):
+        group_df = detection.to_frame(df, rows=slice(group_index['starts'][k], group_index['ends'][k]))
+        _render_group_editor(group_ids[k], group_df, overrides)
+
+    # Selezione complessiva: suggerimenti per i gruppi non modificati, selezioni esplicite per gli altri
+    keep_suggested = detection.suggested & ~np.isin(detection.group_ids, list(overrides))
+    indices_selected_overall = df.index[detection.positions[keep_suggested]].tolist()
+    for selected_in_group in overrides.values():
+        indices_selected_overall.extend(selected_in_group)
 
     # Rimuovi eventuali duplicati dagli indici selezionati (se un indice fosse aggiunto più volte)
     # e restituisci la lista univoca
@@ -477,7 +559,7 @@ if __name__ == '__main__':
          st.session_state.processed_df = sample_df.copy() # Usa il df di esempio
     # Altre inizializzazioni necessarie potrebbero essere qui (vedi render_tab2)
     if 'duplicates_removed' not in st.session_state: st.session_state.duplicates_removed = False
-    if 'duplicate_detection_results' not in st.session_state: st.session_state.duplicate_detection_results = (pd.DataFrame(), [], [])
+    if 'duplicate_detection_results' not in st.session_state: st.session_state.duplicate_detection_results = DuplicateDetectionResult()
     if 'selected_indices_to_drop' not in st.session_state: st.session_state.selected_indices_to_drop = []
     if 'report_data_to_download' not in st.session_state: st.session_state.report_data_to_download = None
     if 'report_filename_to_download' not in st.session_state: st.session_state.report_filename_to_download = None
@@ -497,6 +579,6 @@ if __name__ == '__main__':
          "duplicates_removed": st.session_state.get('duplicates_removed', 'Non inizializzato'),
          "selected_indices_to_drop": st.session_state.get('selected_indices_to_drop', 'Non inizializzato'),
          "report_filename_to_download": st.session_state.get('report_filename_to_download', 'Non inizializzato'),
-         "len_duplicate_detection_results[0]": len(st.session_state.get('duplicate_detection_results', ([],[],[]))[0]),
+         "len_duplicate_detection_results": len(st.session_state.get('duplicate_detection_results', DuplicateDetectionResult())),
          "len_processed_df": len(st.session_state.get('processed_df', pd.DataFrame()))
     })
\ No newline at end of file
@@ -2,9 +2,14 @@
 import streamlit as st
 import pandas as pd
 import re
+import calendar
 from datetime import datetime, date
 from io import BytesIO
-from modules.attendance import calculate_attendance
+from modules.archive import archived_months, load_archive
+from modules.attendance import build_attendance_filter_index, calculate_attendance
+from modules.dataset_cache import memoize_aggregate
+from modules.filter_index import build_filter_index, intersect_positions
+from modules.search_index import build_student_search_index
 from modules.utils import ensure_string_columns
 
 # Definisco le funzioni di utilità direttamente qui per evitare problemi di importazione
@@ -44,6 +49,355 @@ def extract_sort_key(percorso_str):
         return code_match.group(1)
     return str(percorso_str)
 
+# Colonne indicizzate per i filtri a cascata
+DETAIL_FILTER_COLUMNS = ('Codice_classe_di_concorso_e_denominazione', 'DenominazioneAttività', 'CodiceFiscale')
+
+@st.fragment
+def _render_filtered_attendance(current_df_for_tab3, attendance_df, group_by):
+    """
+    Filtri a cascata (classe di concorso, attività, studente) e tabelle filtrate della Tab 3.
+    È un fragment: cambiare un filtro riesegue solo questa sezione, con gli indici dei filtri
+    già calcolati per la versione corrente del dataset.
+    """
+    filter_container = st.container()
+    with filter_container:
+        st.subheader("🔍 Filtri", divider="gray")
+        st.caption("I filtri consentono di ridurre i dati visualizzati nelle tabelle sottostanti")
+        # Nota: La colonna 'DenominazioneAttività' viene rinominata in 'Percorso (Senza Art.13)' 
+        # dalla funzione calculate_attendance quando group_by è "studente"
+
+        p_col_internal_key = 'DenominazioneAttività'
+
+    # La logica per il filtraggio 
+    if not attendance_df.empty:
+        if p_col_internal_key not in current_df_for_tab3.columns:
+            st.error(f"Colonna chiave interna '{p_col_internal_key}' non trovata nei dati dettagliati.")
+        else:
+            # Indici dei filtri precalcolati per versione del dataset:
+            # i filtri a cascata lavorano su array di posizioni e solo la selezione finale viene materializzata
+            agg_index = memoize_aggregate(build_attendance_filter_index, current_df_for_tab3, group_by=group_by)
+            detail_index = memoize_aggregate(build_filter_index, current_df_for_tab3, columns=DETAIL_FILTER_COLUMNS)
+            agg_pos = agg_index.all_positions()
+            detail_pos = detail_index.all_positions()
+            # Nota: Il filtro per Codice Classe di concorso è stato rimosso
+
+            # --- Filtro per Denominazione Classe di concorso ---
+            st.divider()
+            filter_denom_concorso_col1, filter_denom_concorso_col2 = st.columns([3, 1])
+            denom_concorso_sel = "Tutte"
+
+            try:
+                # Ottieni tutte le denominazioni classi di concorso uniche dal dataframe
+                if agg_index.has_column('Codice_classe_di_concorso_e_denominazione'):
+                    denom_concorso_list = [str(d) for d in agg_index.values('Codice_classe_di_concorso_e_denominazione')]
+
+                    # Visualizza il filtro per denominazione classe di concorso
+                    with filter_denom_concorso_col1:
+                        denom_concorso_sel = st.selectbox(f"🏫 Seleziona Denominazione Classe di concorso:", 
+                                                       ["Tutte"] + denom_concorso_list, 
+                                                       key="filt_denom_concorso_tab3")
+
+                    # Mostra il numero di studenti per questa denominazione classe di concorso
+                    if denom_concorso_sel != "Tutte":
+                        with filter_denom_concorso_col2:
+                            studenti_per_denom = agg_index.count('Codice_classe_di_concorso_e_denominazione', denom_concorso_sel)
+                            st.metric("Studenti nella classe", studenti_per_denom)
+                else:
+                    with filter_denom_concorso_col1:
+                        st.warning("Colonna 'Codice_classe_di_concorso_e_denominazione' non presente nei dati")
+            except Exception as e:
+                st.error(f"Errore nel filtro denominazione classe di concorso: {e}")
+
+            # Filtraggio basato sulla denominazione classe di concorso
+            if denom_concorso_sel != "Tutte" and agg_index.has_column('Codice_classe_di_concorso_e_denominazione'):
+                agg_pos = agg_index.positions('Codice_classe_di_concorso_e_denominazione', denom_concorso_sel)
+                if detail_index.has_column('Codice_classe_di_concorso_e_denominazione'):
+                    detail_pos = detail_index.positions('Codice_classe_di_concorso_e_denominazione', denom_concorso_sel)
+
+            # --- Filtro per Denominazione Attività (ora gerarchico) ---
+            st.divider()
+            filter_denominazione_col1, filter_denominazione_col2 = st.columns([3, 1])
+            denominazione_sel = "Tutte"
+
+            try:
+                # Ottieni le denominazioni attività filtrate dal dataframe dettagliato
+                if detail_index.has_column('DenominazioneAttività'):
+                    denominazione_list = [str(d) for d in detail_index.values('DenominazioneAttività', detail_pos)]
+
+                    # Visualizza il filtro per denominazione attività
+                    with filter_denominazione_col1:
+                        denominazione_sel = st.selectbox(f"📝 Seleziona Denominazione Attività:", 
+                                                       ["Tutte"] + denominazione_list, 
+                                                       key="filt_denominazione_tab3")
+
+                    # Mostra il numero di record per questa denominazione
+                    if denominazione_sel != "Tutte":
+                        with filter_denominazione_col2:
+                            record_per_denominazione = detail_index.count('DenominazioneAttività', denominazione_sel, detail_pos)
+                            st.metric("Record trovati", record_per_denominazione)
+                else:
+                    with filter_denominazione_col1:
+                        st.warning("Colonna 'DenominazioneAttività' non presente nei dati")
+            except Exception as e:
+                st.error(f"Errore nel filtro denominazione attività: {e}")
+
+            # Filtraggio basato sulla denominazione attività
+            if denominazione_sel != "Tutte" and detail_index.has_column('DenominazioneAttività'):
+                detail_pos = intersect_positions(detail_pos, detail_index.positions('DenominazioneAttività', denominazione_sel))
+                # Per i dati aggregati, filtriamo in base ai codici fiscali che hanno quella denominazione
+                if len(detail_pos) > 0 and detail_index.has_column('CodiceFiscale') and agg_index.has_column('CodiceFiscale'):
+                    codici_fiscali_filtrati = detail_index.values('CodiceFiscale', detail_pos)
+                    agg_pos = intersect_positions(agg_pos, agg_index.positions_for_values('CodiceFiscale', codici_fiscali_filtrati))
+
+            # --- Filtro Studente (sempre disponibile) ---
+            st.divider()
+            filter_studente_col1, filter_studente_col2 = st.columns([3, 1])
+            stud_sel = "Tutti gli Studenti" # Default
+
+            # Preparazione lista studenti per il filtro
+            if len(agg_pos) > 0:
+                # Indice di ricerca studenti precalcolato per versione del dataset
+                student_index = memoize_aggregate(build_student_search_index, current_df_for_tab3)
+                available_cfs = agg_index.values('CodiceFiscale', agg_pos) if agg_index.has_column('CodiceFiscale') else []
+                student_list = student_index.labels_for(available_cfs)
+
+                # Statistica totale studenti
+                with filter_studente_col2:
+                    st.metric("Studenti disponibili", len(student_list))
+
+                # Filtro studenti con ricerca
+                with filter_studente_col1:
+                    search_placeholder = "Cerca per nome, cognome, CF, matricola o email..."
+                    search_term = st.text_input("🔎 Cerca studente:", placeholder=search_placeholder, key="search_student")
+
+                    if search_term:
+                        # Risultati ordinati per rilevanza, limitati agli studenti dei filtri correnti
+                        filtered_student_list = student_index.search(search_term, restrict_cfs=available_cfs)
+                        st.caption(f"Trovati {len(filtered_student_list)} studenti su {len(student_list)}")
+                        student_options = ["Tutti gli Studenti"] + filtered_student_list
+                    else:
+                        student_options = ["Tutti gli Studenti"] + student_list
+
+                    stud_sel = st.selectbox("👤 Seleziona Studente:", student_options, key="filt_stud_tab3_v8")
+            else:
+                with filter_studente_col1:
+                    st.info(f"Nessun dato aggregato trovato con i filtri applicati.")
+
+            # --- Applicazione Filtri in Sequenza ---
+            st.divider()
+            st.subheader("🔍 Risultati Filtrati", divider="gray")
+
+            # Contatori per i filtri applicati
+            num_record_dopo_filtro_codice = len(agg_pos)
+            num_record_dopo_filtro_denom = len(agg_pos)
+
+            # Applica filtro per studente se selezionato
+            if stud_sel != "Tutti gli Studenti":
+                try:
+                    selected_cf = re.search(r'\((.*?)\)', stud_sel).group(1)
+                    agg_pos = intersect_positions(agg_pos, agg_index.positions('CodiceFiscale', selected_cf))
+                    detail_pos = intersect_positions(detail_pos, detail_index.positions('CodiceFiscale', selected_cf))
+                except (AttributeError, IndexError, KeyError):
+                    st.warning("Formato studente non riconosciuto nel filtro.")
+
+            # Materializza solo la selezione finale
+            df_to_display_agg = attendance_df.iloc[agg_pos]
+            df_to_display_detail = current_df_for_tab3.iloc[detail_pos]
+
+            # Contatore record dopo filtro studente
+            num_record_dopo_filtro_stud = len(df_to_display_agg)
+
+            # Mostriamo statistiche sui filtri applicati
+            with st.expander("📊 Statistiche Filtri", expanded=False):
+                stats_col1, stats_col2, stats_col3 = st.columns(3)
+                with stats_col1:
+                    st.metric("Dopo filtro codice", num_record_dopo_filtro_codice)
+                with stats_col2:
+                    st.metric("Dopo filtro denom.", num_record_dopo_filtro_denom)
+                with stats_col3:
+                    st.metric("Record finali", num_record_dopo_filtro_stud)
+
+            try:
+                # --- Visualizzazione Tabelle ---
+                if not df_to_display_agg.empty:
+                    # Aggiungi un separatore e un container per le tabelle
+                    tables_container = st.container()
+
+                    with tables_container:
+                        # Statistiche riassuntive
+                        if stud_sel == "Tutti gli Studenti":
+                            st.markdown("### 📊 Statistiche")
+                            stats_col1, stats_col2, stats_col3, stats_col4 = st.columns(4)
+
+                            with stats_col1:
+                                avg_presenze = df_to_display_agg['Presenze'].mean()
+                                st.metric("Media Presenze", f"{avg_presenze:.1f}")
+
+                            with stats_col2:
+                                max_presenze = df_to_display_agg['Presenze'].max()
+                                st.metric("Presenze Max", f"{max_presenze}")
+
+                            with stats_col3:
+                                min_presenze = df_to_display_agg['Presenze'].min()
+                                st.metric("Presenze Min", f"{min_presenze}")
+
+                            with stats_col4:
+                                tot_studenti = len(df_to_display_agg)
+                                st.metric("Totale Studenti", tot_studenti)
+
+                        # Titolo della tabella
+                        filtri_applicati = []
+                        if denom_concorso_sel != "Tutte":
+                            filtri_applicati.append(f"Classe di concorso: {denom_concorso_sel}")
+                        if denominazione_sel != "Tutte":
+                            filtri_applicati.append(f"Attività: {denominazione_sel}")
+                        if stud_sel != "Tutti gli Studenti":
+                            filtri_applicati.append(f"Studente: {stud_sel}")
+
+                        if filtri_applicati:
+                            filtri_text = " | ".join(filtri_applicati)
+                            st.subheader(f"📋 Riepilogo Aggregato - {filtri_text}", divider="blue")
+                        else:
+                            st.subheader("📋 Riepilogo Aggregato - Tutti i dati", divider="blue")
+
+                        cols_disp_agg = ['CodiceFiscale', 'Nome', 'Cognome', 'Email', 
+                                        'Codice_classe_di_concorso_e_denominazione', 'Dipartimento', 'Matricola',
+                                        'Percorso (Senza Art.13)', 'CFU Totali', 'Presenze']
+                        cols_disp_agg_exist = [c for c in cols_disp_agg if c in df_to_display_agg.columns]
+                        sort_agg_by = ['Percorso (Senza Art.13)', 'Cognome', 'Nome']
+
+                        # Opzioni di visualizzazione e ordinamento
+                        visual_options_col1, visual_options_col2 = st.columns(2)
+
+                        with visual_options_col1:
+                            sort_options = ["Presenze (decrescente)", "Cognome e Nome", "Denominazione Attività", "Denominazione Classe di concorso"]
+                            selected_sort = st.radio("Ordinamento tabella:", sort_options, horizontal=True)
+
+                        with visual_options_col2:
+                            highlight_opt = st.checkbox("Evidenzia valori critici", value=True, 
+                                                      help="Evidenzia studenti con poche presenze")
+
+                        # Applica l'ordinamento selezionato
+                        if selected_sort == "Presenze (decrescente)" and 'Presenze' in df_to_display_agg.columns:
+                            df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Presenze'], ascending=False)
+                        elif selected_sort == "Cognome e Nome" and 'Cognome' in df_to_display_agg.columns:
+                            df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Cognome', 'Nome'])
+                        elif selected_sort == "Denominazione Attività" and 'Percorso (Senza Art.13)' in df_to_display_agg.columns:
+                            df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Percorso (Senza Art.13)', 'Cognome', 'Nome'])
+                        elif selected_sort == "Denominazione Classe di concorso" and 'Codice_classe_di_concorso_e_denominazione' in df_to_display_agg.columns:
+                            df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Codice_classe_di_concorso_e_denominazione', 'Cognome', 'Nome'])
+                        elif sort_agg_by:
+                            valid_sort_agg_by = [c for c in sort_agg_by if c in df_to_display_agg.columns]
+                            if valid_sort_agg_by:
+                                df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=valid_sort_agg_by)
+                            else:
+                                df_to_show = df_to_display_agg[cols_disp_agg_exist]
+                        else:
+                            df_to_show = df_to_display_agg[cols_disp_agg_exist]                                        # Converti la colonna Matricola in stringa per evitare errori di Arrow
+                        df_to_show = ensure_string_columns(df_to_show)
+
+                            # Dataframe con styling condizionale
+                        if highlight_opt and 'Presenze' in df_to_show.columns:
+                            # Crea una maschera per le presenze basse (< 4)
+                            def highlight_low_attendance(val):
+                                if isinstance(val, (int, float)) and val < 4:
+                                    return 'background-color: #ffcccc'
+                                return ''
+
+                            # Applica lo styling solo alla colonna Presenze
+                            # Sostituito applymap con map (non più deprecato)
+                            styled_df = df_to_show.style.map(
+                                highlight_low_attendance, subset=['Presenze']
+                            )
+                            st.dataframe(styled_df, use_container_width=True)
+                        else:
+                            st.dataframe(df_to_show, use_container_width=True)
+
+
+                if not df_to_display_detail.empty:
+                    # Sezione per il dettaglio delle presenze
+                    detail_container = st.container()
+                    with detail_container:
+                        # Titolo della sezione dettaglio con filtri applicati
+                        filtri_applicati = []
+                        if denom_concorso_sel != "Tutte":
+                            filtri_applicati.append(f"Classe di concorso: {denom_concorso_sel}")
+                        if denominazione_sel != "Tutte":
+                            filtri_applicati.append(f"Attività: {denominazione_sel}")
+                        if stud_sel != "Tutti gli Studenti":
+                            filtri_applicati.append(f"Studente: {stud_sel}")
+
+                        if filtri_applicati:
+                            filtri_text = " | ".join(filtri_applicati)
+                            st.subheader(f"📝 Dettaglio Record Presenze - {filtri_text}", divider="blue")
+                        else:
+                            st.subheader("📝 Dettaglio Record Presenze - Tutti i dati", divider="blue")
+
+                        # Riepilogo record trovati e statistiche dettaglio
+                        record_count = len(df_to_display_detail)
+                        if record_count > 0:
+                            detail_stats_col1, detail_stats_col2 = st.columns(2)
+
+                            with detail_stats_col1:
+                                st.info(f"Trovati {record_count} record di presenza", icon="ℹ️")
+
+                            # Se ci sono date, mostra il periodo
+                            if 'DataPresenza' in df_to_display_detail.columns:
+                                with detail_stats_col2:
+                                    try:
+                                        min_data = pd.to_datetime(df_to_display_detail['DataPresenza']).min()
+                                        max_data = pd.to_datetime(df_to_display_detail['DataPresenza']).max()
+                                        st.info(f"Periodo: dal {min_data.strftime('%d/%m/%Y')} al {max_data.strftime('%d/%m/%Y')}", icon="📅")
+                                    except:
+                                        pass
+
+                        # Colonne da visualizzare
+                        cols_disp_detail = ['CodiceFiscale', 'Cognome', 'Nome', 'Email', 'DataPresenza', 'OraPresenza', 
+                                           'Codice_classe_di_concorso_e_denominazione', 'Dipartimento',
+                                           'DenominazioneAttività', 'CFU']
+                        cols_disp_detail_exist = [c for c in cols_disp_detail if c in df_to_display_detail.columns]
+
+                        # Ordinamento
+                        detail_sort_options = st.radio(
+                            "Ordinamento dettagli:", 
+                            ["Per Data (più recente prima)", "Per Cognome e Nome", "Per Attività", "Per Denominazione Classe di concorso"],
+                            horizontal=True
+                        )
+
+                        # Imposta l'ordinamento in base alla selezione
+                        if detail_sort_options == "Per Data (più recente prima)" and 'DataPresenza' in df_to_display_detail.columns:
+                            sort_by_columns = ['DataPresenza', 'OraPresenza'] 
+                            ascending = [False, False]  # Prima le date più recenti
+                        elif detail_sort_options == "Per Attività" and 'DenominazioneAttività' in df_to_display_detail.columns:
+                            sort_by_columns = ['DenominazioneAttività', 'DataPresenza']
+                            ascending = [True, True]
+                        elif detail_sort_options == "Per Denominazione Classe di concorso" and 'Codice_classe_di_concorso_e_denominazione' in df_to_display_detail.columns:
+                            sort_by_columns = ['Codice_classe_di_concorso_e_denominazione', 'Cognome', 'Nome']
+                            ascending = [True, True, True]
+                        else:  # Default: per cognome e nome
+                            sort_by_columns = ['Cognome', 'Nome']
+                            if 'DataPresenza' in df_to_display_detail.columns: 
+                                sort_by_columns.append('DataPresenza')
+                            ascending = [True] * len(sort_by_columns)
+
+                        # Filtra colonne valide per ordinamento
+                        valid_sort_by = [col for col in sort_by_columns if col in df_to_display_detail.columns]
+
+                        # Visualizza dataframe
+                        if not valid_sort_by: 
+                            df_to_show = df_to_display_detail[cols_disp_detail_exist]
+                        else: 
+                            df_to_show = df_to_display_detail[cols_disp_detail_exist].sort_values(
+                                by=valid_sort_by, 
+                                ascending=ascending[:len(valid_sort_by)]
+                            )
+
+                        st.dataframe(df_to_show, use_container_width=True)
+                else:
+                    st.info("Nessun record dettagliato da mostrare per la selezione corrente.")
+            except Exception as e: 
+                st.error(f"Errore durante la visualizzazione: {e}")
+
 def render_tab3(df_main):
     """Renderizza l'interfaccia della Tab 3: Calcolo Presenze ed Esportazione"""
     st.header("📊 Calcolo Presenze ed Esportazione")
@@ -70,353 +424,11 @@ def render_tab3(df_main):
             # Calcolo presenze usando la visualizzazione per studente e percorso
             with st.spinner("Calcolo delle presenze in corso..."):
                 group_by = "studente"
-                attendance_df = calculate_attendance(current_df_for_tab3, group_by=group_by)
+                attendance_df = memoize_aggregate(calculate_attendance, current_df_for_tab3, group_by=group_by)
             
             # Se abbiamo dati validi, mostriamo i filtri in un container ben organizzato
             if not attendance_df.empty:
-                filter_container = st.container()
-                with filter_container:
-                    st.subheader("🔍 Filtri", divider="gray")
-                    st.caption("I filtri consentono di ridurre i dati visualizzati nelle tabelle sottostanti")
-                    # Nota: La colonna 'DenominazioneAttività' viene rinominata in 'Percorso (Senza Art.13)' 
-                    # dalla funzione calculate_attendance quando group_by è "studente"
-                    
-                    p_col_internal_key = 'DenominazioneAttività'
-            
-                # La logica per il filtraggio 
-                if not attendance_df.empty:
-                    if p_col_internal_key not in current_df_for_tab3.columns:
-                        st.error(f"Colonna chiave interna '{p_col_internal_key}' non trovata nei dati dettagliati.")
-                    else:
-                        # Inizializzazione dei dataframe filtrati
-                        df_filtrato_concorso_agg = attendance_df.copy()
-                        df_filtrato_concorso_detail = current_df_for_tab3.copy()
-                        # Nota: Il filtro per Codice Classe di concorso è stato rimosso
-                        
-                        # --- Filtro per Denominazione Classe di concorso ---
-                        st.divider()
-                        filter_denom_concorso_col1, filter_denom_concorso_col2 = st.columns([3, 1])
-                        denom_concorso_sel = "Tutte"
-                        
-                        try:
-                            # Ottieni tutte le denominazioni classi di concorso uniche dal dataframe
-                            if 'Codice_classe_di_concorso_e_denominazione' in df_filtrato_concorso_agg.columns:
-                                denom_concorso_list = sorted([str(d) for d in df_filtrato_concorso_agg['Codice_classe_di_concorso_e_denominazione'].unique() if pd.notna(d)])
-                                
-                                # Visualizza il filtro per denominazione classe di concorso
-                                with filter_denom_concorso_col1:
-                                    denom_concorso_sel = st.selectbox(f"🏫 Seleziona Denominazione Classe di concorso:", 
-                                                                   ["Tutte"] + denom_concorso_list, 
-                                                                   key="filt_denom_concorso_tab3")
-                                
-                                # Mostra il numero di studenti per questa denominazione classe di concorso
-                                if denom_concorso_sel != "Tutte":
-                                    with filter_denom_concorso_col2:
-                                        studenti_per_denom = len(df_filtrato_concorso_agg[df_filtrato_concorso_agg['Codice_classe_di_concorso_e_denominazione'] == denom_concorso_sel])
-                                        st.metric("Studenti nella classe", studenti_per_denom)
-                            else:
-                                with filter_denom_concorso_col1:
-                                    st.warning("Colonna 'Codice_classe_di_concorso_e_denominazione' non presente nei dati")
-                        except Exception as e:
-                            st.error(f"Errore nel filtro denominazione classe di concorso: {e}")
-                        
-                        # Filtraggio basato sulla denominazione classe di concorso
-                        df_filtrato_denom_concorso_agg = df_filtrato_concorso_agg.copy()
-                        df_filtrato_denom_concorso_detail = df_filtrato_concorso_detail.copy()
-                        
-                        if denom_concorso_sel != "Tutte" and 'Codice_classe_di_concorso_e_denominazione' in df_filtrato_denom_concorso_agg.columns:
-                            df_filtrato_denom_concorso_agg = df_filtrato_denom_concorso_agg[df_filtrato_denom_concorso_agg['Codice_classe_di_concorso_e_denominazione'] == denom_concorso_sel].copy()
-                            if 'Codice_classe_di_concorso_e_denominazione' in df_filtrato_denom_concorso_detail.columns:
-                                df_filtrato_denom_concorso_detail = df_filtrato_denom_concorso_detail[df_filtrato_denom_concorso_detail['Codice_classe_di_concorso_e_denominazione'] == denom_concorso_sel].copy()
-                        
-                        # --- Filtro per Denominazione Attività (ora gerarchico) ---
-                        st.divider()
-                        filter_denominazione_col1, filter_denominazione_col2 = st.columns([3, 1])
-                        denominazione_sel = "Tutte"
-                        
-                        try:
-                            # Ottieni le denominazioni attività filtrate dal dataframe dettagliato
-                            if 'DenominazioneAttività' in df_filtrato_denom_concorso_detail.columns:
-                                denominazione_list = sorted([str(d) for d in df_filtrato_denom_concorso_detail['DenominazioneAttività'].unique() if pd.notna(d)])
-                                
-                                # Visualizza il filtro per denominazione attività
-                                with filter_denominazione_col1:
-                                    denominazione_sel = st.selectbox(f"📝 Seleziona Denominazione Attività:", 
-                                                                   ["Tutte"] + denominazione_list, 
-                                                                   key="filt_denominazione_tab3")
-                                
-                                # Mostra il numero di record per questa denominazione
-                                if denominazione_sel != "Tutte":
-                                    with filter_denominazione_col2:
-                                        record_per_denominazione = len(df_filtrato_denom_concorso_detail[df_filtrato_denom_concorso_detail['DenominazioneAttività'] == denominazione_sel])
-                                        st.metric("Record trovati", record_per_denominazione)
-                            else:
-                                with filter_denominazione_col1:
-                                    st.warning("Colonna 'DenominazioneAttività' non presente nei dati")
-                        except Exception as e:
-                            st.error(f"Errore nel filtro denominazione attività: {e}")
-                            
-                        # Filtraggio basato sulla denominazione attività
-                        df_filtrato_denominazione_agg = df_filtrato_denom_concorso_agg.copy()
-                        df_filtrato_denominazione_detail = df_filtrato_denom_concorso_detail.copy()
-                        
-                        if denominazione_sel != "Tutte" and 'DenominazioneAttività' in df_filtrato_denominazione_detail.columns:
-                            df_filtrato_denominazione_detail = df_filtrato_denominazione_detail[df_filtrato_denominazione_detail['DenominazioneAttività'] == denominazione_sel].copy()
-                            # Per i dati aggregati, filtriamo in base ai codici fiscali che hanno quella denominazione
-                            if not df_filtrato_denominazione_detail.empty and 'CodiceFiscale' in df_filtrato_denominazione_detail.columns and 'CodiceFiscale' in df_filtrato_denominazione_agg.columns:
-                                codici_fiscali_filtrati = df_filtrato_denominazione_detail['CodiceFiscale'].unique()
-                                df_filtrato_denominazione_agg = df_filtrato_denominazione_agg[df_filtrato_denominazione_agg['CodiceFiscale'].isin(codici_fiscali_filtrati)].copy()
-
-                        # --- Filtro Studente (sempre disponibile) ---
-                        st.divider()
-                        filter_studente_col1, filter_studente_col2 = st.columns([3, 1])
-                        stud_sel = "Tutti gli Studenti" # Default
-                        
-                        # Preparazione lista studenti per il filtro
-                        if not df_filtrato_denominazione_agg.empty:
-                            df_filtrato_denominazione_agg['StudentIdentifier'] = df_filtrato_denominazione_agg.apply(
-                                lambda row: f"{row.get('Cognome','')} {row.get('Nome','')} ({row.get('CodiceFiscale','N/A')})".strip(), axis=1
-                            )
-                            student_list = sorted(df_filtrato_denominazione_agg['StudentIdentifier'].unique())
-                            
-                            # Statistica totale studenti
-                            with filter_studente_col2:
-                                st.metric("Studenti disponibili", len(student_list))
-                            
-                            # Filtro studenti con ricerca
-                            with filter_studente_col1:
-                                search_placeholder = "Cerca per nome o cognome..."
-                                search_term = st.text_input("🔎 Cerca studente:", placeholder=search_placeholder, key="search_student")
-                                
-                                if search_term:
-                                    search_term = search_term.lower()
-                                    filtered_student_list = [s for s in student_list if search_term in s.lower()]
-                                    st.caption(f"Trovati {len(filtered_student_list)} studenti su {len(student_list)}")
-                                    student_options = ["Tutti gli Studenti"] + filtered_student_list
-                                else:
-                                    student_options = ["Tutti gli Studenti"] + student_list
-                                
-                                stud_sel = st.selectbox("👤 Seleziona Studente:", student_options, key="filt_stud_tab3_v8")
-                        else:
-                            with filter_studente_col1:
-                                st.info(f"Nessun dato aggregato trovato con i filtri applicati.")
-                                df_to_display_agg = pd.DataFrame()
-                                df_to_display_detail = pd.DataFrame()
-                        
-                        # --- Applicazione Filtri in Sequenza ---
-                        st.divider()
-                        st.subheader("🔍 Risultati Filtrati", divider="gray")
-                        
-                        # I dati già filtrati per codice classe e denominazione
-                        df_to_display_agg = df_filtrato_denominazione_agg.copy()
-                        df_to_display_detail = df_filtrato_denominazione_detail.copy()
-                        
-                        # Contatori per i filtri applicati
-                        num_record_dopo_filtro_codice = len(df_to_display_agg)
-                        num_record_dopo_filtro_denom = len(df_to_display_agg)
-                        
-                        # Applica filtro per studente se selezionato
-                        if stud_sel != "Tutti gli Studenti":
-                            try:
-                                selected_cf = re.search(r'\((.*?)\)', stud_sel).group(1)
-                                df_to_display_agg = df_to_display_agg[df_to_display_agg['CodiceFiscale'] == selected_cf].copy()
-                                df_to_display_detail = df_to_display_detail[df_to_display_detail['CodiceFiscale'] == selected_cf].copy()
-                            except (AttributeError, IndexError):
-                                st.warning("Formato studente non riconosciuto nel filtro.")
-                        
-                        # Contatore record dopo filtro studente
-                        num_record_dopo_filtro_stud = len(df_to_display_agg)
-                        
-                        # Mostriamo statistiche sui filtri applicati
-                        with st.expander("📊 Statistiche Filtri", expanded=False):
-                            stats_col1, stats_col2, stats_col3 = st.columns(3)
-                            with stats_col1:
-                                st.metric("Dopo filtro codice", num_record_dopo_filtro_codice)
-                            with stats_col2:
-                                st.metric("Dopo filtro denom.", num_record_dopo_filtro_denom)
-                            with stats_col3:
-                                st.metric("Record finali", num_record_dopo_filtro_stud)
-
-                        try:
-                            # --- Visualizzazione Tabelle ---
-                            if not df_to_display_agg.empty:
-                                # Aggiungi un separatore e un container per le tabelle
-                                tables_container = st.container()
-                                
-                                with tables_container:
-                                    # Statistiche riassuntive
-                                    if stud_sel == "Tutti gli Studenti":
-                                        st.markdown("### 📊 Statistiche")
-                                        stats_col1, stats_col2, stats_col3, stats_col4 = st.columns(4)
-                                        
-                                        with stats_col1:
-                                            avg_presenze = df_to_display_agg['Presenze'].mean()
-                                            st.metric("Media Presenze", f"{avg_presenze:.1f}")
-                                        
-                                        with stats_col2:
-                                            max_presenze = df_to_display_agg['Presenze'].max()
-                                            st.metric("Presenze Max", f"{max_presenze}")
-                                            
-                                        with stats_col3:
-                                            min_presenze = df_to_display_agg['Presenze'].min()
-                                            st.metric("Presenze Min", f"{min_presenze}")
-                                        
-                                        with stats_col4:
-                                            tot_studenti = len(df_to_display_agg)
-                                            st.metric("Totale Studenti", tot_studenti)
-                                    
-                                    # Titolo della tabella
-                                    filtri_applicati = []
-                                    if denom_concorso_sel != "Tutte":
-                                        filtri_applicati.append(f"Classe di concorso: {denom_concorso_sel}")
-                                    if denominazione_sel != "Tutte":
-                                        filtri_applicati.append(f"Attività: {denominazione_sel}")
-                                    if stud_sel != "Tutti gli Studenti":
-                                        filtri_applicati.append(f"Studente: {stud_sel}")
-                                    
-                                    if filtri_applicati:
-                                        filtri_text = " | ".join(filtri_applicati)
-                                        st.subheader(f"📋 Riepilogo Aggregato - {filtri_text}", divider="blue")
-                                    else:
-                                        st.subheader("📋 Riepilogo Aggregato - Tutti i dati", divider="blue")
-
-                                    cols_disp_agg = ['CodiceFiscale', 'Nome', 'Cognome', 'Email', 
-                                                    'Codice_classe_di_concorso_e_denominazione', 'Dipartimento', 'Matricola',
-                                                    'Percorso (Senza Art.13)', 'CFU Totali', 'Presenze']
-                                    cols_disp_agg_exist = [c for c in cols_disp_agg if c in df_to_display_agg.columns]
-                                    sort_agg_by = ['Percorso (Senza Art.13)', 'Cognome', 'Nome']
-                                    
-                                    # Opzioni di visualizzazione e ordinamento
-                                    visual_options_col1, visual_options_col2 = st.columns(2)
-                                    
-                                    with visual_options_col1:
-                                        sort_options = ["Presenze (decrescente)", "Cognome e Nome", "Denominazione Attività", "Denominazione Classe di concorso"]
-                                        selected_sort = st.radio("Ordinamento tabella:", sort_options, horizontal=True)
-                                    
-                                    with visual_options_col2:
-                                        highlight_opt = st.checkbox("Evidenzia valori critici", value=True, 
-                                                                  help="Evidenzia studenti con poche presenze")
-                                    
-                                    # Applica l'ordinamento selezionato
-                                    if selected_sort == "Presenze (decrescente)" and 'Presenze' in df_to_display_agg.columns:
-                                        df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Presenze'], ascending=False)
-                                    elif selected_sort == "Cognome e Nome" and 'Cognome' in df_to_display_agg.columns:
-                                        df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Cognome', 'Nome'])
-                                    elif selected_sort == "Denominazione Attività" and 'Percorso (Senza Art.13)' in df_to_display_agg.columns:
-                                        df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Percorso (Senza Art.13)', 'Cognome', 'Nome'])
-                                    elif selected_sort == "Denominazione Classe di concorso" and 'Codice_classe_di_concorso_e_denominazione' in df_to_display_agg.columns:
-                                        df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=['Codice_classe_di_concorso_e_denominazione', 'Cognome', 'Nome'])
-                                    elif sort_agg_by:
-                                        valid_sort_agg_by = [c for c in sort_agg_by if c in df_to_display_agg.columns]
-                                        if valid_sort_agg_by:
-                                            df_to_show = df_to_display_agg[cols_disp_agg_exist].sort_values(by=valid_sort_agg_by)
-                                        else:
-                                            df_to_show = df_to_display_agg[cols_disp_agg_exist]
-                                    else:
-                                        df_to_show = df_to_display_agg[cols_disp_agg_exist]                                        # Converti la colonna Matricola in stringa per evitare errori di Arrow
-                                    df_to_show = ensure_string_columns(df_to_show)
-
-                                        # Dataframe con styling condizionale
-                                    if highlight_opt and 'Presenze' in df_to_show.columns:
-                                        # Crea una maschera per le presenze basse (< 4)
-                                        def highlight_low_attendance(val):
-                                            if isinstance(val, (int, float)) and val < 4:
-                                                return 'background-color: #ffcccc'
-                                            return ''
-                                        
-                                        # Applica lo styling solo alla colonna Presenze
-                                        # Sostituito applymap con map (non più deprecato)
-                                        styled_df = df_to_show.style.map(
-                                            highlight_low_attendance, subset=['Presenze']
-                                        )
-                                        st.dataframe(styled_df, use_container_width=True)
-                                    else:
-                                        st.dataframe(df_to_show, use_container_width=True)
-
-
-                            if not df_to_display_detail.empty:
-                                # Sezione per il dettaglio delle presenze
-                                detail_container = st.container()
-                                with detail_container:
-                                    # Titolo della sezione dettaglio con filtri applicati
-                                    filtri_applicati = []
-                                    if denom_concorso_sel != "Tutte":
-                                        filtri_applicati.append(f"Classe di concorso: {denom_concorso_sel}")
-                                    if denominazione_sel != "Tutte":
-                                        filtri_applicati.append(f"Attività: {denominazione_sel}")
-                                    if stud_sel != "Tutti gli Studenti":
-                                        filtri_applicati.append(f"Studente: {stud_sel}")
-                                    
-                                    if filtri_applicati:
-                                        filtri_text = " | ".join(filtri_applicati)
-                                        st.subheader(f"📝 Dettaglio Record Presenze - {filtri_text}", divider="blue")
-                                    else:
-                                        st.subheader("📝 Dettaglio Record Presenze - Tutti i dati", divider="blue")
-                                    
-                                    # Riepilogo record trovati e statistiche dettaglio
-                                    record_count = len(df_to_display_detail)
-                                    if record_count > 0:
-                                        detail_stats_col1, detail_stats_col2 = st.columns(2)
-                                        
-                                        with detail_stats_col1:
-                                            st.info(f"Trovati {record_count} record di presenza", icon="ℹ️")
-                                            
-                                        # Se ci sono date, mostra il periodo
-                                        if 'DataPresenza' in df_to_display_detail.columns:
-                                            with detail_stats_col2:
-                                                try:
-                                                    min_data = pd.to_datetime(df_to_display_detail['DataPresenza']).min()
-                                                    max_data = pd.to_datetime(df_to_display_detail['DataPresenza']).max()
-                                                    st.info(f"Periodo: dal {min_data.strftime('%d/%m/%Y')} al {max_data.strftime('%d/%m/%Y')}", icon="📅")
-                                                except:
-                                                    pass
-    
-                                    # Colonne da visualizzare
-                                    cols_disp_detail = ['CodiceFiscale', 'Cognome', 'Nome', 'Email', 'DataPresenza', 'OraPresenza', 
-                                                       'Codice_classe_di_concorso_e_denominazione', 'Dipartimento',
-                                                       'DenominazioneAttività', 'CFU']
-                                    cols_disp_detail_exist = [c for c in cols_disp_detail if c in df_to_display_detail.columns]
-                                    
-                                    # Ordinamento
-                                    detail_sort_options = st.radio(
-                                        "Ordinamento dettagli:", 
-                                        ["Per Data (più recente prima)", "Per Cognome e Nome", "Per Attività", "Per Denominazione Classe di concorso"],
-                                        horizontal=True
-                                    )
-                                    
-                                    # Imposta l'ordinamento in base alla selezione
-                                    if detail_sort_options == "Per Data (più recente prima)" and 'DataPresenza' in df_to_display_detail.columns:
-                                        sort_by_columns = ['DataPresenza', 'OraPresenza'] 
-                                        ascending = [False, False]  # Prima le date più recenti
-                                    elif detail_sort_options == "Per Attività" and 'DenominazioneAttività' in df_to_display_detail.columns:
-                                        sort_by_columns = ['DenominazioneAttività', 'DataPresenza']
-                                        ascending = [True, True]
-                                    elif detail_sort_options == "Per Denominazione Classe di concorso" and 'Codice_classe_di_concorso_e_denominazione' in df_to_display_detail.columns:
-                                        sort_by_columns = ['Codice_classe_di_concorso_e_denominazione', 'Cognome', 'Nome']
-                                        ascending = [True, True, True]
-                                    else:  # Default: per cognome e nome
-                                        sort_by_columns = ['Cognome', 'Nome']
-                                        if 'DataPresenza' in df_to_display_detail.columns: 
-                                            sort_by_columns.append('DataPresenza')
-                                        ascending = [True] * len(sort_by_columns)
-                                    
-                                    # Filtra colonne valide per ordinamento
-                                    valid_sort_by = [col for col in sort_by_columns if col in df_to_display_detail.columns]
-                                    
-                                    # Visualizza dataframe
-                                    if not valid_sort_by: 
-                                        df_to_show = df_to_display_detail[cols_disp_detail_exist]
-                                    else: 
-                                        df_to_show = df_to_display_detail[cols_disp_detail_exist].sort_values(
-                                            by=valid_sort_by, 
-                                            ascending=ascending[:len(valid_sort_by)]
-                                        )
-                                    
-                                    st.dataframe(df_to_show, use_container_width=True)
-                            else:
-                                st.info("Nessun record dettagliato da mostrare per la selezione corrente.")
-                        except Exception as e: 
-                            st.error(f"Errore durante la visualizzazione: {e}")
+                _render_filtered_attendance(current_df_for_tab3, attendance_df, group_by)
 
             # --- Esportazione Excel Multi-Tab ---
             st.divider()
@@ -468,12 +480,25 @@ def render_tab3(df_main):
                         )
                         
                         st.markdown("**2️⃣ Seleziona Periodo per l'Export (opzionale):**")
+                        # Origine dei dati: sessione corrente o archivio Parquet (legge solo i mesi del periodo)
+                        months_in_archive = archived_months()
+                        export_source = "Sessione corrente"
+                        if months_in_archive:
+                            export_source = st.radio(
+                                "Origine dati:",
+                                options=["Sessione corrente", "Archivio storico"],
+                                horizontal=True,
+                                key="export_source_tab3",
+                                help="L'archivio storico legge solo le partizioni (anno/mese) del periodo selezionato"
+                            )
                         col1_date, col2_date = st.columns(2)
                         
                         with col1_date:
                             # Determina la data minima e massima nel dataset
                             min_date = None
-                            if not current_df_for_tab3.empty and 'DataPresenza' in current_df_for_tab3.columns:
+                            if export_source == "Archivio storico":
+                                min_date = date(months_in_archive[0][0], months_in_archive[0][1], 1)
+                            elif not current_df_for_tab3.empty and 'DataPresenza' in current_df_for_tab3.columns:
                                 valid_dates = current_df_for_tab3['DataPresenza'].dropna()
                                 if not valid_dates.empty:
                                     try:
@@ -489,7 +514,10 @@ def render_tab3(df_main):
                         with col2_date:
                             # Determina la data massima
                             max_date = None
-                            if not current_df_for_tab3.empty and 'DataPresenza' in current_df_for_tab3.columns:
+                            if export_source == "Archivio storico":
+                                last_year, last_month = months_in_archive[-1]
+                                max_date = date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+                            elif not current_df_for_tab3.empty and 'DataPresenza' in current_df_for_tab3.columns:
                                 valid_dates = current_df_for_tab3['DataPresenza'].dropna()
                                 if not valid_dates.empty:
                                     try:
@@ -535,17 +563,35 @@ def render_tab3(df_main):
                                 error_messages = []
                                 used_sheet_names = set()  # Insieme per tenere traccia dei nomi foglio già usati (case-insensitive)
                                 try:
+                                    export_start = st.session_state.get('export_start_date')
+                                    export_end = st.session_state.get('export_end_date')
+                                    if export_source == "Archivio storico":
+                                        # Legge dall'archivio solo i mesi del periodo selezionato
+                                        with st.spinner("Lettura dall'archivio storico..."):
+                                            export_df = load_archive(export_start, export_end)
+                                    else:
+                                        # Filtro per periodo applicato una sola volta, prima della suddivisione in fogli
+                                        export_df = current_df_for_tab3
+                                        if 'DataPresenza' in export_df.columns:
+                                            if export_start is not None:
+                                                export_df = export_df[export_df['DataPresenza'] >= export_start]
+                                            if export_end is not None:
+                                                export_df = export_df[export_df['DataPresenza'] <= export_end]
+                                    if export_df.empty:
+                                        st.warning("Nessun dato nel periodo selezionato.")
+
                                     output = BytesIO()
                                     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
                                         # Determina il campo per il raggruppamento in base alla scelta dell'utente
-                                        if group_by_choice == "Classe di Concorso" and 'Codice_classe_di_concorso_e_denominazione' in current_df_for_tab3.columns:
+                                        if group_by_choice == "Classe di Concorso" and 'Codice_classe_di_concorso_e_denominazione' in export_df.columns:
                                             grouping_col = 'Codice_classe_di_concorso_e_denominazione'
-                                        elif group_by_choice == "Codice Classe di Concorso" and 'Codice_Classe_di_concorso' in current_df_for_tab3.columns:
+                                        elif group_by_choice == "Codice Classe di Concorso" and 'Codice_Classe_di_concorso' in export_df.columns:
                                             grouping_col = 'Codice_Classe_di_concorso'
                                         else:
                                             grouping_col = course_col_export
                                             
-                                        unique_values = current_df_for_tab3[grouping_col].unique()
+                                        unique_values = export_df[grouping_col].unique() if grouping_col in export_df.columns else []
+                                        grouping_values = export_df[grouping_col].astype(str) if grouping_col in export_df.columns else None
                                         unique_values = sorted([str(c) for c in unique_values if pd.notna(c)])
                                         
                                         if not unique_values: 
@@ -588,29 +634,12 @@ def render_tab3(df_main):
                                                 
                                                 prog_text = f"Foglio: {sheet_name_cleaned} ({i+1}/{len(unique_values)})" 
                                                 prog_bar.progress((i + 1) / len(unique_values), text=prog_text)
-                                                df_sheet = current_df_for_tab3[current_df_for_tab3[grouping_col] == value].copy()
+                                                df_sheet = export_df[grouping_values == value]
                                                 
                                                 if df_sheet.empty: 
                                                     st.write(f"Info: Nessun dato per '{sheet_name_cleaned}', foglio saltato.")
                                                     continue
                                                 
-                                                # Filtro per periodo di data se selezionato
-                                                if 'DataPresenza' in df_sheet.columns:
-                                                    date_filtered = False
-                                                    if 'export_start_date' in st.session_state and st.session_state.export_start_date is not None:
-                                                        start_date = st.session_state.export_start_date
-                                                        df_sheet = df_sheet[df_sheet['DataPresenza'] >= start_date]
-                                                        date_filtered = True
-                                                    
-                                                    if 'export_end_date' in st.session_state and st.session_state.export_end_date is not None:
-                                                        end_date = st.session_state.export_end_date
-                                                        df_sheet = df_sheet[df_sheet['DataPresenza'] <= end_date]
-                                                        date_filtered = True
-                                                    
-                                                    if date_filtered and df_sheet.empty:
-                                                        st.write(f"Info: Nessun dato per '{sheet_name_cleaned}' nel periodo selezionato, foglio saltato.")
-                                                        continue
-                                                
                                                 final_ordered_cols_for_sheet = [col for col in selected_cols_export_ordered if col in df_sheet.columns]
                                                 if not final_ordered_cols_for_sheet: 
                                                     st.write(f"Info: Nessuna colonna selezionata trovata per '{sheet_name_cleaned}', foglio saltato.")
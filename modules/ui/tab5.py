@@ -0,0 +1,115 @@
+# Interfaccia utente per la Tab 5 (Query SQL)
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from io import BytesIO
+from modules.dataset_cache import memoize_aggregate
+from modules.sql_engine import SQL_BACKEND, build_sql_engine
+from modules.utils import format_datetime_for_excel
+
+# Righe del risultato mostrate a schermo (gli export leggono l'intero risultato a blocchi)
+MAX_DISPLAY_ROWS = 5000
+
+# Query di esempio proposte all'utente
+EXAMPLE_QUERIES = {
+    "Studenti A-30 con più di 3 CFU in aprile": """SELECT CodiceFiscale, Cognome, Nome, SUM(CFU) AS CFU_Totali
+FROM presenze
+WHERE Percorso LIKE '%A-30%'
+  AND strftime(CAST(DataPresenza AS DATE), '%m') = '04'
+GROUP BY CodiceFiscale, Cognome, Nome
+HAVING SUM(CFU) > 3
+ORDER BY CFU_Totali DESC""",
+    "Lezioni con meno di 5 partecipanti": """SELECT DataPresenza, DenominazioneAttività, COUNT(DISTINCT CodiceFiscale) AS Partecipanti
+FROM presenze
+GROUP BY DataPresenza, DenominazioneAttività
+HAVING COUNT(DISTINCT CodiceFiscale) < 5
+ORDER BY DataPresenza""",
+    "Iscritti senza presenze": """SELECT i.CodiceFiscale, i.Cognome, i.Nome, i.Percorso
+FROM iscritti i
+LEFT JOIN (SELECT DISTINCT CAST(CodiceFiscale AS VARCHAR) AS CodiceFiscale FROM presenze) p
+  ON p.CodiceFiscale = CAST(i.CodiceFiscale AS VARCHAR)
+WHERE p.CodiceFiscale IS NULL
+ORDER BY i.Cognome, i.Nome""",
+}
+
+# Con SQLite le date sono memorizzate come testo ISO: strftime ha la sintassi (formato, valore)
+if SQL_BACKEND == 'SQLite':
+    EXAMPLE_QUERIES["Studenti A-30 con più di 3 CFU in aprile"] = EXAMPLE_QUERIES["Studenti A-30 con più di 3 CFU in aprile"].replace(
+        "strftime(CAST(DataPresenza AS DATE), '%m')", "strftime('%m', DataPresenza)")
+
+def render_tab5(df_main):
+    """Renderizza l'interfaccia della Tab 5: Query SQL"""
+    st.header("Query SQL")
+    st.write(f"Interroga i dati con query SQL di sola lettura (motore: **{SQL_BACKEND}**). "
+             "Tabelle disponibili: `presenze` (dati elaborati), `iscritti` (studenti iscritti), `crediti` (CFU per attività).")
+
+    if df_main is None or df_main.empty:
+        st.info("Nessun dato disponibile per le query.")
+        return
+
+    # Il motore (con le tabelle registrate) viene costruito una volta per versione del dataset
+    engine = memoize_aggregate(build_sql_engine, df_main)
+
+    with st.expander("📚 Tabelle e colonne"):
+        for table_name, columns in engine.tables.items():
+            st.markdown(f"**{table_name}**: " + ", ".join(f"`{c}`" for c in columns))
+
+    example = st.selectbox("Query di esempio:", ["(nessuna)"] + list(EXAMPLE_QUERIES.keys()), key="sql_example_tab5")
+    if example != "(nessuna)" and st.session_state.get("sql_example_loaded_tab5") != example:
+        st.session_state.sql_query_tab5 = EXAMPLE_QUERIES[example]
+        st.session_state.sql_example_loaded_tab5 = example
+
+    query = st.text_area("Query SQL:", height=180, key="sql_query_tab5",
+                         placeholder="SELECT DenominazioneAttività, COUNT(*) AS Presenze FROM presenze GROUP BY 1 ORDER BY 2 DESC")
+
+    if st.button("▶️ Esegui query", key="run_sql_tab5"):
+        st.session_state.sql_last_query_tab5 = query
+
+    last_query = st.session_state.get("sql_last_query_tab5")
+    if not last_query:
+        return
+
+    try:
+        result_df, truncated = engine.query(last_query, max_rows=MAX_DISPLAY_ROWS)
+    except Exception as e:
+        st.error(f"Errore nell'esecuzione della query: {e}")
+        return
+
+    if truncated:
+        st.info(f"Mostrate le prime {MAX_DISPLAY_ROWS} righe: gli export contengono l'intero risultato.")
+    else:
+        st.success(f"{len(result_df)} righe restituite.")
+    st.dataframe(result_df, use_container_width=True)
+
+    def build_csv():
+        # Eseguita solo al click: il risultato completo viene letto e scritto a blocchi
+        output = BytesIO()
+        for i, chunk in enumerate(engine.iter_query(last_query)):
+            output.write(chunk.to_csv(index=False, header=(i == 0)).encode('utf-8'))
+        return output.getvalue()
+
+    def build_excel():
+        full_df, _ = engine.query(last_query)
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            format_datetime_for_excel(full_df).to_excel(writer, sheet_name="Risultato Query", index=False)
+        return output.getvalue()
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M")
+    col_csv, col_excel = st.columns(2)
+    with col_csv:
+        st.download_button(
+            label="📥 Scarica CSV",
+            data=build_csv,
+            file_name=f"Query_SQL_{ts}.csv",
+            mime="text/csv",
+            key="download_sql_csv_tab5"
+        )
+    with col_excel:
+        st.download_button(
+            label="📥 Scarica Excel",
+            data=build_excel,
+            file_name=f"Query_SQL_{ts}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key="download_sql_excel_tab5"
+        )
@@ -0,0 +1,75 @@
+# Visualizzazione paginata di tabelle grandi (solo la finestra visibile viene inviata al browser)
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from io import BytesIO
+from modules.dataset_cache import memoize_aggregate
+from modules.filter_index import sorted_positions
+
+PAGE_SIZE_OPTIONS = [50, 100, 250, 500, 1000]
+ORIGINAL_ORDER_LABEL = "(ordine originale)"
+CSV_CHUNK_ROWS = 50000
+
+def iter_csv_chunks(df, columns, positions, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Genera il CSV delle righe di `df` nelle posizioni indicate, a blocchi di righe:
+    si materializza un blocco alla volta invece dell'intero DataFrame riordinato.
+    """
+    for start in range(0, max(len(positions), 1), chunk_rows):
+        chunk = df.iloc[positions[start:start + chunk_rows]][columns]
+        yield chunk.to_csv(index=False, header=(start == 0))
+
+def render_paginated_table(df, columns, key, file_prefix="Dati"):
+    """
+    Mostra `df` in una tabella paginata e ordinabile. Ad ogni rerun viene
+    serializzata solo la pagina visibile, presa da un ordinamento memoizzato
+    per versione del dataset. Il download completo viene generato a blocchi
+    solo quando l'utente lo richiede.
+
+    Args:
+        df: DataFrame da visualizzare (quello della versione corrente del dataset)
+        columns: Colonne da mostrare (ed esportare)
+        key: Prefisso univoco per le chiavi dei widget
+        file_prefix: Prefisso del nome del file esportato
+    """
+    total_rows = len(df)
+    ctrl_col1, ctrl_col2, ctrl_col3, ctrl_col4 = st.columns([3, 1, 1, 1])
+    with ctrl_col1:
+        sort_col = st.selectbox("Ordina per:", [ORIGINAL_ORDER_LABEL] + list(columns), key=f"{key}_sort_col")
+    with ctrl_col2:
+        descending = st.checkbox("Decrescente", value=False, key=f"{key}_sort_desc")
+    with ctrl_col3:
+        page_size = st.selectbox("Righe per pagina:", PAGE_SIZE_OPTIONS, index=1, key=f"{key}_page_size")
+    num_pages = max(1, -(-total_rows // page_size))
+    # La pagina vive solo in session_state (il widget non ha valore predefinito) e viene
+    # riportata nell'intervallo valido se è cambiato il numero di righe per pagina
+    if f"{key}_page" not in st.session_state:
+        st.session_state[f"{key}_page"] = 1
+    elif st.session_state[f"{key}_page"] > num_pages:
+        st.session_state[f"{key}_page"] = num_pages
+    with ctrl_col4:
+        page = st.number_input("Pagina:", min_value=1, max_value=num_pages, step=1, key=f"{key}_page")
+
+    sort_param = None if sort_col == ORIGINAL_ORDER_LABEL else sort_col
+    positions = memoize_aggregate(sorted_positions, df, sort_col=sort_param, ascending=not descending)
+
+    start = (int(page) - 1) * page_size
+    end = min(start + page_size, total_rows)
+    st.dataframe(df.iloc[positions[start:end]][columns], use_container_width=True)
+    st.caption(f"Righe {start + 1 if total_rows else 0}–{end} di {total_rows} (pagina {int(page)} di {num_pages})")
+
+    def build_full_csv():
+        # Eseguita solo al click sul pulsante di download
+        output = BytesIO()
+        for chunk in iter_csv_chunks(df, columns, positions):
+            output.write(chunk.encode('utf-8'))
+        return output.getvalue()
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M")
+    st.download_button(
+        label=f"📥 Scarica tutti i {total_rows} record (CSV)",
+        data=build_full_csv,
+        file_name=f"{file_prefix}_{ts}.csv",
+        mime="text/csv",
+        key=f"{key}_download_all"
+    )
@@ -5,6 +5,54 @@ import numpy as np
 from datetime import datetime, date, time
 import unicodedata
 
+# Casi particolari comuni nei nomi (variazioni e prefissi); le voci identiche non modificano il nome
+NAME_REPLACEMENTS = {
+    # Variazioni comuni
+    'maria': 'maria',
+    'anna': 'anna',
+    'giovanni': 'giovanni',
+    'giuseppe': 'giuseppe',
+    'angelo': 'angelo',
+    'deangelo': 'de angelo',  # Gestione spazi in nomi composti
+    'de angelo': 'de angelo',
+    'dell': 'dell',           # Prefissi comuni
+    'della': 'della',
+    'dello': 'dello',
+    'dal': 'dal',
+    'dalla': 'dalla',
+    'del': 'del',
+}
+_NAME_REPLACEMENTS = [(re.compile(r'\b' + key + r'\b'), value) for key, value in NAME_REPLACEMENTS.items() if key != value]
+_NON_WORD_PATTERN = re.compile(r'[^\w\s]')
+_ART13_PATTERN = re.compile(r'\s*\(?art\.?\s*13\.?\)?.*$', re.IGNORECASE)
+_CODE_IN_PARENTHESES_PATTERN = re.compile(r'\(([-\w]+)\)')
+_PARENTHESES_PATTERN = re.compile(r'\((.*?)\)')
+_LEADING_CODE_PATTERN = re.compile(r'^\[([-\w]+)\]')
+
+def map_unique(series, func):
+    """
+    Applica una trasformazione di stringhe una sola volta per valore distinto della colonna:
+    la colonna viene fattorizzata, `func` è calcolata sui valori unici e il risultato
+    ricostruito dai codici. Equivale a `series.map(func)` per funzioni pure, ma il costo
+    dipende dal numero di valori distinti invece che dal numero di righe.
+
+    Args:
+        series: Colonna da trasformare
+        func: Funzione applicata a ogni valore (anche ai mancanti, calcolata una volta sola)
+
+    Returns:
+        Series con lo stesso indice di `series`
+    """
+    codes, uniques = pd.factorize(series)
+    values = [func(value) for value in uniques]
+    if (codes < 0).any():
+        # I valori mancanti ricevono il codice dopo l'ultimo valore distinto
+        values.append(func(series[codes < 0].iloc[0]))
+        codes = np.where(codes < 0, len(uniques), codes)
+    # Il costruttore di Series deduce il dtype dai risultati come farebbe series.map
+    mapped = pd.Series(values, dtype=None if values else object)
+    return pd.Series(mapped.to_numpy()[codes], index=series.index, name=series.name).infer_objects()
+
 def normalize_name_advanced(name):
     """
     Normalizza un nome rimuovendo accenti, apostrofi e altri caratteri speciali.
@@ -27,46 +75,27 @@ def normalize_name_advanced(name):
     
     # Gestisci apostrofi e caratteri speciali
     # - Rimuovi apostrofi e caratteri speciali (mantieni solo lettere e spazi)
-    name = re.sub(r'[^\w\s]', '', name)
+    name = _NON_WORD_PATTERN.sub('', name)
     
     # Standardizza spazi multipli
     name = ' '.join(name.split())
     
-    # Gestisci casi particolari comuni
-    replacements = {
-        # Variazioni comuni
-        'maria': 'maria',
-        'anna': 'anna',
-        'giovanni': 'giovanni',
-        'giuseppe': 'giuseppe',
-        'angelo': 'angelo',
-        'deangelo': 'de angelo',  # Gestione spazi in nomi composti
-        'de angelo': 'de angelo',
-        'dell': 'dell',           # Prefissi comuni
-        'della': 'della',
-        'dello': 'dello',
-        'dal': 'dal',
-        'dalla': 'dalla',
-        'del': 'del',
-    }
-    
-    # Applica le sostituzioni per standardizzare i nomi composti comuni
-    for key, value in replacements.items():
-        # Sostituzione solo se è una parola completa
-        name = re.sub(r'\b' + key + r'\b', value, name)
+    # Standardizza i nomi composti comuni (sostituzioni solo su parole complete, precompilate)
+    for pattern, value in _NAME_REPLACEMENTS:
+        name = pattern.sub(value, name)
     
     return name
 
 def normalize_generic(name):
     """Rimuove 'art.13' e spazi dalle stringhe"""
     if not isinstance(name, str): return name
-    normalized = re.sub(r'\s*\(?art\.?\s*13\.?\)?.*$', '', name, flags=re.IGNORECASE)
+    normalized = _ART13_PATTERN.sub('', name)
     return normalized.strip()
     
 def reposition_code_to_front(text):
     """Prende il testo, estrae il codice tra parentesi (es. (A-30)) e lo riposiziona all'inizio della stringa."""
     if not isinstance(text, str): return text
-    match = re.search(r'\(([-\w]+)\)', text)  # Cerca codice alfanumerico con trattini tra parentesi
+    match = _CODE_IN_PARENTHESES_PATTERN.search(text)  # Cerca codice alfanumerico con trattini tra parentesi
     if match:
         code = match.group(1).strip()
         # Rimuovi il codice con le parentesi dal testo originale
@@ -75,18 +104,21 @@ def reposition_code_to_front(text):
         return f"[{code}] {cleaned_text}"
     return text
     
+# Percorso associato alle prime tre cifre del codice percorso
+PERCORSO_BY_CODE_PREFIX = {
+    '600': "PeF60 All. 1",
+    '300': "PeF30 All. 2",
+    '360': "PeF36 All. 5",
+    '200': "PeF30 art. 13",
+}
+
 def transform_by_codice_percorso(codice, default_name):
     """Trasforma il percorso in base al codice"""
     if pd.isna(codice): return default_name
     codice_str = str(codice).strip()
     if len(codice_str) < 3: return default_name
-    prefix = codice_str[:3]
-    if prefix == '600': return "PeF60 All. 1"
-    elif prefix == '300': return "PeF30 All. 2"
-    elif prefix == '360': return "PeF36 All. 5"
-    elif prefix == '200': return "PeF30 art. 13"
-    else: return default_name
-    
+    return PERCORSO_BY_CODE_PREFIX.get(codice_str[:3], default_name)
+
 def clean_sheet_name(name):
     """Pulisce i nomi dei fogli Excel"""
     name = re.sub(r'[\\/?*\[\]:]', '', str(name))
@@ -95,7 +127,7 @@ def clean_sheet_name(name):
 def extract_code_from_parentheses(text):
     """Estrae codici tra parentesi"""
     if not isinstance(text, str): return None
-    match = re.search(r'\((.*?)\)', text)
+    match = _PARENTHESES_PATTERN.search(text)
     if match:
         code = match.group(1).strip()
         if code: return code
@@ -103,11 +135,116 @@ def extract_code_from_parentheses(text):
 
 def extract_sort_key(percorso_str):
     """Estrai chiavi di ordinamento dai percorsi"""
-    code_match = re.search(r'^\[([-\w]+)\]', str(percorso_str))
+    code_match = _LEADING_CODE_PATTERN.search(str(percorso_str))
     if code_match:
         return code_match.group(1)
     return str(percorso_str)
     
+# Formati candidati per i campi data/ora, in ordine di preferenza in caso di ambiguità
+# ("Ora di inizio" dei moduli è nel formato americano 4/29/25 18:10:26)
+DATETIME_FORMATS = [
+    '%m/%d/%y %H:%M:%S', '%m/%d/%y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M',
+]
+# DataPresenza è nel formato italiano (giorno prima del mese)
+DATE_FORMATS = [
+    '%d.%m.%Y', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d.%m.%y',
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%m/%d/%Y',
+]
+# Caricamento multiplo: a parità di riconoscimento il mese precede il giorno, come
+# nell'interpretazione predefinita di pandas usata in origine per quel percorso
+MONTH_FIRST_DATE_FORMATS = [
+    '%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y', '%m.%d.%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%Y', '%d/%m/%y', '%d.%m.%y',
+]
+# Valori distinti campionati per scegliere il formato e numero massimo di formati per colonna
+DATE_SAMPLE_SIZE = 500
+MAX_DATE_FORMATS = 3
+FALLBACK_DATE_FORMAT = 'dedotto per valore'
+
+def parse_datetime_column(series, formats, dayfirst=False, sample_size=DATE_SAMPLE_SIZE):
+    """
+    Converte una colonna di date/orari scegliendo il formato sull'intera colonna invece che
+    per singolo valore: su un campione di valori distinti si sceglie il formato candidato che
+    ne riconosce di più (a parità vale l'ordine di `formats`), lo si applica in un'unica
+    conversione vettoriale e si ripete sui valori rimasti, fino a MAX_DATE_FORMATS formati.
+    Solo gli eventuali valori residui sono interpretati uno per uno.
+    I valori che sono già date/orari (es. celle Excel) vengono convertiti direttamente.
+
+    Args:
+        series: Colonna da convertire
+        formats: Formati candidati (es. DATETIME_FORMATS o DATE_FORMATS)
+        dayfirst: Interpretazione dei valori residui ambigui (giorno prima del mese)
+        sample_size: Numero di valori distinti usati per scegliere il formato
+
+    Returns:
+        Tuple (Series datetime64 con NaT per i valori non convertibili,
+        dizionario {formato: numero di valori convertiti})
+    """
+    report = {}
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, report
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        # Colonne numeriche (es. vuote lette come float, numeri seriali di Excel): conversione diretta come in pandas
+        converted = pd.to_datetime(series, errors='coerce')
+        if converted.notna().any():
+            report['valori data/ora'] = int(converted.notna().sum())
+        return converted, report
+    original_index = series.index
+    series = series.reset_index(drop=True)  # Indice posizionale: le assegnazioni non dipendono dall'indice originale
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    if series.empty:
+        return result.set_axis(original_index), report
+
+    if pd.api.types.is_string_dtype(series) and pd.api.types.infer_dtype(series, skipna=True) in ('string', 'empty'):
+        text = series.dropna().astype(str).str.strip()
+        others = series.iloc[0:0]
+    else:
+        series = series.astype(object)
+        is_text = series.map(lambda v: isinstance(v, str)).astype(bool)
+        text = series[is_text].astype(str).str.strip()
+        others = series[~is_text & series.notna()]
+
+    if len(others) > 0:
+        converted = pd.to_datetime(others, errors='coerce')
+        result.loc[others.index] = converted
+        report['valori data/ora'] = int(converted.notna().sum())
+
+    pending = text[text != '']
+    candidates = list(formats)
+    uniques = pending.unique()
+    if len(uniques) > sample_size:
+        uniques = np.random.default_rng(0).choice(uniques, sample_size, replace=False)
+    sample = pd.Series(uniques, dtype=object)
+
+    used_formats = 0
+    while len(pending) > 0 and len(sample) > 0 and candidates and used_formats < MAX_DATE_FORMATS:
+        scores = {fmt: pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum() for fmt in candidates}
+        best = max(candidates, key=scores.get)
+        if scores[best] == 0:
+            break
+        parsed = pd.to_datetime(pending, format=best, errors='coerce')
+        ok = parsed.notna()
+        result.loc[pending.index[ok.to_numpy()]] = parsed[ok]
+        report[best] = int(ok.sum())
+        pending = pending[~ok]
+        sample = sample[pd.to_datetime(sample, format=best, errors='coerce').isna().to_numpy()]
+        candidates.remove(best)
+        used_formats += 1
+
+    if len(pending) > 0:
+        # Valori fuori dai formati riconosciuti: interpretazione per singolo valore
+        parsed = pd.to_datetime(pending, errors='coerce', dayfirst=dayfirst, format='mixed')
+        result.loc[pending.index] = parsed
+        if parsed.notna().any():
+            report[FALLBACK_DATE_FORMAT] = int(parsed.notna().sum())
+    return result.set_axis(original_index), report
+
+def describe_date_formats(report):
+    """Descrizione leggibile dei formati usati da parse_datetime_column."""
+    return ", ".join(f"{fmt} ({count})" for fmt, count in report.items()) or "nessun valore convertito"
+
 def format_datetime_for_excel(df):
     """
     Formatta correttamente le colonne di data e ora per l'esportazione Excel.